@@ -0,0 +1,76 @@
+"""
+Compares the country lookups of one Countries game page before and after
+the countries table.
+
+    csv: the old get_country_name/size/path(), one pd.read_csv() per lookup
+    table: get_country(), one tuple index per lookup on countries_table
+
+A GET shows two countries (6 lookups), a POST also compares their sizes
+(8 lookups).
+
+Run from the repo root:
+    python benchmarks/bench_countries.py
+"""
+import random
+import time
+
+import pandas as pd
+
+import bench_setup  # noqa: F401
+from flasktest.games.countries_data import CountriesTable
+from flasktest.games.games_settings import DF_EUROPE_PATH
+
+
+REPEAT = 500
+
+
+def timed(func, repeat=REPEAT):
+    """
+    Returns the median time in microseconds of repeat calls to func.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1e6
+
+
+def csv_lookup(column, number):
+    """
+    A lookup as done before the countries table.
+    """
+    return pd.read_csv(DF_EUROPE_PATH)[column].tolist()[number]
+
+
+def csv_page(old, new, post):
+    if post:
+        csv_lookup("Size", old), csv_lookup("Size", new)
+    for number in (old, new):
+        csv_lookup("Name", number), csv_lookup("Size", number), csv_lookup("FilePath", number)
+
+
+def table_page(table, old, new, post):
+    if post:
+        table[old].size, table[new].size
+    for number in (old, new):
+        country = table[number]
+        country.name, country.size, country.path
+
+
+def main():
+    table = CountriesTable(DF_EUROPE_PATH)
+    start = time.perf_counter()
+    table.countries()
+    print(f"table load: {(time.perf_counter() - start) * 1e6:9.1f} us (once per process)")
+
+    old, new = random.sample(range(1, len(table)), 2)
+    for method, post in (("GET", False), ("POST", True)):
+        before = timed(lambda: csv_page(old, new, post), repeat=REPEAT // 10)
+        after = timed(lambda: table_page(table, old, new, post))
+        print(f"{method:4}  csv: {before:9.1f} us  table: {after:6.2f} us"
+              f"  speedup: {before / after:8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
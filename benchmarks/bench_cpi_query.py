@@ -0,0 +1,64 @@
+"""
+Compares CPI searches on the category x month cube with the old boolean masks.
+
+    masks: the original CPI lookup, one boolean mask over the full table per category
+    cube: CPIStore.query(), one slice of the cube for all categories
+    yoy / rebased / basket: derived aggregates on the cube
+
+Run from the repo root:
+    python benchmarks/bench_cpi_query.py
+"""
+import time
+
+import pandas as pd
+
+import bench_setup  # noqa: F401
+from flasktest.apis.cpi_data import CPIStore
+
+
+REPEAT = 200
+CPI_CSV = "flasktest/static/data/api/cpi/df_cpi_netherlands.csv"
+START_YEAR, STOP_YEAR = 2000, 2020
+
+
+def timed(func, repeat=REPEAT):
+    """
+    Returns the median time in microseconds of repeat calls to func.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1e6
+
+
+def masks(df_cpi, categories):
+    """
+    The search as done before the cube.
+    """
+    return [df_cpi[(df_cpi.cat == x)
+                   & (df_cpi.index.year >= START_YEAR)
+                   & (df_cpi.index.year <= STOP_YEAR)].cpi for x in categories]
+
+
+def main():
+    df_cpi = pd.read_csv(CPI_CSV, parse_dates=["period_dt"], index_col="period_dt")
+    store = CPIStore(CPI_CSV)
+    categories = store.categories()
+
+    print(f"{'categories':<12}{'masks':>10}{'cube':>10}{'yoy':>10}{'rebased':>10}{'basket':>10}")
+    for count in (1, 5, 20, len(categories)):
+        picked = categories[:count]
+        results = [
+            timed(lambda: masks(df_cpi, picked), repeat=20),
+            timed(lambda: store.query(picked, START_YEAR, STOP_YEAR)),
+            timed(lambda: store.query(picked, START_YEAR, STOP_YEAR, measure="yoy")),
+            timed(lambda: store.query(picked, START_YEAR, STOP_YEAR, base_year=2015)),
+            timed(lambda: store.basket(picked, START_YEAR, STOP_YEAR)),
+        ]
+        print(f"{count:<12}" + "".join(f"{result:>8.0f}us" for result in results))
+
+
+if __name__ == "__main__":
+    main()
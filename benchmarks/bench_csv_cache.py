@@ -0,0 +1,71 @@
+"""
+Compares pd.read_csv with the binary sidecar reader for the CPI and PUBG data.
+
+Files are copied to a temporary folder so the sidecars in the repo are untouched.
+    cold: read_csv_cached without a sidecar (parse + write sidecar)
+    warm: read_csv_cached with a valid sidecar
+
+Run from the repo root:
+    python benchmarks/bench_csv_cache.py
+"""
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+import bench_setup  # noqa: F401
+from flasktest.apis.csv_cache import read_csv_cached, sidecar_path
+
+
+REPEAT = 20
+CPI_CSV = "flasktest/static/data/api/cpi/df_cpi_netherlands.csv"
+CPI_KWARGS = {"parse_dates": ["period_dt"], "index_col": "period_dt"}
+PUBG_CSVS = sorted(glob.glob("flasktest/static/data/api/pubg/df_*.csv"))
+
+
+def timed(func, repeat=REPEAT, setup=None):
+    """
+    Returns the best time in milliseconds of repeat calls to func.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_file(path, **kwargs):
+    """
+    Benchmarks one CSV file and returns (read_csv, cold, warm) timings.
+    """
+    def drop_sidecar():
+        shutil.rmtree(sidecar_path(path), ignore_errors=True)
+
+    baseline = timed(lambda: pd.read_csv(path, **kwargs))
+    cold = timed(lambda: read_csv_cached(path, **kwargs), setup=drop_sidecar)
+    warm = timed(lambda: read_csv_cached(path, **kwargs))
+    assert read_csv_cached(path, **kwargs).equals(pd.read_csv(path, **kwargs))
+    return baseline, cold, warm
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        cpi_path = shutil.copy(CPI_CSV, folder)
+        pubg_paths = [shutil.copy(path, folder) for path in PUBG_CSVS]
+
+        print(f"{'file':<40}{'read_csv':>12}{'cold':>12}{'warm':>12}")
+        results = [(os.path.basename(cpi_path), *bench_file(cpi_path, **CPI_KWARGS))]
+        results += [(os.path.basename(path), *bench_file(path)) for path in pubg_paths]
+
+        for name, baseline, cold, warm in results:
+            print(f"{name:<40}{baseline:>10.2f}ms{cold:>10.2f}ms{warm:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Compares the lighting and RGB adjustment of the image-adjust tool on a 4K image
+before and after the lookup table engine.
+
+    float: the old convert_img() arithmetic on float64 arrays, np.stack of the
+           channels and the np.array(..., "uint8") cast of the route
+    lut:   image_engine.apply_luts() with the tables of channel_luts(), in place
+
+and mirror + rotation, from the adjusted array to the PIL image that is saved:
+
+    views:     np.flip and np.rot90 per quarter turn, then Image.fromarray
+    transpose: Image.fromarray, then one transpose of the composed transform
+
+and one submit of the tool, from the stored upload to the PNG on the page:
+
+    full:    load_img() & adjust_img(), decodes the 4K PNG and adjusts it
+    preview: convert_preview(), loads the decoded preview of save_preview()
+
+and the adjustment of a download, without encoding the PNG:
+
+    decode: load_img() & adjust_img(), decodes the 4K PNG every time
+    cached: convert_img(), memory-maps the decoded copy of load_decoded()
+
+and a stack of 9 edits, in full resolution and on the preview:
+
+    sequential: adjust_img() per edit on the result of the previous edit
+    fused:      convert_img(), one lookup and one transpose for the stack
+    render:     convert_preview() without cached results, the stack fused
+    delta:      convert_preview() with the result of 8 edits cached
+
+Both start from the same loaded uint8 image, the new path on its own copy
+(the copy is not counted). Peak memory is measured with tracemalloc, which
+sees every NumPy allocation.
+
+Run from the repo root:
+    python benchmarks/bench_image_adjust.py
+"""
+import io
+import itertools
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+import bench_setup  # noqa: F401
+from flasktest.tools import utils as tools_utils
+from flasktest.tools.image_engine import apply_luts, channel_luts, compose_transforms, \
+    mirror_transform, rotation_transform, transform_image
+
+
+REPEAT = 5
+HEIGHT, WIDTH = 2160, 3840
+# (name, lighting, rgb) as image_adjust_tool() passes them
+SETTINGS = (
+    ("lighter 40%", 40, None),
+    ("add red 30%", None, [30, 1, 1]),
+    ("lighter + remove blue", 25, [1, 1, 0.5]),
+)
+# (mirror axis or None, quarter turns)
+GEOMETRY = ((1, 0), (None, 1), (0, 3))
+# Every setting with every geometry
+STACK = [{"lighting": lighting, "rgb": rgb, "mirror": mirror, "rotation": rotation}
+         for (_, lighting, rgb), (mirror, rotation) in itertools.product(SETTINGS, GEOMETRY)]
+
+
+def float_adjust(img_array, lighting, rgb):
+    """
+    The lighting and RGB steps as done before the engine.
+    """
+    if lighting is not None:
+        if lighting > 1:
+            img_array = (((255 - img_array) / 100) * lighting) + img_array
+
+    if rgb is not None:
+        red_array = img_array[:, :, 0]
+        green_array = img_array[:, :, 1]
+        blue_array = img_array[:, :, 2]
+        arrays = []
+        for array, value in zip((red_array, green_array, blue_array), rgb):
+            if value < 1:
+                array = array * value
+            if value > 1:
+                array = (((255 - array) / 100) * value) + array
+            arrays.append(array)
+        img_array = np.stack(arrays, axis=2)
+
+    return np.array(img_array, "uint8")
+
+
+def lut_adjust(img_array, lighting, rgb):
+    return apply_luts(img_array, channel_luts(lighting, rgb))
+
+
+def views_geometry(img_array, mirror, rotation):
+    """
+    Mirror and rotation as done before the composed transform.
+    """
+    if mirror is not None:
+        img_array = np.flip(img_array, axis=mirror)
+    for _ in range(rotation):
+        img_array = np.rot90(img_array)
+    return Image.fromarray(img_array, "RGB")
+
+
+def transpose_geometry(img_array, mirror, rotation):
+    transforms = [rotation_transform(rotation)]
+    if mirror is not None:
+        transforms.insert(0, mirror_transform(mirror))
+    return transform_image(Image.fromarray(img_array, "RGB"), compose_transforms(*transforms))
+
+
+def decode_convert(filetype, filename, **adjustments):
+    """
+    Decodes the upload on every call, as before the decoded copies.
+    """
+    return tools_utils.adjust_img(
+        tools_utils.load_img(filetype, tools_utils.upload_path(filename)), **adjustments)
+
+
+def preview_convert(filetype, filename, **adjustments):
+    """
+    Renders one edit on the preview, without a cached result.
+    """
+    tools_utils.clear_edits(filename)
+    return tools_utils.convert_preview(filetype, filename, [adjustments])
+
+
+def sequential_stack(img_array, edits):
+    """
+    Renders every edit on the result of the previous one.
+    """
+    for edit in edits:
+        img_array = np.array(tools_utils.adjust_img(img_array, **edit))
+    return img_array
+
+
+def measure_delta(filename, edits):
+    """
+    Returns the best time in ms of convert_preview() with the result of all
+    but the last edit cached.
+    """
+    best = float("inf")
+    for _ in range(REPEAT):
+        tools_utils.clear_edits(filename)
+        tools_utils.convert_preview("png", filename, edits[:-1])
+        start = time.perf_counter()
+        tools_utils.convert_preview("png", filename, edits)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def round_trip(convert, adjustments):
+    """
+    One submit of the tool: the adjusted image encoded as the PNG of the page.
+    """
+    buffer = io.BytesIO()
+    convert("png", "bench.png", **adjustments).save(buffer, format="PNG", compress_level=1)
+    return buffer
+
+
+def measure(func, image, copy):
+    """
+    Returns the best time in ms and the peak of extra memory in MB of func.
+    """
+    best, peak = float("inf"), 0
+    for _ in range(REPEAT):
+        source = image.copy() if copy else image
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = func(source)
+        best = min(best, time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del result, source
+    return best * 1000, peak / 2 ** 20
+
+
+def main():
+    # Gradients with noise, like a photo
+    rng = np.random.default_rng(0)
+    rows = np.linspace(0, 255, HEIGHT)[:, None, None]
+    columns = np.linspace(0, 255, WIDTH)[None, :, None]
+    image = ((rows + columns) / 2 + rng.integers(-20, 20, (HEIGHT, WIDTH, 3))) \
+        .clip(0, 255).astype(np.uint8)
+    print(f"image: {WIDTH}x{HEIGHT} RGB, {image.nbytes / 2 ** 20:.1f} MB")
+
+    for name, lighting, rgb in SETTINGS:
+        expected = float_adjust(image, lighting, rgb)
+        assert np.array_equal(lut_adjust(image.copy(), lighting, rgb), expected), name
+
+        float_ms, float_mb = measure(lambda source: float_adjust(source, lighting, rgb),
+                                     image, copy=False)
+        lut_ms, lut_mb = measure(lambda source: lut_adjust(source, lighting, rgb),
+                                 image, copy=True)
+        print(f"{name:22}  float: {float_ms:7.1f} ms {float_mb:7.1f} MB"
+              f"  lut: {lut_ms:6.1f} ms {lut_mb:5.1f} MB"
+              f"  speedup: {float_ms / lut_ms:4.1f}x")
+
+    for mirror, rotation in GEOMETRY:
+        expected = np.asarray(views_geometry(image, mirror, rotation))
+        assert np.array_equal(np.asarray(transpose_geometry(image, mirror, rotation)), expected)
+
+        views_ms, _ = measure(lambda source: views_geometry(source, mirror, rotation),
+                              image, copy=False)
+        transpose_ms, _ = measure(lambda source: transpose_geometry(source, mirror, rotation),
+                                  image, copy=False)
+        name = f"mirror {mirror}, {rotation} turns"
+        print(f"{name:22}  views: {views_ms:7.1f} ms  transpose: {transpose_ms:6.1f} ms"
+              f"  speedup: {views_ms / transpose_ms:4.1f}x")
+
+    with tempfile.TemporaryDirectory() as folder:
+        tools_utils.IMAGE_ADJUST_IMAGE_PATH = folder + os.sep
+        Image.fromarray(image, "RGB").save(os.path.join(folder, "bench.png"))
+        tools_utils.save_preview("png", "bench.png")
+        for name, lighting, rgb in SETTINGS:
+            adjustments = {"lighting": lighting, "rgb": rgb, "mirror": 1, "rotation": 1}
+            full_ms, full_mb = measure(
+                lambda source: round_trip(decode_convert, adjustments), None, copy=False)
+            preview_ms, preview_mb = measure(
+                lambda source: round_trip(preview_convert, adjustments), None,
+                copy=False)
+            print(f"{name:22}  full: {full_ms:8.1f} ms {full_mb:6.1f} MB"
+                  f"  preview: {preview_ms:5.1f} ms {preview_mb:4.1f} MB"
+                  f"  speedup: {full_ms / preview_ms:5.1f}x")
+
+        for name, lighting, rgb in SETTINGS:
+            adjustments = {"lighting": lighting, "rgb": rgb, "mirror": 1, "rotation": 1}
+            expected = np.asarray(decode_convert("png", "bench.png", **adjustments))
+            assert np.array_equal(
+                np.asarray(tools_utils.convert_img("png", "bench.png", [adjustments])), expected)
+            decode_ms, _ = measure(
+                lambda source: decode_convert("png", "bench.png", **adjustments), None,
+                copy=False)
+            cached_ms, _ = measure(
+                lambda source: tools_utils.convert_img("png", "bench.png", [adjustments]), None,
+                copy=False)
+            print(f"{name:22}  decode: {decode_ms:6.1f} ms  cached: {cached_ms:6.1f} ms"
+                  f"  speedup: {decode_ms / cached_ms:4.1f}x")
+
+        decoded = tools_utils.load_decoded("png", "bench.png")
+        expected = sequential_stack(np.array(decoded), STACK)
+        assert np.array_equal(
+            np.asarray(tools_utils.convert_img("png", "bench.png", STACK)), expected)
+        sequential_ms, sequential_mb = measure(lambda source: sequential_stack(source, STACK),
+                                               decoded, copy=True)
+        fused_ms, fused_mb = measure(
+            lambda source: tools_utils.convert_img("png", "bench.png", STACK), None, copy=False)
+        print(f"{len(STACK)} edits, 4K           sequential: {sequential_ms:6.1f} ms"
+              f" {sequential_mb:5.1f} MB  fused: {fused_ms:5.1f} ms {fused_mb:4.1f} MB"
+              f"  speedup: {sequential_ms / fused_ms:4.1f}x")
+
+        preview = tools_utils.load_preview("png", "bench.png")
+        expected = sequential_stack(preview, STACK)
+        tools_utils.clear_edits("bench.png")
+        assert np.array_equal(
+            np.asarray(tools_utils.convert_preview("png", "bench.png", STACK)), expected)
+        tools_utils.clear_edits("bench.png")
+        tools_utils.convert_preview("png", "bench.png", STACK[:-1])
+        assert np.array_equal(
+            np.asarray(tools_utils.convert_preview("png", "bench.png", STACK)), expected)
+        render_ms, _ = measure(lambda source: (tools_utils.clear_edits("bench.png"),
+                                               tools_utils.convert_preview("png", "bench.png",
+                                                                           STACK)),
+                               None, copy=False)
+        delta_ms = measure_delta("bench.png", STACK)
+        print(f"{len(STACK)} edits, preview      render: {render_ms:6.1f} ms"
+              f"  delta: {delta_ms:5.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compares the per-search render latency of the PUBG bar charts.
+
+    plotly per chart: the old way, three figures and three Kaleido round-trips
+    plotly batched: PlotlyChartRenderer, one figure and one Kaleido round-trip
+    matplotlib: MatplotlibChartRenderer, Agg canvas without a subprocess
+
+Every search renders and saves the three charts of one saved player.
+Images are written to a temporary folder.
+
+Run from the repo root:
+    python benchmarks/bench_pubg_charts.py
+"""
+import glob
+import os
+import statistics
+import tempfile
+import time
+
+import pandas as pd
+import plotly.express as px
+
+import bench_setup  # noqa: F401
+from flasktest.apis.apis_settings import PUBG_CHARTS, PUBG_CHART_SCALE, PUBG_BAR_COLOR, \
+    PUBG_BAR_BG_COLOR, PUBG_BAR_FONT
+from flasktest.apis.charts import PlotlyChartRenderer, MatplotlibChartRenderer, chart_title
+
+
+SEARCHES = 10
+PUBG_CSVS = sorted(glob.glob("flasktest/static/data/api/pubg/df_*.csv"))
+
+
+def render_per_chart(dataframe, player_name, game_mode, folder):
+    """
+    Renders the charts like the old create_*_bar functions did.
+    """
+    for name, column, label in PUBG_CHARTS:
+        bar = px.bar(data_frame=dataframe, x="Season", y=column,
+                     title=chart_title(label, player_name, game_mode))
+        bar.update_traces(marker_color=PUBG_BAR_COLOR, marker_line_width=None, opacity=None)
+        bar.update_layout(xaxis_title="Season", yaxis_title=f"{label} per game",
+                          paper_bgcolor=PUBG_BAR_BG_COLOR, plot_bgcolor=PUBG_BAR_BG_COLOR,
+                          font=PUBG_BAR_FONT)
+        bar.write_image(os.path.join(folder, f"{name}.png"), scale=PUBG_CHART_SCALE)
+
+
+def renderer_search(renderer):
+    """
+    Returns a search function rendering with renderer.
+    """
+    def search(dataframe, player_name, game_mode, folder):
+        for name, png in renderer.render(dataframe, player_name, game_mode).items():
+            with open(os.path.join(folder, f"{name}.png"), "wb") as file:
+                file.write(png)
+    return search
+
+
+def bench(search, searches, folder):
+    """
+    Returns the first search and the median & max of the following searches in ms.
+    """
+    timings = []
+    for number in range(searches + 1):
+        path = PUBG_CSVS[number % len(PUBG_CSVS)]
+        player_name, game_mode = os.path.basename(path)[3:-4].split("_", 1)
+        dataframe = pd.read_csv(path)
+
+        start = time.perf_counter()
+        search(dataframe, player_name, game_mode, folder)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return timings[0], statistics.median(timings[1:]), max(timings[1:])
+
+
+def main():
+    backends = [
+        ("plotly per chart", render_per_chart),
+        ("plotly batched", renderer_search(PlotlyChartRenderer())),
+        ("matplotlib", renderer_search(MatplotlibChartRenderer())),
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"{'backend':<20}{'first':>12}{'median':>12}{'max':>12}")
+        for name, search in backends:
+            first, median, worst = bench(search, SEARCHES, folder)
+            print(f"{name:<20}{first:>10.0f}ms{median:>10.0f}ms{worst:>10.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""
+Load test of the blueprint routes.
+
+Seeds users with users.utils.add_new_user() in a temporary database, logs
+every worker in and drives each route with concurrent clients:
+
+    /login                   POST with the seeded credentials
+    /home                    GET
+    /games/countries         GET & POST a guess
+    /games/play-wordle       GET & POST a guess
+    /games/play-numbers      GET & POST stop
+    /api/cpi                 GET & POST a search
+    /tools/image-adjust-tool GET & POST an edit of an uploaded PNG
+    /tools/image-adjust-download GET the edits in full resolution
+    /tools/image-adjust-edits POST undo of the last edit
+    /api/pubg                GET & POST a saved player, a stub server answers API calls
+
+Every folder the app writes to is pointed to a temporary folder first.
+For every route p50/p95/p99 latency, requests per second and the peak RSS
+while the route ran are printed and appended to benchmarks/results/bench_routes.jsonl
+together with the current commit, so runs of different commits can be compared.
+
+Run from the repo root:
+    python benchmarks/bench_routes.py [--requests 200] [--concurrency 8] [--server]
+
+With --server the requests go over HTTP to a local threaded WSGI server
+instead of through Flask's test client.
+"""
+import argparse
+import contextlib
+import datetime
+import glob
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# The config reads the environment on import, so it is set up first
+TEMP = tempfile.mkdtemp(prefix="bench_routes_")
+STUB_PORT = 8766
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEMP, 'bench.db')}"
+os.environ["PUBG_API_URL"] = f"http://127.0.0.1:{STUB_PORT}/"
+
+import bench_setup  # noqa: E402, F401
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from flasktest import create_app, bcrypt  # noqa: E402
+from flasktest.apis.apis_settings import CPI_FOOD, CPI_SNACKS  # noqa: E402
+from flasktest.games.wordle_engine import wordle_engine  # noqa: E402
+from flasktest.users.utils import add_new_user  # noqa: E402
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+app = create_app("benchmark")
+
+
+RESULTS_PATH = os.path.join("benchmarks", "results", "bench_routes.jsonl")
+PASSWORD = "bench1234"
+WARM_UP = 3  # requests per worker before measuring
+PUBG_CSV_FOLDER = os.path.join("flasktest", "static", "data", "api", "pubg")
+CPI_CSV = os.path.join("flasktest", "static", "data", "api", "cpi", "df_cpi_netherlands.csv")
+
+
+# ------------------------------------------------------------------ #
+# ------------------------- SET UP ------------------------------ #
+class PUBGStub(BaseHTTPRequestHandler):
+    """
+    Answers the PUBG API calls of lookups with fixed stats.
+    """
+    seasons = [f"division.bro.official.pc-2018-{number:02d}" for number in range(1, 13)]
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/players?"):
+            body = {"data": [{"id": "account.bench"}]}
+        elif self.path == "/seasons":
+            body = {"data": [{"id": season} for season in self.seasons]}
+        elif "/seasons/" in self.path:
+            stats = dict.fromkeys(["damageDealt", "kills", "assists", "headshotKills",
+                                   "roundMostKills", "rideDistance", "top10s", "wins"], 3)
+            stats["roundsPlayed"] = 10
+            body = {"data": {"attributes": {"gameModeStats": {"solo-fpp": stats}}}}
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def isolate():
+    """
+    Points every folder the app writes to at TEMP and copies the data it reads.
+    """
+    apis_utils = sys.modules["flasktest.apis.utils"]
+    apis_routes = sys.modules["flasktest.apis.routes"]
+    charts = sys.modules["flasktest.apis.charts"]
+    cpi_charts = sys.modules["flasktest.apis.cpi_charts"]
+    cpi_data = sys.modules["flasktest.apis.cpi_data"]
+    tools_utils = sys.modules["flasktest.tools.utils"]
+    tools_routes = sys.modules["flasktest.tools.routes"]
+
+    pubg_folder = os.path.join(TEMP, "pubg") + os.sep
+    os.makedirs(pubg_folder)
+    for path in glob.glob(os.path.join(PUBG_CSV_FOLDER, "df_*.csv")):
+        shutil.copy(path, pubg_folder)
+    for module in (apis_utils, apis_routes):
+        for name in ("PUBG_DATA_PATH", "PUBG_DATAFRAME_PATH", "PUBG_IMAGE_PATH"):
+            if hasattr(module, name):
+                setattr(module, name, pubg_folder)
+    for cache in (apis_utils.pubg_seasons_cache, apis_utils.pubg_player_id_cache):
+        if hasattr(cache, "path"):
+            cache.path = os.path.join(TEMP, "api_cache.db")
+    charts.chart_store.folder = os.path.join(TEMP, "pubg_charts")
+    cpi_charts.cpi_chart_store.folder = os.path.join(TEMP, "cpi_graphs")
+    cpi_data.cpi_store.path = CPI_CSV
+
+    image_folder = os.path.join(TEMP, "image_adjust") + os.sep
+    os.makedirs(image_folder)
+    for module in (tools_utils, tools_routes):
+        module.IMAGE_ADJUST_IMAGE_PATH = image_folder
+
+
+def seed_users(count):
+    """
+    Creates count users like the register page does.
+
+    :return: Emails of the users (list str).
+    """
+    # One hash for all users, hashing is measured by /login
+    hashed_password = bcrypt.generate_password_hash(PASSWORD)
+    emails = [f"bench{number}@example.com" for number in range(count)]
+    with app.app_context():
+        for number, email in enumerate(emails):
+            add_new_user(email=email, username=f"bench{number}", hashed_password=hashed_password)
+    return emails
+
+
+def sample_png():
+    """
+    Returns a 600x400 PNG with some structure (bytes).
+    """
+    y, x = np.mgrid[0:400, 0:600]
+    pixels = np.stack([x * 255 // 600, y * 255 // 400, (x + y) % 256], axis=2)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels.astype("uint8"), "RGB").save(buffer, format="png")
+    return buffer.getvalue()
+
+
+# ------------------------------------------------------------------ #
+# ------------------------- CLIENTS ------------------------------ #
+class TestClient:
+    """
+    Sends requests through Flask's test client.
+    """
+    def __init__(self):
+        self.client = app.test_client()
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data=data).status_code
+
+
+class HTTPClient:
+    """
+    Sends requests to the local WSGI server.
+    """
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def get(self, path):
+        return self.session.get(f"{self.base_url}{path}", allow_redirects=False).status_code
+
+    def post(self, path, data):
+        files = {key: value for key, value in data.items() if isinstance(value, tuple)}
+        fields = {key: value for key, value in data.items() if not isinstance(value, tuple)}
+        if files:
+            files = {key: (name, file.getvalue()) for key, (file, name) in files.items()}
+        return self.session.post(f"{self.base_url}{path}", data=fields, files=files or None,
+                                 allow_redirects=False).status_code
+
+
+# ------------------------------------------------------------------ #
+# ------------------------- ROUTES ------------------------------ #
+def cpi_search(rng):
+    categories = rng.sample([name for name, _ in CPI_FOOD + CPI_SNACKS], 3)
+    start_year = rng.randint(1996, 2012)
+    return {"food": [x for x in categories if x in dict(CPI_FOOD)],
+            "snacks": [x for x in categories if x in dict(CPI_SNACKS)],
+            "start_year": start_year, "stop_year": start_year + rng.randint(2, 10)}
+
+
+def image_adjustment(rng):
+    return {"lighting": rng.choice(["Darker", "Lighter"]), "lighting_value": rng.randint(1, 99),
+            "mirror": rng.choice(["None", "Horizontally", "Vertically"]),
+            "rotate": rng.randint(0, 3), "rgb": rng.choice(["None", "Add red", "Remove blue"]),
+            "rgb_value": rng.randint(1, 99)}
+
+
+def make_routes(emails, saved_players):
+    """
+    Returns (name, request(client, worker, rng)) per measured route.
+    """
+    return [
+        ("POST /login", lambda client, worker, rng: client.post(
+            "/login", {"email": emails[worker], "password": PASSWORD})),
+        ("GET /home", lambda client, worker, rng: client.get("/home")),
+        ("GET /games/countries", lambda client, worker, rng: client.get("/games/countries")),
+        ("POST /games/countries", lambda client, worker, rng: client.post(
+            "/games/countries", {"select": rng.choice(["Larger", "Smaller"])})),
+        ("GET /games/play-wordle", lambda client, worker, rng: client.get("/games/play-wordle")),
+        ("POST /games/play-wordle", lambda client, worker, rng: client.post(
+            "/games/play-wordle", {"guess": rng.choice(wordle_engine.words)})),
+        ("GET /games/play-numbers", lambda client, worker, rng: client.get(
+            "/games/play-numbers")),
+        ("POST /games/play-numbers", lambda client, worker, rng: client.post(
+            "/games/play-numbers", {"submit": "Stop"})),
+        ("GET /api/cpi", lambda client, worker, rng: client.get("/api/cpi")),
+        ("POST /api/cpi", lambda client, worker, rng: client.post("/api/cpi", cpi_search(rng))),
+        ("GET /tools/image-adjust-tool", lambda client, worker, rng: client.get(
+            "/tools/image-adjust-tool")),
+        ("POST /tools/image-adjust-tool", lambda client, worker, rng: client.post(
+            "/tools/image-adjust-tool", image_adjustment(rng))),
+        ("GET /tools/image-adjust-download", lambda client, worker, rng: client.get(
+            "/tools/image-adjust-download")),
+        ("POST /tools/image-adjust-edits", lambda client, worker, rng: client.post(
+            "/tools/image-adjust-edits", {"undo": "Undo"})),
+        ("GET /api/pubg", lambda client, worker, rng: client.get("/api/pubg")),
+        ("POST /api/pubg", lambda client, worker, rng: client.post(
+            "/api/pubg", rng.choice(saved_players))),
+    ]
+
+
+def saved_pubg_players():
+    """
+    Returns form data of the players with a saved DataFrame (list dict).
+    """
+    players = []
+    for path in glob.glob(os.path.join(PUBG_CSV_FOLDER, "df_*.csv")):
+        name, mode = os.path.basename(path)[3:-4].rsplit("_", 1)
+        if mode == "fpp":
+            name, mode = name.rsplit("_", 1)
+            players.append({"name": name, "game_mode": mode, "perspective": "-fpp"})
+        else:
+            players.append({"name": name, "game_mode": mode, "perspective": ""})
+    return players
+
+
+# ------------------------------------------------------------------ #
+# ------------------------- MEASURING ------------------------------ #
+class RSSSampler:
+    """
+    Samples the resident set size of this process in the background.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current():
+        """
+        Returns the resident set size in bytes, or 0 if it cannot be read (int).
+        """
+        if psutil is not None:
+            return psutil.Process().memory_info().rss
+        try:
+            with open("/proc/self/statm") as file:
+                return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return 0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def percentile(sorted_values, fraction):
+    """
+    Returns the nearest-rank percentile of sorted values.
+    """
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_route(request, clients, total, seed):
+    """
+    Sends total requests spread over the clients, one thread per client.
+
+    :return: Latencies in seconds (list float), errors (int), wall time (float) & peak RSS (int).
+    """
+    per_worker = max(1, total // len(clients))
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        for _ in range(WARM_UP):
+            request(clients[number], number, rng)
+        latencies, errors = [], 0
+        for _ in range(per_worker):
+            start = time.perf_counter()
+            status = request(clients[number], number, rng)
+            latencies.append(time.perf_counter() - start)
+            errors += status >= 400
+        return latencies, errors
+
+    with RSSSampler() as rss, ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(worker, range(len(clients))))
+        wall = time.perf_counter() - start
+
+    latencies = sorted(x for result, _ in results for x in result)
+    return latencies, sum(errors for _, errors in results), wall, rss.peak
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results(args):
+    """
+    Returns the route results of the last stored run with the same settings (dict).
+    """
+    try:
+        with open(RESULTS_PATH) as file:
+            runs = [json.loads(line) for line in file if line.strip()]
+    except OSError:
+        return {}
+
+    settings = {"requests": args.requests, "concurrency": args.concurrency,
+                "server": args.server}
+    for run in reversed(runs):
+        if all(run.get(key) == value for key, value in settings.items()):
+            return run["routes"]
+    return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8, help="simultaneous clients")
+    parser.add_argument("--server", action="store_true", help="send requests over HTTP")
+    parser.add_argument("--routes", default="", help="only run routes containing this text")
+    args = parser.parse_args()
+
+    stub = ThreadingHTTPServer(("127.0.0.1", STUB_PORT), PUBGStub)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    isolate()
+    emails = seed_users(args.concurrency)
+
+    server = None
+    if args.server:
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args):
+                pass
+
+        server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        clients = [HTTPClient(f"http://127.0.0.1:{server.server_port}")
+                   for _ in range(args.concurrency)]
+    else:
+        clients = [TestClient() for _ in range(args.concurrency)]
+
+    # Log every client in and give it an image to adjust
+    png = sample_png()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for client, email in zip(clients, emails):
+            client.post("/login", {"email": email, "password": PASSWORD})
+            client.post("/tools/image-adjust", {"file": (io.BytesIO(png), "bench.png")})
+
+    previous = previous_results(args)
+    results = {}
+    print(f"{args.requests} requests per route, {args.concurrency} clients,"
+          f" {'HTTP server' if args.server else 'test client'}")
+    print(f"{'route':32} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}"
+          f" {'peak MB':>8} {'errors':>6} {'p50 vs last':>12}")
+    routes = make_routes(emails, saved_pubg_players())
+    for seed, (name, request) in enumerate(routes):
+        if args.routes not in name:
+            continue
+        # Drop the debug prints of the routes
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies, errors, wall, peak = run_route(request, clients, args.requests, seed)
+        result = {
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "rps": len(latencies) / wall,
+            "peak_rss_mb": peak / 2 ** 20,
+            "requests": len(latencies),
+            "errors": errors,
+        }
+        results[name] = result
+
+        change = ""
+        if name in previous:
+            change = f"{(result['p50_ms'] / previous[name]['p50_ms'] - 1) * 100:+11.0f}%"
+        print(f"{name:32} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f}"
+              f" {result['p99_ms']:8.1f} {result['rps']:8.1f} {result['peak_rss_mb']:8.0f}"
+              f" {errors:6} {change:>12}")
+
+    if server is not None:
+        server.shutdown()
+    stub.shutdown()
+
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "a") as file:
+        file.write(json.dumps({
+            "commit": git_commit(),
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "server": args.server,
+            "routes": results,
+        }) + "\n")
+    print(f"Results appended to {RESULTS_PATH}")
+
+    shutil.rmtree(TEMP, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
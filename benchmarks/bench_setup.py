@@ -0,0 +1,19 @@
+"""
+Imported first by the scripts in benchmarks/, so they run as
+`python benchmarks/<script>.py` without installing the app: puts the repo
+root on sys.path and gives the environment variables that flasktest reads
+on import a dummy value, values that are already set are kept.
+"""
+import os
+import sys
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENVIRONMENT = {"FLASK_KEY": "bench", "PUBG_API_KEY": "bench", "GMAIL_EMAIL": "bench@example.com",
+               "GMAIL_PASS": "bench", "GMAIL_SMTP": "localhost",
+               "HOTMAIL_EMAIL": "bench2@example.com"}
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+for key, value in ENVIRONMENT.items():
+    os.environ.setdefault(key, value)
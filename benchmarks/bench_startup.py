@@ -0,0 +1,126 @@
+"""
+Measures the cold start of the app in fresh processes.
+
+    import:       import flasktest
+    create_app:   create_app() with lazy blueprints, nothing preloaded
+    preload:      create_app() with PRELOAD_DATA, as a pre-forking server runs it
+    first request: GET of a page right after create_app(), this pays for the
+                   lazy imports and data loads of its blueprint
+
+For every step the median time over the runs, the RSS after it and which
+heavy libraries were imported are printed. Every run uses a new temporary
+database.
+
+Run from the repo root:
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_setup import ENVIRONMENT
+
+HEAVY = ("pandas", "matplotlib", "plotly", "PIL", "cairosvg")
+PAGES = ("/games/countries", "/games/play-wordle", "/api/cpi", "/api/pubg")
+CPI_CSV = os.path.join("flasktest", "static", "data", "api", "cpi", "df_cpi_netherlands.csv")
+
+
+def rss_mb():
+    """
+    Returns the resident memory of this process in MB (float).
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def sample(step):
+    """
+    Describes the process after a step (dict).
+    """
+    return {"step": step, "rss": rss_mb(),
+            "heavy": [name for name in HEAVY if name in sys.modules]}
+
+
+def child(mode, page):
+    """
+    Runs one start in this process and prints its samples as json.
+    """
+    samples = []
+    start = time.perf_counter()
+    import flasktest
+    samples.append({**sample("import"), "seconds": time.perf_counter() - start})
+
+    config = type("Config", (flasktest.get_config("benchmark"),),
+                  {"PRELOAD_DATA": mode == "preload"})
+    start = time.perf_counter()
+    # The settings hold Windows paths, create_app() imports this module anyway
+    from flasktest.apis.cpi_data import cpi_store
+    cpi_store.path = CPI_CSV
+    app = flasktest.create_app(config)
+    samples.append({**sample(mode), "seconds": time.perf_counter() - start})
+
+    if page:
+        from flasktest.users.utils import add_new_user
+        with app.app_context():
+            add_new_user("bench@bench.com", "bench", flasktest.bcrypt.generate_password_hash("bench1234"))
+        client = app.test_client()
+        client.post("/login", data={"email": "bench@bench.com", "password": "bench1234"})
+        start = time.perf_counter()
+        status = client.get(page).status_code
+        samples.append({**sample(f"first {page} ({status})"),
+                        "seconds": time.perf_counter() - start})
+    print(json.dumps(samples))
+
+
+def run(mode, page, runs):
+    """
+    Starts runs child processes and returns their samples per step (dict).
+    """
+    steps = {}
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as folder:
+            env = {**os.environ, **ENVIRONMENT,
+                   "DATABASE_URL": f"sqlite:///{os.path.join(folder, 'startup.db')}"}
+            output = subprocess.run([sys.executable, __file__, "--child", mode, page or ""],
+                                    env=env, capture_output=True, text=True, check=True).stdout
+        # Routes may print, the samples are the last line
+        for entry in json.loads(output.strip().splitlines()[-1]):
+            steps.setdefault(entry["step"], []).append(entry)
+    return steps
+
+
+def report(steps):
+    for step, samples in steps.items():
+        seconds = sorted(s["seconds"] for s in samples)[len(samples) // 2]
+        rss = sorted(s["rss"] for s in samples)[len(samples) // 2]
+        heavy = ", ".join(samples[-1]["heavy"]) or "-"
+        print(f"{step:32} {seconds * 1000:8.1f} ms  {rss:7.1f} MB  heavy: {heavy}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="processes started per mode")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    for mode in ("create_app", "preload"):
+        report(run(mode, None, args.runs))
+    for page in PAGES:
+        report({step: samples for step, samples in run("create_app", page, args.runs).items()
+                if step.startswith("first")})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Stress test of the thread-safe CPI graph rendering.
+
+Renders the graphs of many simulated users at the same time and checks that
+every PNG is identical to the same graph rendered alone, so no figure picked
+up lines, labels or settings of another.
+    sequential: draw_cpi_graph one graph after the other
+    threads: every user renders from their own thread, without a pool
+    thread pool / process pool: render_cpi_graph on a bounded pool
+
+Run from the repo root:
+    python benchmarks/stress_cpi_render.py
+"""
+import io
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import bench_setup  # noqa: F401
+from flasktest.apis.cpi_data import CPIStore
+from flasktest.apis.cpi_charts import draw_cpi_graph, render_cpi_graph, make_render_pool
+
+
+USERS = 48
+WORKERS = 4
+CPI_CSV = "flasktest/static/data/api/cpi/df_cpi_netherlands.csv"
+
+
+def make_searches(store, users, seed=1):
+    """
+    Returns one random search per user: list of (label, Series) tuples.
+    """
+    rng = random.Random(seed)
+    categories = sorted(store.categories())
+    searches = []
+    for _ in range(users):
+        start = rng.randint(1996, 2015)
+        stop = rng.randint(start + 1, 2023)
+        picked = rng.sample(categories, rng.randint(1, 5))
+        searches.append([(x, store.get_series(x, start, stop)) for x in picked])
+    return searches
+
+
+def check(name, pngs, expected, seconds):
+    """
+    Compares rendered PNGs with the sequential renders and prints the result.
+    """
+    wrong = 0
+    for png, reference in zip(pngs, expected):
+        Image.open(io.BytesIO(png)).verify()
+        wrong += png != reference
+    print(f"{name:<14}{seconds * 1000:>10.0f}ms{len(pngs):>8} graphs{wrong:>6} wrong")
+    return wrong
+
+
+def main():
+    store = CPIStore(CPI_CSV)
+    searches = make_searches(store, USERS)
+
+    start = time.perf_counter()
+    expected = [draw_cpi_graph(series_list) for series_list in searches]
+    check("sequential", expected, expected, time.perf_counter() - start)
+
+    wrong = 0
+    with ThreadPoolExecutor(max_workers=USERS) as users:
+        start = time.perf_counter()
+        pngs = list(users.map(draw_cpi_graph, searches))
+        wrong += check("threads", pngs, expected, time.perf_counter() - start)
+
+        for kind in ("thread", "process"):
+            pool = make_render_pool(kind, WORKERS)
+            # Start the workers before timing
+            render_cpi_graph(searches[0], pool=pool)
+            start = time.perf_counter()
+            pngs = list(users.map(lambda series_list: render_cpi_graph(series_list, pool=pool),
+                                  searches))
+            wrong += check(f"{kind} pool", pngs, expected, time.perf_counter() - start)
+            pool.shutdown()
+
+    if wrong:
+        raise SystemExit(f"{wrong} graphs differ from their sequential render")
+
+
+if __name__ == "__main__":
+    main()
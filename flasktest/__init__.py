@@ -1,8 +1,13 @@
 """
 Initializes the FlaskApp.
 
-Sets general app settings as well as private variables.
+Creates the helpers and private variables, create_app() builds the app.
+Importing this package does not import the blueprints or their heavy
+dependencies (pandas, plotly, matplotlib, PIL, cairosvg), create_app() only
+imports the blueprints of its config and those import their heavy
+dependencies on first use.
 """
+import importlib
 import os
 
 from flask import Flask
@@ -13,65 +18,113 @@ from flask_bootstrap import Bootstrap
 from flask_bcrypt import Bcrypt
 from flask_wtf import CSRFProtect
 
+from flasktest import instrumentation
+from flasktest.config import BASE_PATH, get_config  # noqa: F401
+
 # TODO: Create navbar
 # TODO: Clean up Home page - Fix animations with JavaScript
 # TODO: Create error pages
 # TODO:
-# Get base path
-BASE_PATH = os.getcwd()
-# Flask secret key
-FLASK_KEY = os.environ["FLASK_KEY"]
 # API keys
 PUBG_API_KEY = os.environ["PUBG_API_KEY"]
 # FlaskMail keys ( email only used for dummy accounts at @users.route("/fresh") )
 GMAIL_EMAIL = os.environ["GMAIL_EMAIL"]
-GMAIL_PASS = os.environ["GMAIL_PASS"]
-GMAIL_SMTP = os.environ["GMAIL_SMTP"]
 # Hotmail email ( email only used for dummy accounts at @users.route("/fresh") )
 HOTMAIL_EMAIL = os.environ["HOTMAIL_EMAIL"]
 
-# App settings
-app = Flask(__name__)
-app.config["SECRET_KEY"] = FLASK_KEY
-app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_PATH}\\flasktest\\databases\\website_database.db"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["TEMPLATES_AUTO_RELOAD"] = True
-# FlaskMail settings
-app.config["MAIL_SERVER"] = GMAIL_SMTP
-app.config["MAIL_PORT"] = 587
-app.config["MAIL_USE_TLS"] = True
-app.config["MAIL_'DEBUG'"] = app.debug
-app.config["MAIL_USERNAME"] = GMAIL_EMAIL
-app.config["MAIL_PASSWORD"] = GMAIL_PASS
-
-# Load helpers
-mail = Mail(app)
-csrf = CSRFProtect(app)
-csrf.init_app(app)
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-Bootstrap(app)
+# Helpers, bound to the app in create_app()
+mail = Mail()
+csrf = CSRFProtect()
+db = SQLAlchemy()
+bcrypt = Bcrypt()
+bootstrap = Bootstrap()
 
 # Set login manager
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = "users.login"
 
-# Prevent circular import
-from flasktest.users.routes import users  # noqa: E402
-from flasktest.main.routes import main  # noqa: E402
-from flasktest.apis.routes import apis  # noqa: E402
-from flasktest.games.routes import games  # noqa: E402
-from flasktest.tools.routes import tools  # noqa: E402
-
-# Register Blueprints
-app.register_blueprint(users)
-app.register_blueprint(main)
-app.register_blueprint(apis)
-app.register_blueprint(games)
-app.register_blueprint(tools)
-
-# If no database exists yet, create it
-with app.app_context():
-    if not os.path.exists(f"{BASE_PATH}\\flasktest\\databases\\website_database.db"):
+
+def create_sqlite_folder(database_uri):
+    """
+    Creates the folder of a SQLite database file, SQLite does not create it.
+
+    :param database_uri: SQLAlchemy database URI (str).
+    """
+    if database_uri.startswith("sqlite:///"):
+        folder = os.path.dirname(database_uri[len("sqlite:///"):])
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+
+def preload_data(app):
+    """
+    Loads the read-only data of the registered blueprints and imports their
+    heavy dependencies. Run before a pre-forking server forks, so all
+    workers share one copy instead of each loading their own.
+
+    :param app: The Flask app.
+    """
+    if "games" in app.blueprints:
+        from flasktest.games.countries_data import countries_table
+        from flasktest.games.wordle_engine import wordle_engine
+        countries_table.countries()
+        wordle_engine.load()
+        if wordle_engine.use_matrix:
+            wordle_engine.feedback_matrix()
+
+    if "apis" in app.blueprints:
+        from flasktest.apis.cpi_data import cpi_store
+        from flasktest.apis.charts import import_renderer_dependencies
+        cpi_store.refresh()
+        import_renderer_dependencies()
+
+    if "tools" in app.blueprints:
+        from flasktest.tools.utils import import_image_dependencies
+        import_image_dependencies()
+
+
+def create_app(config=None):
+    """
+    Creates the FlaskApp.
+
+    :param config: Name of a config in flasktest.config or a config object,
+     defaults to FLASK_CONFIG (str or object).
+
+    :return: The app (Flask).
+    """
+    app = Flask(__name__)
+    app.config.from_object(config if config is not None and not isinstance(config, str)
+                           else get_config(config))
+    if not app.config["SECRET_KEY"]:
+        raise RuntimeError("FLASK_KEY is not set")
+
+    # Opt-in Server-Timing headers, /metrics & profiling, registered first so
+    # it also times the hooks of the helpers below
+    if app.config["INSTRUMENTATION"]:
+        instrumentation.init_app(app)
+
+    # Load helpers
+    mail.init_app(app)
+    csrf.init_app(app)
+    db.init_app(app)
+    bcrypt.init_app(app)
+    bootstrap.init_app(app)
+    login_manager.init_app(app)
+
+    # Register Blueprints, imported here to prevent circular imports
+    for name in app.config["BLUEPRINTS"]:
+        routes = importlib.import_module(f"flasktest.{name}.routes")
+        app.register_blueprint(getattr(routes, name))
+
+    # Create the database and any tables or columns added since it was created
+    from flasktest.migrations import upgrade_database
+    create_sqlite_folder(app.config["SQLALCHEMY_DATABASE_URI"])
+    with app.app_context():
         db.create_all()
+        upgrade_database()
+        # Workers of a pre-forking server must not share the connections
+        db.engine.dispose()
+
+    if app.config["PRELOAD_DATA"]:
+        preload_data(app)
+    return app
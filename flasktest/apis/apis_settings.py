@@ -1,10 +1,14 @@
+import os
+
 from flasktest import BASE_PATH, PUBG_API_KEY
 
 
 # ------------------------------------------------------------- #
 # ------------------------- PUBG ------------------------------ #
-PUBG_PLAYER_ID_URL = "https://api.pubg.com/shards/steam/players?filter[playerNames]="
-PUBG_SEASONS_URL = "https://api.pubg.com/shards/steam/seasons"
+# Can be pointed to a local stub server
+PUBG_API_URL = os.environ.get("PUBG_API_URL", "https://api.pubg.com/shards/steam/")
+PUBG_PLAYER_ID_URL = f"{PUBG_API_URL}players?filter[playerNames]="
+PUBG_SEASONS_URL = f"{PUBG_API_URL}seasons"
 PUBG_API_HEADER = {
     "Authorization": f"Bearer {PUBG_API_KEY}",
     "Accept": "application/vnd.api+json",
@@ -16,6 +20,8 @@ PUBG_DATAFRAME_PATH = f"{BASE_PATH}\\flasktest\\static\\data\\api\\pubg\\"
 PUBG_DATA_PATH = f"{BASE_PATH}\\flasktest\\static\\data\\api\\pubg\\"
 PUBG_IMAGE_PATH = f"{BASE_PATH}\\flasktest\\static\\images\\api\\pubg\\"
 PUBG_IMAGE_PATH_RELATIVE = f"../static/images/api/pubg/"
+PUBG_CHART_PATH = f"{PUBG_IMAGE_PATH}charts\\"  # rendered charts shared by all users
+PUBG_CHART_PATH_RELATIVE = f"{PUBG_IMAGE_PATH_RELATIVE}charts/"
 PUBG_BAR_FONT = {
     "family": "Arial",
     "size": 19,
@@ -23,14 +29,42 @@ PUBG_BAR_FONT = {
 }
 PUBG_BAR_COLOR = "rgb(34, 40, 49)"
 PUBG_BAR_BG_COLOR = "rgb(57, 62, 70)"
+PUBG_CHARTS = [("kills", "Kills_g", "Kills"),  # chart name, DataFrame column, label
+               ("damage", "Damage_g", "Damage"),
+               ("distance", "Distance_g", "Distance")]
+# Steam names as accepted by SearchPUBGForm, they are part of file names
+PUBG_NAME_PATTERN = r"^[A-Za-z0-9_-]+$"
+PUBG_GAME_MODES = ("solo", "duo", "squad", "solo-fpp", "duo-fpp", "squad-fpp")
+PUBG_CHART_MODE = "png"  # "png" renders on the server, "json" sends specs to plotly.js
+PUBG_CHART_BACKEND = "plotly"  # "plotly" (Kaleido) or "matplotlib" (Agg, no subprocess)
+PUBG_CHART_WIDTH = 700  # pixels per chart before scaling
+PUBG_CHART_HEIGHT = 500
+PUBG_CHART_SCALE = 2
+PUBG_CHART_CACHE_BYTES = 200 * 1024 * 1024  # least recently used charts are removed above this
 NR_OF_BARS = 6  # nr of bars created in the charts
+PUBG_MIN_ROUNDS = 5  # min nr of rounds played for a season to be charted
+PUBG_RATE_LIMIT = 10  # nr of requests allowed per PUBG_RATE_PERIOD
+PUBG_RATE_PERIOD = 60  # seconds
+PUBG_MAX_WORKERS = 4  # nr of simultaneous season requests
+PUBG_JOB_WORKERS = 2  # nr of player lookups running in the background at the same time
+PUBG_JOB_TTL = 600  # seconds a lookup can still be polled after its last progress
+PUBG_JOB_STATES = 1000  # nr of lookups kept for polling, least recently changed removed above this
+PUBG_CACHE_BACKEND = "sqlite"  # "sqlite" shares entries between workers, or "memory"
+PUBG_CACHE_PATH = f"{BASE_PATH}\\flasktest\\databases\\api_cache.db"
+PUBG_SEASONS_TTL = 24 * 60 * 60  # seconds the seasons list is cached
+PUBG_PLAYER_ID_TTL = 30 * 24 * 60 * 60  # seconds a name -> account id lookup is cached
+PUBG_PLAYER_ID_CACHE_SIZE = 10000  # nr of cached player ids
 
 
 # ------------------------------------------------------------ #
 # ------------------------- CPI ------------------------------ #
 CPI_DATA_FOLDER = f"{BASE_PATH}\\flasktest\\static\\data\\api\\cpi\\"
+CPI_DATA_PATH = f"{CPI_DATA_FOLDER}df_cpi_netherlands.csv"
 CPI_IMAGE_PATH = f"{BASE_PATH}\\flasktest\\static\\images\\api\\cpi\\"
 CPI_IMAGE_PATH_RELATIVE = f"../static/images/api/cpi/"
+CPI_CHART_PATH = f"{CPI_IMAGE_PATH}graphs\\"  # rendered graphs shared by all users
+CPI_CHART_PATH_RELATIVE = f"{CPI_IMAGE_PATH_RELATIVE}graphs/"
+CPI_CHART_CACHE_BYTES = 100 * 1024 * 1024  # least recently used graphs are removed above this
 CPI_CATEGORIES = ["appearance", "appliances", "fixed", "food", "luxury", "snacks"]
 CPI_GRAPH_FONT = {
     "family": "Arial",
@@ -38,6 +72,11 @@ CPI_GRAPH_FONT = {
     "color": "#D2D8E4",
 }
 CPI_BG_COLOR = "#D2D8E4"
+CPI_CHART_MODE = "png"  # "png" renders on the server, "json" sends series to plotly.js
+CPI_MAX_GRAPHS = 4  # nr of latest graphs shown
+CPI_GRAPH_ATTEMPTS = 3  # tries to store a search while simultaneous searches take its slot
+CPI_RENDER_POOL = "thread"  # "thread" or "process", the process pool also renders on other cores
+CPI_RENDER_WORKERS = 4  # nr of graphs rendered at the same time
 CPI_APPEARANCE = [('clothing_women', 'Clothing F'), ('clothing_men', 'Clothing M'),
                   ('clothing_kids', 'Clothing K'), ('shoes', 'Shoes'), ('bedding', 'Bedding'),
                   ('furniture', 'Furniture'), ('lighting', 'Lighting'), ('carpets', 'Carpets'),
@@ -65,4 +104,8 @@ CPI_LUXURY = [('dining_dancing', 'Dining&Dancing'), ('jewelry', 'Jewelry'),
 
 CPI_SNACKS = [('chocolate', 'Chocolate'), ('chips', 'Chips'), ('fastfood', 'Fastfood'),
               ('bakery', 'Bakery'), ('soda', 'Soda'), ('icecream', 'Icecream'), ('candy', 'Candy'),
-              ('ready_meal', 'Ready Meal'), ('pizza', 'Pizza')]
\ No newline at end of file
+              ('ready_meal', 'Ready Meal'), ('pizza', 'Pizza')]
+# Category items of the checkboxes above, the only ones the chart urls accept
+CPI_CATEGORY_ITEMS = {item for choices in (CPI_APPEARANCE, CPI_APPLIANCES, CPI_FIXED, CPI_FOOD,
+                                           CPI_LUXURY, CPI_SNACKS)
+                      for item, _ in choices}
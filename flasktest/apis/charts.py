@@ -0,0 +1,501 @@
+"""
+Rendering service for the PUBG bar charts.
+
+Every search produces the same three bar charts (see PUBG_CHARTS).
+PlotlyChartRenderer draws them as three rows of one figure and exports
+that figure with a single Kaleido call. The PNG is then cut into one image
+per chart. The Kaleido subprocess is started once and kept warm.
+MatplotlibChartRenderer draws them with the Agg canvas and needs no
+subprocess at all.
+
+The renderer is chosen with PUBG_CHART_BACKEND. With PUBG_CHART_MODE set to
+"json" no PNGs are rendered for the page: pubg_chart_specs() returns plotly.js
+figure specs that the browser draws, and PNGs are only rendered on export.
+
+Rendered charts are stored content-addressed in a ChartStore: the file name
+is a hash of the source DataFrame, the player, the game mode, the chart and
+the renderer. Every user searching the same stats gets a reference to the
+same files. The least recently used files are evicted when the store grows
+beyond PUBG_CHART_CACHE_BYTES.
+
+plotly, matplotlib, PIL and pandas are imported on first use, importing this
+module does not load them.
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+import uuid
+
+from flasktest.apis.apis_settings import PUBG_CHARTS, PUBG_CHART_BACKEND, PUBG_CHART_WIDTH, \
+    PUBG_CHART_HEIGHT, PUBG_CHART_SCALE, PUBG_BAR_COLOR, PUBG_BAR_BG_COLOR, PUBG_BAR_FONT, \
+    PUBG_CHART_PATH, PUBG_CHART_PATH_RELATIVE, PUBG_CHART_CACHE_BYTES
+from flasktest.instrumentation import span
+
+
+def import_renderer_dependencies():
+    """
+    Imports the libraries the renderers and dataframe_hash() use.
+    """
+    import matplotlib.backends.backend_agg  # noqa: F401
+    import matplotlib.figure  # noqa: F401
+    import pandas  # noqa: F401
+    import plotly.io  # noqa: F401
+    import PIL.Image  # noqa: F401
+
+
+def chart_title(label, player_name, game_mode):
+    """
+    Returns the title of a chart, e.g. "Kills per game vs season | player solo-fpp" (str).
+    """
+    return f"{label} per game vs season | {player_name} {game_mode}"
+
+
+def pubg_chart_specs(dataframe, player_name, game_mode):
+    """
+    Builds compact plotly.js figure specs of the bar charts, to be drawn by the browser.
+    Costs no rendering on the server.
+
+    :param dataframe: DataFrame created by create_dataframe().
+    :param player_name: Players name received from the SearchPUBGForm (str).
+    :param game_mode: Requested game mode from SearchPUBGForm (str).
+
+    :return: Figure spec with "data" and "layout" per chart name (dict).
+    """
+    seasons = dataframe["Season"].tolist()
+    specs = {}
+    for name, column, label in PUBG_CHARTS:
+        specs[name] = {
+            "data": [{
+                "type": "bar",
+                "x": seasons,
+                "y": dataframe[column].round(4).tolist(),
+                "marker": {"color": PUBG_BAR_COLOR},
+            }],
+            "layout": {
+                "title": {"text": chart_title(label, player_name, game_mode)},
+                "xaxis": {"title": {"text": "Season"}, "type": "category"},
+                "yaxis": {"title": {"text": f"{label} per game"}, "gridcolor": "white"},
+                "paper_bgcolor": PUBG_BAR_BG_COLOR,
+                "plot_bgcolor": PUBG_BAR_BG_COLOR,
+                "font": PUBG_BAR_FONT,
+            },
+        }
+    return specs
+
+
+def to_mpl_color(color):
+    """
+    Converts a plotly "rgb(r, g, b)" color to a matplotlib color.
+    Other colors (names, hex) are returned as is.
+    """
+    match = re.fullmatch(r"rgb\((\d+),\s*(\d+),\s*(\d+)\)", color)
+    if match is None:
+        return color
+    return tuple(int(x) / 255 for x in match.groups())
+
+
+class PlotlyChartRenderer:
+    """
+    Renders all charts in one Kaleido round-trip.
+    Each chart gets a band of PUBG_CHART_HEIGHT pixels in one tall figure,
+    laid out with the margins of a single plotly express chart.
+
+    :param width: Width of one chart in pixels (int).
+    :param height: Height of one chart in pixels (int).
+    :param scale: Image scale factor (int).
+    """
+    # Default margins of the plotly template
+    margin = {"l": 80, "r": 80, "t": 100, "b": 80}
+
+    def __init__(self, width=PUBG_CHART_WIDTH, height=PUBG_CHART_HEIGHT,
+                 scale=PUBG_CHART_SCALE):
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self._lock = threading.Lock()
+        self._warm = False
+        self._warming = False
+
+    def __repr__(self):
+        return f"PlotlyChartRenderer(width={self.width}, height={self.height}," \
+               f" scale={self.scale})"
+
+    def warm_up(self):
+        """
+        Starts the Kaleido subprocess, so the first search does not wait for it.
+        """
+        import plotly.io as pio
+
+        with self._lock:
+            if not self._warm:
+                pio.to_image({"data": []}, format="png", width=10, height=10, validate=False)
+                self._warm = True
+
+    def warm_up_in_background(self):
+        """
+        Starts warm_up() on a daemon thread, e.g. when the search page is opened.
+        """
+        if not self._warm and not self._warming:
+            self._warming = True
+            threading.Thread(target=self.warm_up, daemon=True).start()
+
+    def build_figure(self, dataframe, player_name, game_mode):
+        """
+        Builds the figure holding all charts, one band per chart from top to bottom.
+        The figure is a plain dict, so plotly does not validate it on every search.
+
+        :return: Figure (dict).
+        """
+        import plotly.io as pio
+
+        total = self.height * len(PUBG_CHARTS)
+        x_domain = [self.margin["l"] / self.width, 1 - self.margin["r"] / self.width]
+        seasons = dataframe["Season"].tolist()
+        data = []
+        layout = {
+            "width": self.width,
+            "height": total,
+            "margin": {"l": 0, "r": 0, "t": 0, "b": 0},
+            "paper_bgcolor": PUBG_BAR_BG_COLOR,
+            "plot_bgcolor": PUBG_BAR_BG_COLOR,
+            "font": PUBG_BAR_FONT,
+            "showlegend": False,
+            "template": pio.templates["plotly"],
+            "annotations": [],
+        }
+
+        for number, (_, column, label) in enumerate(PUBG_CHARTS, start=1):
+            band_top = total - (number - 1) * self.height
+            band_bottom = band_top - self.height
+            axis = "" if number == 1 else str(number)
+
+            data.append({
+                "type": "bar",
+                "x": seasons,
+                "y": dataframe[column].tolist(),
+                "marker": {"color": PUBG_BAR_COLOR},
+                "xaxis": f"x{axis}",
+                "yaxis": f"y{axis}",
+            })
+            layout[f"xaxis{axis}"] = {
+                "domain": x_domain,
+                "anchor": f"y{axis}",
+                "type": "category",
+                "title": {"text": "Season"},
+            }
+            layout[f"yaxis{axis}"] = {
+                "domain": [(band_bottom + self.margin["b"]) / total,
+                           (band_top - self.margin["t"]) / total],
+                "anchor": f"x{axis}",
+                "title": {"text": f"{label} per game"},
+            }
+            layout["annotations"].append({
+                "text": chart_title(label, player_name, game_mode),
+                "xref": "paper",
+                "yref": "paper",
+                "x": 0.05,
+                # Where plotly places an automatic title
+                "y": (band_top - self.margin["t"] * 0.4) / total,
+                "xanchor": "left",
+                "yanchor": "middle",
+                "showarrow": False,
+                "font": {"size": PUBG_BAR_FONT["size"] * 1.4},
+            })
+
+        return {"data": data, "layout": layout}
+
+    def render(self, dataframe, player_name, game_mode):
+        """
+        Renders all charts.
+
+        :param dataframe: DataFrame created by create_dataframe().
+        :param player_name: Players name received from the SearchPUBGForm (str).
+        :param game_mode: Requested game mode from SearchPUBGForm (str).
+
+        :return: PNG bytes per chart name (dict).
+        """
+        import plotly.io as pio
+        from PIL import Image
+
+        self.warm_up()
+        fig = self.build_figure(dataframe, player_name, game_mode)
+        with self._lock, span("render"):
+            png = pio.to_image(fig, format="png", scale=self.scale, validate=False)
+
+        # Cut the tall image into one image per chart.
+        # The charts are opaque, RGB with a fast zlib level encodes quickest
+        image = Image.open(io.BytesIO(png)).convert("RGB")
+        band = self.height * self.scale
+        images = {}
+        for number, (name, _, _) in enumerate(PUBG_CHARTS):
+            buffer = io.BytesIO()
+            image.crop((0, number * band, image.width, (number + 1) * band)) \
+                .save(buffer, format="png", compress_level=1)
+            images[name] = buffer.getvalue()
+        return images
+
+
+class MatplotlibChartRenderer:
+    """
+    Renders the charts with the matplotlib Agg canvas.
+    Uses no global pyplot state, so it is safe to use from several threads.
+
+    :param width: Width of one chart in pixels (int).
+    :param height: Height of one chart in pixels (int).
+    :param scale: Image scale factor (int).
+    """
+    dpi = 100
+
+    def __init__(self, width=PUBG_CHART_WIDTH, height=PUBG_CHART_HEIGHT,
+                 scale=PUBG_CHART_SCALE):
+        self.width = width
+        self.height = height
+        self.scale = scale
+
+    def __repr__(self):
+        return f"MatplotlibChartRenderer(width={self.width}, height={self.height}," \
+               f" scale={self.scale})"
+
+    def warm_up(self):
+        """
+        Nothing to start, Agg renders in process.
+        """
+
+    def warm_up_in_background(self):
+        """
+        Nothing to start, Agg renders in process.
+        """
+
+    def render(self, dataframe, player_name, game_mode):
+        """
+        Renders all charts.
+
+        :param dataframe: DataFrame created by create_dataframe().
+        :param player_name: Players name received from the SearchPUBGForm (str).
+        :param game_mode: Requested game mode from SearchPUBGForm (str).
+
+        :return: PNG bytes per chart name (dict).
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        background = to_mpl_color(PUBG_BAR_BG_COLOR)
+        font_color = to_mpl_color(PUBG_BAR_FONT["color"])
+        # Plotly font sizes are pixels, matplotlib uses points
+        font_size = PUBG_BAR_FONT["size"] * 72 / self.dpi
+        seasons = dataframe["Season"].astype(str)
+
+        images = {}
+        for name, column, label in PUBG_CHARTS:
+            fig = Figure(figsize=(self.width / self.dpi, self.height / self.dpi),
+                         dpi=self.dpi, facecolor=background)
+            FigureCanvasAgg(fig)
+            ax = fig.add_axes([80 / self.width, 80 / self.height,
+                               1 - 160 / self.width, 1 - 180 / self.height])
+            ax.set_facecolor(background)
+            ax.bar(seasons, dataframe[column], color=to_mpl_color(PUBG_BAR_COLOR))
+            ax.set_title(chart_title(label, player_name, game_mode), loc="left",
+                         fontsize=font_size * 1.4, color=font_color, pad=20)
+            ax.set_xlabel("Season", fontsize=font_size, color=font_color)
+            ax.set_ylabel(f"{label} per game", fontsize=font_size, color=font_color)
+            ax.tick_params(colors=font_color, labelsize=font_size * 0.8)
+            ax.grid(axis="y", color="white", linewidth=0.8)
+            ax.set_axisbelow(True)
+            for spine in ax.spines.values():
+                spine.set_visible(False)
+
+            buffer = io.BytesIO()
+            # Fast zlib level, the PNGs are served once and then replaced
+            with span("render"):
+                fig.savefig(buffer, format="png", dpi=self.dpi * self.scale,
+                            facecolor=background, pil_kwargs={"compress_level": 1})
+            images[name] = buffer.getvalue()
+        return images
+
+
+def make_chart_renderer(backend):
+    """
+    Creates the renderer for the configured backend.
+
+    :param backend: "plotly" or "matplotlib" (str).
+
+    :return: PlotlyChartRenderer or MatplotlibChartRenderer.
+    """
+    if backend == "plotly":
+        return PlotlyChartRenderer()
+    if backend == "matplotlib":
+        return MatplotlibChartRenderer()
+    raise ValueError(f"Unknown chart backend: {backend}")
+
+
+chart_renderer = make_chart_renderer(PUBG_CHART_BACKEND)
+
+
+class ChartStore:
+    """
+    Folder of rendered charts named by the hash of their content.
+    Reading a chart refreshes its modification time, which is used to evict
+    the least recently used charts once the folder grows beyond max_bytes.
+
+    :param folder: Path to the folder holding the charts (str).
+    :param relative_folder: Path to the same folder as used by jinja (str).
+    :param max_bytes: Maximum total size of the charts (int).
+    """
+    def __init__(self, folder, relative_folder, max_bytes):
+        self.folder = folder
+        self.relative_folder = relative_folder
+        self.max_bytes = max_bytes
+
+    def __repr__(self):
+        return f"ChartStore(folder={self.folder}, max_bytes={self.max_bytes})"
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.png")
+
+    def relative_path(self, key):
+        """
+        Returns the path of a chart to be sent to jinja (str).
+        """
+        return f"{self.relative_folder}{key}.png"
+
+    def get(self, key):
+        """
+        Returns the relative path of a stored chart and marks it as recently used.
+
+        :param key: Key from chart_key() (str).
+
+        :return: Relative path (str) or None if the chart is not stored.
+        """
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            return None
+        return self.relative_path(key)
+
+    def file_path(self, relative_path):
+        """
+        Returns the file path of a relative path returned earlier (str) or None
+        if it does not belong to the store.
+        """
+        if not relative_path.startswith(self.relative_folder):
+            return None
+        return self._path(relative_path[len(self.relative_folder):-4])
+
+    def contains(self, relative_path):
+        """
+        Checks if a relative path returned earlier still points to a stored chart (bool).
+        """
+        path = self.file_path(relative_path)
+        return path is not None and os.path.isfile(path)
+
+    def put(self, key, png):
+        """
+        Stores a chart. The file appears at once, so readers never see half a chart.
+
+        :param key: Key from chart_key() (str).
+        :param png: PNG image (bytes).
+
+        :return: Relative path (str).
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with span("io"):
+            with open(temp_path, "wb") as file:
+                file.write(png)
+            os.replace(temp_path, path)
+        return self.relative_path(key)
+
+    def evict(self):
+        """
+        Removes the least recently used charts until the store fits in max_bytes.
+
+        :return: Number of removed charts (int).
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.folder)
+                       if entry.name.endswith(".png")]
+        except OSError:
+            return 0
+
+        charts = []
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                # Removed by another worker
+                continue
+            charts.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in charts)
+        removed = 0
+        for _, size, path in sorted(charts):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Removed by another worker or still being served
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+
+chart_store = ChartStore(PUBG_CHART_PATH, PUBG_CHART_PATH_RELATIVE, PUBG_CHART_CACHE_BYTES)
+
+
+def dataframe_hash(dataframe):
+    """
+    Returns a hash of the column names and values of a DataFrame (str).
+    """
+    import pandas as pd
+
+    digest = hashlib.sha1(",".join(map(str, dataframe.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(dataframe, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def chart_key(data_hash, player_name, game_mode, chart_name, renderer):
+    """
+    Returns the store key of one chart (str).
+
+    :param data_hash: Hash of the source DataFrame from dataframe_hash() (str).
+    :param player_name: Players name shown in the title (str).
+    :param game_mode: Game mode shown in the title (str).
+    :param chart_name: Chart name from PUBG_CHARTS (str).
+    :param renderer: Renderer drawing the chart, its settings are part of the key.
+    """
+    parts = [data_hash, player_name, game_mode, chart_name, repr(renderer)]
+    return hashlib.sha1("\0".join(parts).encode()).hexdigest()
+
+
+def get_pubg_charts(dataframe, player_name, game_mode, renderer=None, store=None):
+    """
+    Returns the PUBG bar charts of a DataFrame, rendering them in one batch
+    only if they are not stored yet.
+
+    :param dataframe: DataFrame created by create_dataframe().
+    :param player_name: Players name received from the SearchPUBGForm (str).
+    :param game_mode: Requested game mode from SearchPUBGForm (str).
+    :param renderer: Renderer to use, defaults to chart_renderer.
+    :param store: ChartStore to use, defaults to chart_store.
+
+    :return: Relative path per chart name to be sent to jinja (dict).
+    """
+    renderer = chart_renderer if renderer is None else renderer
+    store = chart_store if store is None else store
+    data_hash = dataframe_hash(dataframe)
+    keys = {name: chart_key(data_hash, player_name, game_mode, name, renderer)
+            for name, _, _ in PUBG_CHARTS}
+
+    paths = {name: store.get(key) for name, key in keys.items()}
+    if all(paths.values()):
+        return paths
+
+    images = renderer.render(dataframe, player_name, game_mode)
+    paths = {name: store.put(keys[name], png) for name, png in images.items()}
+    store.evict()
+    return paths
@@ -0,0 +1,95 @@
+"""
+Thread-safe rendering of the CPI line graphs.
+
+Every graph is drawn on its own matplotlib Figure with an Agg canvas and
+never touches the global pyplot state, so graphs can be rendered at the
+same time without bleeding into each other.
+Renders run on a bounded pool (CPI_RENDER_POOL), so a burst of searches
+cannot start an unlimited number of renders.
+Rendered graphs are kept in cpi_chart_store, named by the hash of their search.
+"""
+import io
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from flasktest.apis.apis_settings import CPI_BG_COLOR, CPI_RENDER_POOL, CPI_RENDER_WORKERS, \
+    CPI_CHART_PATH, CPI_CHART_PATH_RELATIVE, CPI_CHART_CACHE_BYTES
+from flasktest.apis.charts import ChartStore
+from flasktest.instrumentation import span
+
+
+def draw_cpi_graph(series_list, title="Consumer Price Index (2006=100)", ylabel="CPI",
+                   background=CPI_BG_COLOR):
+    """
+    Draws Pandas Series in 1 line graph.
+    Runs in a pool worker, so it only takes and returns plain data.
+
+    :param series_list: List of (label, Pandas Series) tuples (list).
+    :param title: Title of the graph (str).
+    :param ylabel: Label of the y-axis (str).
+    :param background: Background color of the graph (str).
+
+    :return: PNG image (bytes).
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    for label, series in series_list:
+        ax.plot(series.index, series.values, label=label)
+
+    ax.set_title(title, fontsize=19)
+    ax.set_xlabel("Period", fontsize=17)
+    ax.set_ylabel(ylabel, fontsize=17)
+    ax.grid()
+    ax.legend()
+    ax.tick_params(axis="x", labelrotation=45, labelsize=13)
+    ax.tick_params(axis="y", labelsize=13)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer,
+                format="png",
+                bbox_inches="tight",
+                facecolor=background,
+                edgecolor=background,
+                pad_inches=0.3)
+    return buffer.getvalue()
+
+
+def make_render_pool(kind, max_workers):
+    """
+    Creates the pool CPI graphs are rendered on.
+
+    :param kind: "thread" or "process" (str).
+    :param max_workers: Number of graphs rendered at the same time (int).
+
+    :return: ThreadPoolExecutor or ProcessPoolExecutor.
+    """
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cpi-render")
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=max_workers)
+    raise ValueError(f"Unknown render pool: {kind}")
+
+
+cpi_render_pool = make_render_pool(CPI_RENDER_POOL, CPI_RENDER_WORKERS)
+cpi_chart_store = ChartStore(CPI_CHART_PATH, CPI_CHART_PATH_RELATIVE, CPI_CHART_CACHE_BYTES)
+
+
+def render_cpi_graph(series_list, title="Consumer Price Index (2006=100)", ylabel="CPI",
+                     pool=None):
+    """
+    Renders a CPI graph on the render pool and waits for it.
+
+    :param series_list: List of (label, Pandas Series) tuples (list).
+    :param title: Title of the graph (str).
+    :param ylabel: Label of the y-axis (str).
+    :param pool: Pool to render on, defaults to cpi_render_pool.
+
+    :return: PNG image (bytes).
+    """
+    pool = cpi_render_pool if pool is None else pool
+    with span("render"):
+        return pool.submit(draw_cpi_graph, series_list, title, ylabel).result()
@@ -0,0 +1,235 @@
+"""
+Process-wide store for the CPI dataset.
+
+The CSV is parsed once (or read from its binary sidecar) into a dense
+category x month cube of CPI values and one of weights (the coef column).
+A search for any set of categories and range of years is one fancy-indexed
+slice of the cube, so it costs the same for one category or all of them.
+Derived aggregates (year-over-year inflation, rebasing to another year and
+weighted baskets) are vectorized on top of the same cube.
+The store reloads itself when the modification time of the CSV changes.
+pandas is imported when the CSV is first loaded.
+"""
+import os
+import threading
+
+import numpy as np
+
+from flasktest.apis.apis_settings import CPI_DATA_PATH
+from flasktest.apis.csv_cache import read_csv_cached
+from flasktest.instrumentation import span
+
+
+def nan_average(values, axis):
+    """
+    Averages values ignoring NaN, like np.nanmean but without warnings for
+    empty slices, which average to NaN (ndarray).
+    """
+    count = np.count_nonzero(~np.isnan(values), axis=axis)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.nansum(values, axis=axis) / count
+
+
+class CPICube:
+    """
+    Read-only category x month arrays of the CPI dataset.
+    The last row holds no data and is used for unknown category items.
+
+    :param df_all: CPI DataFrame indexed by period_dt with cat, cpi & coef columns.
+    """
+    def __init__(self, df_all):
+        import pandas as pd
+
+        # Some category items are listed twice, keep the first row per month
+        keys = pd.MultiIndex.from_arrays([df_all["cat"], df_all.index])
+        df_all = df_all[~keys.duplicated()]
+
+        cat_codes, categories = pd.factorize(df_all["cat"])
+        periods = df_all.index.to_period("M")
+        first, last = periods.min(), periods.max()
+        month_codes = (periods.year * 12 + periods.month).to_numpy() \
+            - (first.year * 12 + first.month)
+
+        self.categories = pd.Index(categories)
+        self.months = pd.period_range(first, last, freq="M").to_timestamp()
+        self.months.name = "period_dt"
+        self.years = self.months.year.to_numpy()
+
+        shape = (len(categories) + 1, len(self.months))
+        self.cpi = np.full(shape, np.nan)
+        self.cpi[cat_codes, month_codes] = df_all["cpi"].to_numpy()
+        self.coef = np.zeros(shape)
+        self.coef[cat_codes, month_codes] = df_all["coef"].to_numpy()
+
+        # The CSV has a CPI of 0 for months a category was not measured yet,
+        # derived aggregates skip those months
+        self.known = np.where(self.cpi > 0, self.cpi, np.nan)
+
+        # Year-over-year inflation, the cube holds every month so a year is 12 columns
+        self.yoy = np.full(shape, np.nan)
+        self.yoy[:, 12:] = (self.known[:, 12:] / self.known[:, :-12] - 1) * 100
+
+        for array in (self.cpi, self.known, self.coef, self.yoy):
+            array.flags.writeable = False
+
+    def __repr__(self):
+        return f"CPICube(categories={len(self.categories)}, months={len(self.months)})"
+
+    def rows(self, categories):
+        """
+        Returns the cube rows of category items, unknown items get the empty row (ndarray).
+        """
+        rows = self.categories.get_indexer(categories)
+        rows[rows == -1] = len(self.categories)
+        return rows
+
+    def columns(self, start_year, stop_year):
+        """
+        Returns the column slice of a range of years, both included (slice).
+        """
+        start = np.searchsorted(self.years, start_year, side="left")
+        stop = np.searchsorted(self.years, stop_year, side="right")
+        return slice(start, stop)
+
+    def base_values(self, rows, base_year):
+        """
+        Returns the average CPI of the rows in base_year, NaN without data (ndarray).
+        """
+        return nan_average(self.known[rows, self.columns(base_year, base_year)], axis=1)
+
+    def weighted(self, rows, columns):
+        """
+        Returns the CPI of the rows averaged per month, weighted by coef (ndarray).
+        """
+        cpi = self.known[rows, columns]
+        coef = np.where(np.isnan(cpi), 0, self.coef[rows, columns])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # NaN for months without weights
+            return np.nansum(cpi * coef, axis=0) / coef.sum(axis=0)
+
+
+class CPIStore:
+    """
+    Holds the CPI cube and answers searches on it.
+
+    :param path: Path to the CPI csv file (str).
+    """
+    measures = ("cpi", "yoy")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._cube = None
+
+    def __repr__(self):
+        return f"CPIStore(path={self.path}, cube={self._cube})"
+
+    def _load(self):
+        """
+        Parses the csv and builds the cube.
+        """
+        df_all = read_csv_cached(self.path,
+                                 parse_dates=["period_dt"],
+                                 index_col="period_dt")
+        # Replaced in one assignment, running searches keep the old cube
+        self._cube = CPICube(df_all)
+
+    def refresh(self):
+        """
+        (Re)loads the csv when it has not been loaded yet or when it changed on disk.
+
+        :return: The current cube (CPICube).
+        """
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return self._cube
+
+        with self._lock:
+            # Another thread may have reloaded while waiting for the lock
+            if mtime != self._mtime:
+                self._load()
+                self._mtime = mtime
+        return self._cube
+
+    def version(self):
+        """
+        Returns the modification time of the loaded csv, changes when the data changes (float).
+        """
+        self.refresh()
+        return self._mtime
+
+    def categories(self):
+        """
+        Returns the names of all category items (list str).
+        """
+        return list(self.refresh().categories)
+
+    def query(self, categories, start_date, end_date, measure="cpi", base_year=None):
+        """
+        Returns the monthly values of category items within a range of years.
+
+        :param categories: Category items, e.g. ["rice", "bread"] (list str).
+        :param start_date: First year to include (int).
+        :param end_date: Last year to include (int).
+        :param measure: "cpi" for the index or "yoy" for year-over-year inflation in % (str).
+        :param base_year: Rebase the index to base_year=100 instead of 2006=100 (int).
+
+        :return: DataFrame with one column per category item, NaN where no data (DataFrame).
+        """
+        if measure not in self.measures:
+            raise ValueError(f"Unknown CPI measure: {measure}")
+
+        import pandas as pd
+
+        cube = self.refresh()
+        with span("cpi"):
+            rows = cube.rows(categories)
+            columns = cube.columns(start_date, end_date)
+
+            values = getattr(cube, measure)[rows, columns]
+            if measure == "cpi" and base_year is not None:
+                values = values / cube.base_values(rows, base_year)[:, None] * 100
+
+            return pd.DataFrame(values.T, index=cube.months[columns], columns=list(categories))
+
+    def basket(self, categories, start_date, end_date, base_year=None):
+        """
+        Returns the CPI of a basket of category items, weighted by their coef per month.
+
+        :param categories: Category items in the basket (list str).
+        :param start_date: First year to include (int).
+        :param end_date: Last year to include (int).
+        :param base_year: Rebase the basket to base_year=100 instead of 2006=100 (int).
+
+        :return: Pandas Series, NaN for months without weights (Series).
+        """
+        import pandas as pd
+
+        cube = self.refresh()
+        rows = cube.rows(categories)
+        columns = cube.columns(start_date, end_date)
+
+        values = cube.weighted(rows, columns)
+        if base_year is not None:
+            base = nan_average(cube.weighted(rows, cube.columns(base_year, base_year)), axis=0)
+            values = values / base * 100
+
+        return pd.Series(values, index=cube.months[columns], name="basket")
+
+    def get_series(self, category_item, start_date, end_date):
+        """
+        Returns the CPI Series of a category item within a range of years.
+
+        :param category_item: Category item, e.g. "rice" (str).
+        :param start_date: First year to include (int).
+        :param end_date: Last year to include (int).
+
+        :return: Pandas Series, empty if the category item is unknown (Series).
+        """
+        series = self.query([category_item], start_date, end_date)[category_item].dropna()
+        series.name = "cpi"
+        return series
+
+
+cpi_store = CPIStore(CPI_DATA_PATH)
@@ -0,0 +1,196 @@
+"""
+Typed binary sidecars for the CSV data files.
+
+The first read of a CSV parses it with pd.read_csv and stores every column
+as its own NumPy .npy file in a sidecar folder next to the CSV. Later reads
+memory-map those files instead of parsing text again, each column is one
+contiguous array. Text columns are stored as integer codes plus their
+unique values.
+
+Numeric columns stay memory-mapped only where pandas wraps them without
+copying: pandas 2 and later do for DataFrame(..., copy=False), pandas 1.x
+copies columns of the same dtype into one block. The index and text columns
+are always built as new arrays.
+
+A sidecar is only used when the size and modification time of the CSV and
+the read_csv options match the ones it was built from.
+pandas is imported on first read.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from flasktest.instrumentation import span
+
+
+SIDECAR_EXTENSION = ".npcache"
+SIDECAR_VERSION = 2
+INDEX_FIELD = "index"
+
+
+def sidecar_path(csv_path):
+    """
+    Returns the path of the sidecar folder that belongs to a CSV file.
+
+    :param csv_path: Path to the CSV file (str).
+
+    :return: Path to the sidecar folder (str).
+    """
+    return f"{os.path.splitext(csv_path)[0]}{SIDECAR_EXTENSION}"
+
+
+def _source_info(csv_path, read_csv_kwargs):
+    """
+    Describes the CSV and the read options a sidecar was built from.
+    """
+    stat = os.stat(csv_path)
+    return {
+        "version": SIDECAR_VERSION,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "options": repr(sorted(read_csv_kwargs.items())),
+    }
+
+
+def _encode_column(name, values):
+    """
+    Prepares one column for its .npy file.
+    Numeric and datetime columns are stored as is, others as codes + unique values.
+
+    :return: Column meta data (dict) & values to store (ndarray).
+    """
+    column = {"name": name}
+    values = np.asarray(values)
+
+    if values.dtype.kind in "biufcmM":
+        column["uniques"] = None
+        return column, values
+
+    import pandas as pd
+
+    codes, uniques = pd.factorize(values)
+    column["uniques"] = [str(x) for x in uniques]
+    return column, codes.astype(np.int32)
+
+
+def _decode_column(column, values):
+    """
+    Restores a column from its .npy file.
+    """
+    if column["uniques"] is None:
+        return values
+
+    # Code -1 marks a missing value
+    uniques = np.asarray(column["uniques"] + [np.nan], dtype=object)
+    return uniques[values]
+
+
+def _write_sidecar(folder, source, df):
+    """
+    Stores a DataFrame in the sidecar folder.
+    The meta file is replaced last and points readers to the new data folder.
+    """
+    import pandas as pd
+
+    columns = [_encode_column(name, df[name]) for name in df.columns]
+    index = None
+    if not isinstance(df.index, pd.RangeIndex):
+        index = _encode_column(df.index.name, df.index)
+
+    os.makedirs(folder, exist_ok=True)
+    data_name = f"data-{source['mtime_ns']}-{source['size']}"
+    data_path = os.path.join(folder, data_name)
+    shutil.rmtree(f"{data_path}.tmp", ignore_errors=True)
+    os.makedirs(f"{data_path}.tmp")
+    fields = columns if index is None else columns + [index]
+    names = [str(number) for number in range(len(columns))] + [INDEX_FIELD]
+    for name, (_, values) in zip(names, fields):
+        np.save(os.path.join(f"{data_path}.tmp", f"{name}.npy"), values, allow_pickle=False)
+    shutil.rmtree(data_path, ignore_errors=True)
+    os.replace(f"{data_path}.tmp", data_path)
+
+    meta = dict(source,
+                data=data_name,
+                columns=[column for column, _ in columns],
+                index=None if index is None else index[0])
+    meta_path = os.path.join(folder, "meta.json")
+    with open(f"{meta_path}.tmp", "w") as file:
+        json.dump(meta, file)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+    # Clean up data of older versions of the CSV
+    for name in os.listdir(folder):
+        if name.startswith("data-") and name != data_name:
+            path = os.path.join(folder, name)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError:
+                # Still mapped by another reader
+                pass
+
+
+def _read_sidecar(folder, source):
+    """
+    Loads a DataFrame from the sidecar folder.
+
+    :return: DataFrame or None if the sidecar is missing or outdated.
+    """
+    import pandas as pd
+
+    try:
+        with open(os.path.join(folder, "meta.json")) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if any(meta.get(key) != value for key, value in source.items()):
+        # Source CSV changed since the sidecar was written
+        return None
+
+    def load(name):
+        return np.load(os.path.join(folder, meta["data"], f"{name}.npy"), mmap_mode="r")
+
+    try:
+        data = {column["name"]: _decode_column(column, load(number))
+                for number, column in enumerate(meta["columns"])}
+        index = None
+        if meta["index"] is not None:
+            index = pd.Index(_decode_column(meta["index"], load(INDEX_FIELD)),
+                             name=meta["index"]["name"])
+    except (OSError, ValueError):
+        return None
+
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def read_csv_cached(csv_path, **read_csv_kwargs):
+    """
+    Drop-in replacement for pd.read_csv that uses a binary sidecar when possible.
+
+    :param csv_path: Path to the CSV file (str).
+    :param read_csv_kwargs: Keyword arguments passed to pd.read_csv.
+
+    :return: DataFrame (DataFrame).
+    """
+    import pandas as pd
+
+    with span("io"):
+        source = _source_info(csv_path, read_csv_kwargs)
+        folder = sidecar_path(csv_path)
+
+        df = _read_sidecar(folder, source)
+        if df is not None:
+            return df
+
+        df = pd.read_csv(csv_path, **read_csv_kwargs)
+        try:
+            _write_sidecar(folder, source, df)
+        except OSError:
+            # Data folder not writable, keep serving from the CSV
+            pass
+        return df
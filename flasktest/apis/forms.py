@@ -4,11 +4,11 @@ Controls all FlaskForms related to the API pages
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, SelectField, SelectMultipleField, widgets, \
     IntegerField
-from wtforms.validators import DataRequired, Length, NumberRange
+from wtforms.validators import DataRequired, Length, NumberRange, Regexp
 from wtforms.widgets import CheckboxInput
 
 from flasktest.apis.apis_settings import CPI_APPEARANCE, CPI_FOOD, CPI_FIXED, CPI_LUXURY,\
-    CPI_SNACKS, CPI_APPLIANCES
+    CPI_SNACKS, CPI_APPLIANCES, PUBG_NAME_PATTERN
 
 
 # ------------------------------------------------------------- #
@@ -27,7 +27,9 @@ class SearchPUBGForm(FlaskForm):
                        render_kw={"placeholder": "e.g. hambinooo"},
                        validators=[DataRequired(message="Name is required"),
                                    Length(min=3, max=50,
-                                          message="Name must be 3-50 char long")])
+                                          message="Name must be 3-50 char long"),
+                                   Regexp(PUBG_NAME_PATTERN,
+                                          message="Name can only contain letters, digits, - and _")])
     perspective = SelectField(label="Perspective",
                               choices=[("-fpp", "First Person"), ("", "Third person")])
     game_mode = SelectField(label="Game mode",
@@ -41,7 +43,7 @@ class SearchCPIForm(FlaskForm):
     """
     Search form for CPI page.
     Takes selection(s) from checkboxes per category and
-    formats it in the correct format to be used with get_cpi_series().
+    formats it in the correct format to be used with get_cpi_frame() and cpi_store.
 
     Each category contains a SelectMultipleField tuple of form label and category-item name.
     :param: appearance; appliances; fixed; food; luxury; snacks: (SelectBox).
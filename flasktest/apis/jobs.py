@@ -0,0 +1,151 @@
+"""
+Background jobs for slow API lookups.
+
+Jobs run on a small thread pool of the worker that submitted them, inside an
+app context, so web workers can answer right away with a job id. The page
+then polls the job for progress. Every change of a job is written to a
+cache, with the sqlite backend the poll can reach any worker.
+"""
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from flasktest.cache import make_cache
+from flasktest.apis.apis_settings import PUBG_JOB_WORKERS, PUBG_JOB_TTL, PUBG_JOB_STATES, \
+    PUBG_CACHE_BACKEND, PUBG_CACHE_PATH
+
+
+class Job:
+    """
+    State of one background job.
+
+    :param user_id: Id of the user that submitted the job (int).
+    :param states: Cache the state is written to on every change.
+    :param ttl: Seconds the state stays available after the last change (int).
+    """
+    def __init__(self, user_id, states, ttl):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.state = "queued"  # queued, running, done or failed
+        self.progress = []
+        self.message = None
+        self.result = None
+        self.updated = time.time()
+        self._states = states
+        self._ttl = ttl
+        self.save()
+
+    def __repr__(self):
+        return f"Job(id={self.id}, user_id={self.user_id}, state={self.state})"
+
+    def add_progress(self, step, success=True):
+        """
+        Adds a progress step, e.g. a checked season.
+
+        :param step: Description of the step (str).
+        :param success: Whether the step added data (bool).
+        """
+        self.progress.append({"step": step, "success": success})
+        self.save()
+
+    def fail(self, message):
+        """
+        Marks the job as failed with a flash() message.
+
+        :param message: Message shown to the user (str).
+        """
+        self.state = "failed"
+        self.message = message
+        self.save()
+
+    def save(self):
+        """
+        Writes the state to the cache, where pollers of every worker read it.
+        """
+        self.updated = time.time()
+        self._states.set(self.id, {"user_id": self.user_id, "job": self.to_dict()},
+                         ttl=self._ttl)
+
+    def to_dict(self):
+        """
+        Returns the job state as a JSON serializable dict.
+        """
+        return {
+            "id": self.id,
+            "state": self.state,
+            "progress": list(self.progress),
+            "message": self.message,
+            "result": self.result,
+        }
+
+
+class JobQueue:
+    """
+    Runs jobs on a thread pool and keeps their state for polling.
+    The state of a job is forgotten ttl seconds after its last change.
+
+    :param max_workers: Number of jobs running at the same time (int).
+    :param ttl: Seconds the state of a job stays available (int).
+    :param states: Cache shared by the workers that poll (TTLCache or SQLiteTTLCache).
+    """
+    def __init__(self, max_workers, ttl, states):
+        self.ttl = ttl
+        self.states = states
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix="job")
+
+    def submit(self, user_id, func, *args, **kwargs):
+        """
+        Queues func(job, *args, **kwargs). Its return value becomes job.result.
+        Must be called inside an app context.
+
+        :param user_id: Id of the user that submits the job (int).
+        :param func: Function doing the work.
+
+        :return: The queued Job.
+        """
+        job = Job(user_id, self.states, self.ttl)
+        app = current_app._get_current_object()
+        self._pool.submit(self._run, app, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id, user_id):
+        """
+        Returns the state of a job of the given user, see Job.to_dict(), or None
+        if it does not exist (anymore). Works in any worker sharing the cache.
+
+        :param job_id: Id returned by submit() (str).
+        :param user_id: Id of the user asking for the job (int).
+        """
+        entry = self.states.get(job_id)
+        if entry is None or entry["user_id"] != user_id:
+            return None
+        return entry["job"]
+
+    @staticmethod
+    def _run(app, job, func, args, kwargs):
+        """
+        Runs a job inside an app context and stores its outcome.
+        """
+        job.state = "running"
+        job.save()
+        with app.app_context():
+            try:
+                result = func(job, *args, **kwargs)
+            except Exception:  # Report any failure to the polling page
+                app.logger.exception("Job %s failed", job.id)
+                job.fail("Unexpected error.")
+                return
+
+        if job.state != "failed":
+            job.result = result
+            job.state = "done"
+            job.save()
+
+
+pubg_jobs = JobQueue(max_workers=PUBG_JOB_WORKERS, ttl=PUBG_JOB_TTL,
+                     states=make_cache(PUBG_CACHE_BACKEND, namespace="pubg_jobs",
+                                       maxsize=PUBG_JOB_STATES, ttl=PUBG_JOB_TTL,
+                                       path=PUBG_CACHE_PATH))
@@ -0,0 +1,160 @@
+"""
+Concurrent PUBG season stats fetcher.
+
+Season requests are issued in parallel batches on a bounded thread pool.
+Every request needs a token from the PUBG token bucket shared by all
+workers. Each thread of the pool uses its own requests.Session. A batch
+is never larger than the number of qualifying seasons still needed, so no
+quota is spent on seasons that would be thrown away.
+"""
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from flasktest.apis.apis_settings import PUBG_API_URL, PUBG_API_HEADER, TIMEOUT, \
+    PUBG_RATE_LIMIT, PUBG_RATE_PERIOD, PUBG_MAX_WORKERS, PUBG_MIN_ROUNDS, NR_OF_BARS
+from flasktest.apis.rate_limit import SQLTokenBucket
+from flasktest.instrumentation import span
+
+
+# Shared by all PUBG API calls of all workers
+pubg_bucket = SQLTokenBucket(key="pubg", capacity=PUBG_RATE_LIMIT, period=PUBG_RATE_PERIOD)
+
+
+def get_cooldown_message(bucket):
+    """
+    Returns the flash() message shown while the bucket is empty (str).
+    """
+    return f"API on cooldown. {math.ceil(bucket.wait_time())} seconds left."
+
+
+def acquire_token(bucket, wait=False):
+    """
+    Takes one token from the bucket.
+
+    :param bucket: SQLTokenBucket limiting the requests.
+    :param wait: Wait for a token instead of giving up. Only use this off the
+     request thread (bool).
+
+    :return: True if a token was taken (bool).
+    """
+    while not bucket.try_acquire():
+        if not wait:
+            return False
+        time.sleep(bucket.wait_time())
+    return True
+
+
+def fetch_season(session, player_id, season, game_mode, base_url=PUBG_API_URL):
+    """
+    Requests the stats of one season.
+
+    :param session: requests.Session of the calling thread.
+    :param player_id: Player id taken from get_player_id() (str).
+    :param season: Season id (str).
+    :param game_mode: Requested game mode from SearchPUBGForm to query (str).
+    :param base_url: PUBG API shard url (str).
+
+    :return: API status code (int) & game mode stats (dict) or None.
+    """
+    with span("http"):
+        response = session.get(
+            f"{base_url}players/{player_id}/seasons/{season}?filter[gamepad]=false",
+            headers=PUBG_API_HEADER,
+            timeout=TIMEOUT,
+        )
+    if response.status_code != 200:
+        return response.status_code, None
+
+    try:
+        return 200, response.json()["data"]["attributes"]["gameModeStats"][game_mode]
+    except (KeyError, ValueError):
+        return 200, None
+
+
+def fetch_season_stats(player_id, valid_seasons, game_mode, bucket=pubg_bucket,
+                       nr_of_bars=NR_OF_BARS, max_workers=PUBG_MAX_WORKERS, wait=False,
+                       progress=None, base_url=PUBG_API_URL):
+    """
+    Collects the stats of the first nr_of_bars seasons in which the player
+    played enough rounds, requesting seasons concurrently.
+
+    :param player_id: Player id taken from get_player_id() (str).
+    :param valid_seasons: Seasons taken from get_seasons(), newest first (list).
+    :param game_mode: Requested game mode from SearchPUBGForm to query (str).
+    :param bucket: SQLTokenBucket limiting the requests.
+    :param nr_of_bars: Number of qualifying seasons to collect (int).
+    :param max_workers: Maximum number of simultaneous requests (int).
+    :param wait: Wait for new tokens instead of returning 429 when the bucket
+     is empty or the API answers 429. Only use this off the request thread (bool).
+    :param progress: Optional callable(season, added) called per checked season.
+    :param base_url: PUBG API shard url (str).
+
+    :return: API status code (int) & list of (season, stats) tuples or error message (str).
+    Either:
+    200, nr_of_bars seasons collected
+    404, fewer seasons collected (all seasons checked)
+    429, API cooldown flash() message
+    other, "Unexpected error."
+    """
+    collected = []
+    pending = list(valid_seasons)
+    # requests.Session is not documented as thread-safe, one per pool thread
+    thread_data = threading.local()
+    sessions = []
+
+    def fetch(season):
+        if not hasattr(thread_data, "session"):
+            thread_data.session = requests.Session()
+            sessions.append(thread_data.session)
+        return fetch_season(thread_data.session, player_id, season, game_mode, base_url)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending:
+                needed = min(nr_of_bars - len(collected), len(pending), max_workers)
+                granted = bucket.acquire_up_to(needed)
+                if granted == 0:
+                    if not wait:
+                        return 429, get_cooldown_message(bucket)
+                    time.sleep(bucket.wait_time())
+                    continue
+
+                batch, pending = pending[:granted], pending[granted:]
+                # map() keeps the season order so the newest seasons are kept
+                results = pool.map(fetch, batch)
+
+                for number, (season, (status_code, stats)) in enumerate(zip(batch, results)):
+                    if status_code == 429:
+                        # Too many requests
+                        bucket.drain()
+                        if not wait:
+                            return status_code, get_cooldown_message(bucket)
+                        # Request this and the later seasons of the batch again, in order
+                        pending = batch[number:] + pending
+                        time.sleep(bucket.wait_time())
+                        break
+
+                    if status_code != 200:
+                        return status_code, "Unexpected error."
+
+                    if stats is None:
+                        return status_code, "Internal error!"
+
+                    added = stats["roundsPlayed"] >= PUBG_MIN_ROUNDS
+                    if added:
+                        collected.append((season, stats))
+                    if progress is not None:
+                        progress(season, added)
+
+                    # Stop requests when nr_of_bars is reached
+                    if len(collected) == nr_of_bars:
+                        return 200, collected
+    finally:
+        for session in sessions:
+            session.close()
+
+    return 404, collected
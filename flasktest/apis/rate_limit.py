@@ -0,0 +1,134 @@
+"""
+Token bucket rate limiting for external APIs.
+
+SQLTokenBucket keeps its state in the database, so every worker shares
+one quota per key. It takes tokens without blocking and tells callers how
+much quota is left. The statements are plain SQL that SQLite, PostgreSQL
+and MySQL all run the same way.
+"""
+import math
+import time
+
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from flasktest import db
+from flasktest.models import RateLimitData
+
+
+class SQLTokenBucket:
+    """
+    Token bucket stored in a RateLimitData row, shared by all workers.
+    Tokens are taken with a single conditional UPDATE, so concurrent workers
+    can never take more tokens than available. Must be used inside an app context.
+
+    :param key: Name of the bucket, e.g. "pubg" (str).
+    :param capacity: Maximum number of requests per period (int).
+    :param period: Length of the period in seconds (int or float).
+    """
+    def __init__(self, key, capacity, period):
+        self.key = key
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+        self._created = False
+
+    def __repr__(self):
+        return f"SQLTokenBucket(key={self.key}, capacity={self.capacity}, period={self.period})"
+
+    def _level(self, now):
+        """
+        SQL expression for the number of tokens at time now.
+        """
+        tokens = RateLimitData.tokens + (now - RateLimitData.updated) * self.rate
+        return case((tokens > self.capacity, self.capacity), else_=tokens)
+
+    def _create(self):
+        """
+        Creates the bucket full on first use. Workers racing to create it get
+        an IntegrityError from the unique key and use the row of the winner.
+        """
+        if self._created:
+            return
+        with db.engine.begin() as connection:
+            exists = connection.execute(select(RateLimitData.id)
+                                        .where(RateLimitData.key == self.key)).first()
+        if not exists:
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(insert(RateLimitData)
+                                       .values(key=self.key, tokens=self.capacity,
+                                               updated=time.time()))
+            except IntegrityError:
+                pass
+        self._created = True
+
+    def _read(self, connection, now):
+        """
+        Returns the current number of tokens, capacity if the bucket is missing (float).
+        """
+        tokens = connection.execute(select(self._level(now))
+                                    .where(RateLimitData.key == self.key)).scalar()
+        return self.capacity if tokens is None else tokens
+
+    def acquire_up_to(self, amount):
+        """
+        Takes as many tokens as available, up to amount. Never blocks.
+
+        :param amount: Number of tokens wanted (int).
+
+        :return: Number of tokens granted (int).
+        """
+        while True:
+            self._create()
+            now = time.time()
+            with db.engine.begin() as connection:
+                granted = min(amount, math.floor(self._read(connection, now)))
+                if granted <= 0:
+                    return 0
+
+                # Only succeeds if no other worker took the tokens in the meantime
+                taken = connection.execute(update(RateLimitData)
+                                           .where(RateLimitData.key == self.key,
+                                                  self._level(now) >= granted)
+                                           .values(tokens=self._level(now) - granted,
+                                                   updated=now)).rowcount
+            if taken:
+                return granted
+            # Another worker took the tokens, or the bucket row is gone
+            self._created = False
+
+    def try_acquire(self):
+        """
+        Takes a single token if one is available. Never blocks.
+
+        :return: True if the token was granted (bool).
+        """
+        return self.acquire_up_to(1) == 1
+
+    def remaining(self):
+        """
+        Returns the number of whole tokens currently available (int).
+        """
+        self._create()
+        with db.engine.begin() as connection:
+            return math.floor(self._read(connection, time.time()))
+
+    def wait_time(self):
+        """
+        Returns the seconds until the next token becomes available (float).
+        """
+        self._create()
+        with db.engine.begin() as connection:
+            tokens = self._read(connection, time.time())
+        return max(0.0, (1 - tokens) / self.rate)
+
+    def drain(self):
+        """
+        Empties the bucket, e.g. after the API answered with 429 Too Many Requests.
+        """
+        self._create()
+        with db.engine.begin() as connection:
+            connection.execute(update(RateLimitData)
+                               .where(RateLimitData.key == self.key)
+                               .values(tokens=0.0, updated=time.time()))
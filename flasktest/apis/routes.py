@@ -1,17 +1,19 @@
-import time
+import io
 import os
 
-from flask import render_template, request, flash, session, Blueprint
+from flask import render_template, request, flash, session, jsonify, Blueprint, url_for, \
+    send_file, abort
 from flask_login import login_required
 
-from flasktest.models import APIData
 from flasktest.apis.forms import SearchPUBGForm, SearchCPIForm
-from flasktest.apis.utils import get_player_id, get_seasons, get_all_season_stats, \
-    create_dataframe, create_kills_bar, create_damage_bar, create_distance_bar, \
-    load_old_pubg_data, get_pubg_cooldown_message, update_pubg_api_data, save_cpi_graph, \
-    get_cpi_categories, rename_graphs, count_cpi_graphs, get_cpi_graph_paths, \
-    check_user_folder_exists
-from flasktest.apis.apis_settings import PUBG_IMAGE_PATH, PUBG_IMAGE_PATH_RELATIVE, PUBG_DATA_PATH
+from flasktest.apis.utils import run_pubg_lookup, load_old_pubg_data, load_pubg_chart_specs, \
+    is_pubg_search, plot_cpi_graph, get_cpi_categories, get_cpi_chart_spec, get_cpi_graphs, \
+    parse_cpi_chart_args, add_cpi_graph
+from flasktest.apis.jobs import pubg_jobs
+from flasktest.apis.charts import chart_renderer, chart_store
+from flasktest.apis.pubg_fetcher import pubg_bucket, get_cooldown_message
+from flasktest.apis.apis_settings import PUBG_IMAGE_PATH_RELATIVE, PUBG_DATA_PATH, \
+    PUBG_CHARTS, PUBG_CHART_MODE, CPI_CHART_MODE
 
 apis = Blueprint("apis", __name__)
 
@@ -26,19 +28,33 @@ def pubg():
     damage_img = f"{PUBG_IMAGE_PATH_RELATIVE}example_damage.png"
     distance_img = f"{PUBG_IMAGE_PATH_RELATIVE}example_distance.png"
     df_path = f"{PUBG_DATA_PATH}df_"
-    pubg_data = APIData.query.filter_by(api_name="pubg").first()
 
     if request.method == "GET":
-        # Check if user generated stats this session
-        if os.path.isfile(f"{PUBG_IMAGE_PATH}{session['id']}-current_distance.png"):
+        if PUBG_CHART_MODE == "json":
+            # Let the browser draw the graphs of the last search, if any
+            chart_data_url = None
+            if "pubg_search" in session:
+                chart_data_url = url_for("apis.pubg_chart_data", **session["pubg_search"])
+            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
+                                   damage_img=damage_img, distance_img=distance_img,
+                                   chart_mode=PUBG_CHART_MODE, chart_data_url=chart_data_url,
+                                   page="pubg")
+
+        # Start the chart renderer before the user searches
+        chart_renderer.warm_up_in_background()
+
+        # Check if user generated stats this session and they were not evicted since
+        charts = session.get("pubg_charts")
+        if charts and all(chart_store.contains(path) for path in charts.values()):
             # Graphs found
-            kills_img = f"{PUBG_IMAGE_PATH_RELATIVE}{session['id']}-current_kills.png"
-            damage_img = f"{PUBG_IMAGE_PATH_RELATIVE}{session['id']}-current_damage.png"
-            distance_img = f"{PUBG_IMAGE_PATH_RELATIVE}{session['id']}-current_distance.png"
+            kills_img = charts["kills"]
+            damage_img = charts["damage"]
+            distance_img = charts["distance"]
 
         # No graphs generated yet so serve examples
         return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                               damage_img=damage_img, distance_img=distance_img, page="pubg")
+                               damage_img=damage_img, distance_img=distance_img,
+                               chart_mode=PUBG_CHART_MODE, page="pubg")
 
     if pubg_form.validate_on_submit():
         name = pubg_form.name.data
@@ -48,95 +64,99 @@ def pubg():
         # Check for existing data before contacting API
         if os.path.exists(f"{df_path}{name}_{save_mode}.csv"):
             # User has been searched already so old DataFrame can be loaded
-            kills_img, damage_img, distance_img = \
-                load_old_pubg_data(df_path, name, game_mode, save_mode, session["id"])
-
-            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                                   damage_img=damage_img, distance_img=distance_img,
+            if PUBG_CHART_MODE == "json":
+                # The page fetches the graph specs from pubg_chart_data()
+                session["pubg_search"] = {"player_name": name, "game_mode": game_mode}
+                return render_template("/api/pubg.html", pubg_form=pubg_form,
+                                       kills_img=kills_img, damage_img=damage_img,
+                                       distance_img=distance_img, chart_mode=PUBG_CHART_MODE,
+                                       chart_data_url=url_for("apis.pubg_chart_data",
+                                                              player_name=name,
+                                                              game_mode=game_mode),
+                                       scrollToAnchor="graph-section", page="pubg")
+
+            charts = load_old_pubg_data(df_path, name, game_mode, save_mode)
+            session["pubg_charts"] = charts
+
+            return render_template("/api/pubg.html", pubg_form=pubg_form,
+                                   kills_img=charts["kills"], damage_img=charts["damage"],
+                                   distance_img=charts["distance"], chart_mode=PUBG_CHART_MODE,
                                    scrollToAnchor="graph-section", page="pubg")
 
         # No data found - contact API
         # Check API availability
-        if (pubg_data.last_used + 60) > time.time():
-            # API used in last 60 seconds
-            flash_message = get_pubg_cooldown_message()
-            flash(flash_message)
-            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                                   damage_img=damage_img, distance_img=distance_img,
-                                   scrollToAnchor="graph-section", page="pubg")
-
-        # Codes mentioned below are described in the called functions docstring
-        id_code, id_response = get_player_id(name)
+        if pubg_bucket.remaining() == 0:
+            # Quota used up by other searches, the job waits for new tokens
+            flash(f"{get_cooldown_message(pubg_bucket)} Your search has been queued.")
 
-        if not id_code == 200:
-            # Unsuccessful request
-            if id_code == 429:
-                # Request limit reached
-                update_pubg_api_data()
-
-            # Get flash() message corresponding to the request status code
-            flash_message = id_response
-            flash(flash_message)
-            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                                   damage_img=damage_img, distance_img=distance_img,
-                                   scrollToAnchor="graph-section", page="pubg")
-
-        player_id = id_response
-        # Player ID retrieved successfully
-        seasons_code, seasons_response = get_seasons()
-        if not seasons_code == 200:
-            # Unsuccessful request
-            # Get flash() message corresponding to the request status code
-            flash_message = seasons_response
-            if seasons_code == 429:
-                # Request limit reached
-                update_pubg_api_data()
-
-            flash(flash_message)
-            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                                   damage_img=damage_img, distance_img=distance_img,
-                                   scrollToAnchor="graph-section", page="pubg")
-
-        valid_seasons = seasons_response
-        # Valid seasons retrieved successfully
-        stats_code, stats_response = get_all_season_stats(player_id, valid_seasons, game_mode)
-        if not stats_code == 200:
-            # Unsuccessful request
-            # Get flash() message corresponding to the request status code
-            flash_message = stats_response
-            if stats_code == 429:
-                # Request limit reached
-                update_pubg_api_data()
-
-            flash(flash_message)
-            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                                   damage_img=damage_img, distance_img=distance_img,
-                                   scrollToAnchor="graph-section", page="pubg")
-
-        player_stats = stats_response
-        # Player stats retrieved successfully
-        if len(player_stats[0]) < 2:
-            # Check if player was active in at least 2 seasons, else draw no graph
-            flash("Player has insufficient stats to generate graph")
-            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                                   damage_img=damage_img, distance_img=distance_img,
-                                   scrollToAnchor="graph-section", page="pubg")
-
-        # Success
-        new_df = create_dataframe(player_stats, name, save_mode)
-        kills_img = create_kills_bar(new_df, name, game_mode, session["id"])
-        damage_img = create_damage_bar(new_df, name, game_mode, session["id"])
-        distance_img = create_distance_bar(new_df, name, game_mode, session["id"])
-        # Update api db with timestamp
-        update_pubg_api_data()
+        # Look the player up in the background, the page polls pubg_status()
+        job = pubg_jobs.submit(session["id"], run_pubg_lookup, name, game_mode, save_mode)
         return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
                                damage_img=damage_img, distance_img=distance_img,
+                               chart_mode=PUBG_CHART_MODE, job_id=job.id,
                                scrollToAnchor="graph-section", page="pubg")
 
     # Form not validated
     return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
                            damage_img=damage_img, distance_img=distance_img,
-                           scrollToAnchor="graph-section", page="pubg")
+                           chart_mode=PUBG_CHART_MODE, scrollToAnchor="graph-section",
+                           page="pubg")
+
+
+@apis.route("/api/pubg/status/<job_id>", methods=["GET"])
+@login_required
+def pubg_status(job_id):
+    """
+    Returns the progress of a background PUBG lookup as JSON.
+    """
+    job = pubg_jobs.get(job_id, session["id"])
+    if job is None:
+        return jsonify(state="unknown"), 404
+
+    if job["state"] == "done":
+        # Keep showing the new graphs when the user comes back
+        if PUBG_CHART_MODE == "json":
+            session["pubg_search"] = {"player_name": job["result"]["player_name"],
+                                      "game_mode": job["result"]["game_mode"]}
+        else:
+            session["pubg_charts"] = job["result"]
+
+    return jsonify(job)
+
+
+@apis.route("/api/pubg/chart-data/<player_name>/<game_mode>", methods=["GET"])
+@login_required
+def pubg_chart_data(player_name, game_mode):
+    """
+    Returns the plotly.js specs of the bar graphs of a saved player as JSON.
+    """
+    if not is_pubg_search(player_name, game_mode):
+        return jsonify(charts=None), 404
+
+    save_mode = game_mode.replace("-", "_")
+    charts = load_pubg_chart_specs(f"{PUBG_DATA_PATH}df_", player_name, game_mode, save_mode)
+    if charts is None:
+        return jsonify(charts=None), 404
+
+    return jsonify(charts=charts)
+
+
+@apis.route("/api/pubg/export/<player_name>/<game_mode>/<chart_name>.png", methods=["GET"])
+@login_required
+def pubg_chart_export(player_name, game_mode, chart_name):
+    """
+    Renders a bar graph of a saved player as PNG on demand.
+    """
+    save_mode = game_mode.replace("-", "_")
+    df_path = f"{PUBG_DATA_PATH}df_"
+    if not is_pubg_search(player_name, game_mode) \
+            or chart_name not in [name for name, _, _ in PUBG_CHARTS] \
+            or not os.path.exists(f"{df_path}{player_name}_{save_mode}.csv"):
+        abort(404)
+
+    charts = load_old_pubg_data(df_path, player_name, game_mode, save_mode)
+    return send_file(chart_store.file_path(charts[chart_name]), mimetype="image/png",
+                     download_name=f"{player_name}_{save_mode}_{chart_name}.png")
 
 
 # ------------------------------------------------------------ #
@@ -149,13 +169,12 @@ def cpi():
     if request.method == "GET":
         # Check to see if user has generated graphs in the past
         # If so, get the relative paths
-        total_graphs = count_cpi_graphs(session["id"])
-        graph_paths = get_cpi_graph_paths(session["id"],
-                                          total_graphs)
+        total_graphs, graph_paths = get_cpi_graphs(session["id"])
 
         return render_template("/api/cpi.html",
                                cpi_form=cpi_form,
                                page="cpi",
+                               chart_mode=CPI_CHART_MODE,
                                total_graphs=total_graphs,
                                graph_paths=graph_paths)
 
@@ -163,13 +182,12 @@ def cpi():
         # Form is not validated
         # Check to see if user has generated graphs in the past
         # If so, get the relative paths
-        total_graphs = count_cpi_graphs(session["id"])
-        graph_paths = get_cpi_graph_paths(session["id"],
-                                          total_graphs)
+        total_graphs, graph_paths = get_cpi_graphs(session["id"])
 
         return render_template("/api/cpi.html",
                                cpi_form=cpi_form,
                                page="cpi",
+                               chart_mode=CPI_CHART_MODE,
                                total_graphs=total_graphs,
                                graph_paths=graph_paths)
 
@@ -180,12 +198,11 @@ def cpi():
         flash("Selected years not valid")
         # Check to see if user has generated graphs in the past
         # If so, get the relative paths
-        total_graphs = count_cpi_graphs(session["id"])
-        graph_paths = get_cpi_graph_paths(session["id"],
-                                          total_graphs)
+        total_graphs, graph_paths = get_cpi_graphs(session["id"])
         return render_template("/api/cpi.html",
                                cpi_form=cpi_form,
                                page="cpi",
+                               chart_mode=CPI_CHART_MODE,
                                total_graphs=total_graphs,
                                graph_paths=graph_paths)
 
@@ -199,32 +216,59 @@ def cpi():
         # Check to see if user has generated graphs in the past
         # If so, get the relative paths
         flash("PLease select at lease 1 category")
-        total_graphs = count_cpi_graphs(session["id"])
-        graph_paths = get_cpi_graph_paths(session["id"],
-                                          total_graphs)
+        total_graphs, graph_paths = get_cpi_graphs(session["id"])
 
         return render_template("/api/cpi.html",
                                cpi_form=cpi_form,
                                page="cpi",
+                               chart_mode=CPI_CHART_MODE,
                                total_graphs=total_graphs,
                                graph_paths=graph_paths)
 
-    # Rename old graphs recursively & create new graph
-    check_user_folder_exists(session["id"])
-    rename_graphs(session["id"])
-    save_cpi_graph(categories=categories,
-                   start_date=cpi_form.start_year.data,
-                   end_date=cpi_form.stop_year.data,
-                   user_id=session["id"])
+    # Store the search as the newest graph, it is rendered when the page needs it
+    add_cpi_graph(user_id=session["id"],
+                  categories=categories,
+                  start_date=cpi_form.start_year.data,
+                  end_date=cpi_form.stop_year.data)
 
     # Check to see how many graphs user has generated in the past
     # If so, get the relative paths
-    total_graphs = count_cpi_graphs(session["id"])
-    graph_paths = get_cpi_graph_paths(session["id"],
-                                      total_graphs)
+    total_graphs, graph_paths = get_cpi_graphs(session["id"])
 
     return render_template("/api/cpi.html",
                            cpi_form=cpi_form,
                            page="cpi",
+                           chart_mode=CPI_CHART_MODE,
                            total_graphs=total_graphs,
                            graph_paths=graph_paths)
+
+
+@apis.route("/api/cpi/chart-data", methods=["GET"])
+@login_required
+def cpi_chart_data():
+    """
+    Returns the plotly.js spec with the raw series of a CPI search as JSON.
+    Takes one or more category args, start_year & stop_year and optionally
+    measure ("cpi" or "yoy"), base_year and basket (1 for a coef weighted basket).
+    """
+    query = parse_cpi_chart_args(request.args)
+    if query is None:
+        abort(400)
+
+    return jsonify(get_cpi_chart_spec(**query))
+
+
+@apis.route("/api/cpi/export.png", methods=["GET"])
+@login_required
+def cpi_chart_export():
+    """
+    Renders a CPI search as PNG on demand. Takes the same args as cpi_chart_data().
+    """
+    query = parse_cpi_chart_args(request.args)
+    if query is None:
+        abort(400)
+
+    buffer = io.BytesIO()
+    plot_cpi_graph(target=buffer, **query)
+    buffer.seek(0)
+    return send_file(buffer, mimetype="image/png", download_name="cpi.png")
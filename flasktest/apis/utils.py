@@ -1,30 +1,41 @@
+import hashlib
+import io
 import os
+import re
 import time
 import requests
-import pandas as pd
-import math
-
-# savefig needs this
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt  # noqa: E402
-import plotly.express as px  # noqa: E402
-
-from flasktest import db  # noqa: E402
-from flasktest.models import APIData  # noqa: E402
-from flasktest.apis.apis_settings import *  # noqa: E402
-
-
-pd.options.display.float_format = "{:,.4f}".format
+from flask import url_for
+from sqlalchemy.exc import IntegrityError
+
+from flasktest import db
+from flasktest.models import CPIGraphData
+from flasktest.cache import make_cache
+from flasktest.instrumentation import span
+from flasktest.apis.apis_settings import *
+from flasktest.apis.cpi_data import cpi_store
+from flasktest.apis.csv_cache import read_csv_cached
+from flasktest.apis.charts import get_pubg_charts, pubg_chart_specs
+from flasktest.apis.cpi_charts import render_cpi_graph, cpi_chart_store
+from flasktest.apis.pubg_fetcher import fetch_season_stats, get_cooldown_message, \
+    acquire_token, pubg_bucket
+
+
+# Spend the PUBG API quota on stats only
+pubg_seasons_cache = make_cache(PUBG_CACHE_BACKEND, namespace="pubg_seasons",
+                                maxsize=1, ttl=PUBG_SEASONS_TTL, path=PUBG_CACHE_PATH)
+pubg_player_id_cache = make_cache(PUBG_CACHE_BACKEND, namespace="pubg_player_ids",
+                                  maxsize=PUBG_PLAYER_ID_CACHE_SIZE, ttl=PUBG_PLAYER_ID_TTL,
+                                  path=PUBG_CACHE_PATH)
 
 
 # ------------------------------------------------------------- #
 # ------------------------- PUBG ------------------------------ #
-def get_player_id(player_name):
+def get_player_id(player_name, wait=False):
     """
     Contact PUBG API to retrieve a player's id.
 
     :param player_name: Steam name (str) of player.
+    :param wait: Wait for API quota instead of returning 429 (bool).
 
     :return: API status code (int) & API message (str).
     Either:
@@ -33,17 +44,26 @@ def get_player_id(player_name):
     429, API cooldown flash() message
     other, "Unexpected error"
     """
-    response = requests.get(
-        f"{PUBG_PLAYER_ID_URL}{player_name}",
-        headers=PUBG_API_HEADER,
-        timeout=TIMEOUT,
-    )
+    player_id = pubg_player_id_cache.get(player_name)
+    if player_id is not None:
+        return 200, player_id
+
+    if not acquire_token(pubg_bucket, wait):
+        return 429, get_cooldown_message(pubg_bucket)
+
+    with span("http"):
+        response = requests.get(
+            f"{PUBG_PLAYER_ID_URL}{player_name}",
+            headers=PUBG_API_HEADER,
+            timeout=TIMEOUT,
+        )
     status_code = response.status_code
 
     if status_code == 200:
         # Successful request
         json_response = response.json()
         player_id = json_response["data"][0]["id"]
+        pubg_player_id_cache.set(player_name, player_id)
         return status_code, player_id
 
     if status_code == 404:
@@ -52,31 +72,38 @@ def get_player_id(player_name):
 
     if status_code == 429:
         # Too many requests
-        # Update PUBG API database log
-        update_pubg_api_data()
-        pubg_data = APIData.query.filter_by(api_name="pubg").first()
-        return status_code, f"API on cooldown." \
-                            f" {(pubg_data.last_used + 60) - math.floor(time.time())} seconds left."
+        pubg_bucket.drain()
+        return status_code, get_cooldown_message(pubg_bucket)
 
     # Unexpected error
     return status_code, "Unexpected error."
 
 
-def get_seasons():
+def get_seasons(wait=False):
     """
     Contact PUBG API to retrieve all available seasons (starting after full launch).
 
+    :param wait: Wait for API quota instead of returning 429 (bool).
+
     :return: API status code (int) & API message (str).
     Either:
     200, valid_seasons (list)
     429, API cooldown flash() message
     other, "Unexpected error"
     """
-    response = requests.get(
-        PUBG_SEASONS_URL,
-        headers=PUBG_API_HEADER,
-        timeout=TIMEOUT,
-    )
+    valid_seasons = pubg_seasons_cache.get("seasons")
+    if valid_seasons is not None:
+        return 200, valid_seasons
+
+    if not acquire_token(pubg_bucket, wait):
+        return 429, get_cooldown_message(pubg_bucket)
+
+    with span("http"):
+        response = requests.get(
+            PUBG_SEASONS_URL,
+            headers=PUBG_API_HEADER,
+            timeout=TIMEOUT,
+        )
     status_code = response.status_code
 
     if status_code == 200:
@@ -84,15 +111,13 @@ def get_seasons():
         json_response = response.json()
         all_seasons = [x["id"] for x in json_response["data"]]
         valid_seasons = [x for x in all_seasons if "pc-" in x][::-1]
+        pubg_seasons_cache.set("seasons", valid_seasons)
         return status_code, valid_seasons
 
     if status_code == 429:
         # Too many requests
-        # Update PUBG API database log
-        update_pubg_api_data()
-        pubg_data = APIData.query.filter_by(api_name="pubg").first()
-        return status_code, f"API on cooldown." \
-                            f" {(pubg_data.last_used + 60) - math.floor(time.time())} seconds left."
+        pubg_bucket.drain()
+        return status_code, get_cooldown_message(pubg_bucket)
 
     # Unexpected error
     return status_code, "Unexpected error."
@@ -102,6 +127,7 @@ def get_all_season_stats(player_id, valid_seasons, game_mode):
     """
     Contact PUBG API to retrieve all stats for requested seasons with
     a minimum of 5 played games.
+    Seasons are requested concurrently, see fetch_season_stats().
 
     :param player_id: Player id taken from get_player_id() (str).
     :param valid_seasons: Seasons taken from get_seasons() (list).
@@ -113,79 +139,40 @@ def get_all_season_stats(player_id, valid_seasons, game_mode):
     429, API cooldown flash() message
     other, "Unexpected error"
     """
-    assists = []
-    damage = []
-    kills = []
-    headshots = []
-    most_kills = []
-    distance = []
-    top10s = []
-    games = []
-    wins = []
-    seasons = []
-    checked = 0
-
-    for season in valid_seasons:
-        # Sleep in case of too many requests
-        if checked in (7, 15):
-            time.sleep(60)
-
-        checked += 1
-        response = requests.get(
-            f"https://api.pubg.com/shards/steam/players/{player_id}/seasons/{season}?filter["
-            f"gamepad]=false",
-            headers=PUBG_API_HEADER,
-            timeout=TIMEOUT,
-        )
-        status_code = response.status_code
-
-        if status_code == 200:
-            # Successful
-            try:
-                data_json = response.json()
-                stats = data_json["data"]["attributes"]["gameModeStats"][game_mode]
-            except KeyError:
-                return status_code, "Internal error!"
-
-        elif response.status_code == 429:
-            # Too many requests
-            # Update PUBG API database log
-            update_pubg_api_data()
-            pubg_data = APIData.query.filter_by(api_name="pubg").first()
-            return status_code, \
-                f"API on cooldown." \
-                f"{(pubg_data.last_used + 60) - math.floor(time.time())} seconds left."
+    status_code, response = fetch_season_stats(player_id, valid_seasons, game_mode)
+    if status_code not in (200, 404):
+        return status_code, response
 
-        else:
-            # Unexpected error
-            return status_code, "Unexpected error."
-
-        if stats["roundsPlayed"] > 4:
-            assists.append(stats["assists"])
-            damage.append(stats["damageDealt"])
-            kills.append(stats["kills"])
-            headshots.append(stats["headshotKills"])
-            most_kills.append(stats["roundMostKills"])
-            distance.append(stats["rideDistance"])
-            top10s.append(stats["top10s"])
-            games.append(stats["roundsPlayed"])
-            wins.append(stats["wins"])
-            seasons.append("s." + season.split(".")[-1].split("-")[-1])
-            # TODO: Create loading feedback for user on the webpage
-            print(f"{season} added")
-        else:
-            print(f"{season} skipped")
+    # TODO: Handle logic for empty results (player has no games played)
+    return status_code, season_stats_to_lists(response)
 
-        # Stop requests when NR_OF_BARS is reached
-        if len(games) == NR_OF_BARS:
-            return status_code, [assists, damage, kills, headshots, most_kills,
-                                 distance, top10s, games, wins, seasons]
 
-    # Unexpected error
-    status_code = 404
-    # TODO: Handle logic for empty results (player has no games played)
-    return status_code, [assists, damage, kills, headshots, most_kills,
-                         distance, top10s, games, wins, seasons]
+def season_stats_to_lists(season_stats):
+    """
+    Converts the (season, stats) tuples from fetch_season_stats() to
+    the nested list used by create_dataframe().
+
+    :param season_stats: List of (season, stats) tuples.
+
+    :return: Nested list with one list per stat (list).
+    """
+    stat_names = ["assists", "damageDealt", "kills", "headshotKills", "roundMostKills",
+                  "rideDistance", "top10s", "roundsPlayed", "wins"]
+    player_stats = [[stats[name] for _, stats in season_stats] for name in stat_names]
+    player_stats.append([season_label(season) for season, _ in season_stats])
+    return player_stats
+
+
+def season_label(season):
+    """
+    Shortens a season id to the label used in the graphs,
+    e.g. "division.bro.official.pc-2018-21" becomes "s.21".
+
+    :param season: Season id (str).
+
+    :return: Season label (str).
+    """
+    return "s." + season.split(".")[-1].split("-")[-1]
 
 
 def create_dataframe(player_stats, player_name, game_mode):
@@ -199,6 +186,8 @@ def create_dataframe(player_stats, player_name, game_mode):
 
     :return: DataFrame (DataFrame)
     """
+    import pandas as pd
+
     game_mode = game_mode.replace("-", "_")
     df_player = pd.DataFrame()
 
@@ -235,169 +224,106 @@ def create_dataframe(player_stats, player_name, game_mode):
     return df_player
 
 
-def create_kills_bar(dataframe, player_name, game_mode, user_id):
+def is_pubg_search(player_name, game_mode):
     """
-    Creates and saves a plotly express KILLS bar graph with requested info from SearchPUBGForm.
-
-    :param dataframe: Dataframe created by create_dataframe().
-    :param player_name: Players name received from the SearchPUBGForm (str).
-    :param game_mode: Requested game mode from SearchPUBGForm (str).
-    :param user_id: User id from current_user or session["id"] (str or int).
+    Checks a player name and game mode from a URL like SearchPUBGForm checks
+    its input, both become part of a file path.
 
-    :return: Relative path to the saved bar graph to be sent to jinja (str).
-    """
-    kills_bar = px.bar(
-        data_frame=dataframe,
-        x="Season",
-        y="Kills_g",
-        title=f"Kills per game vs season | {player_name} {game_mode}",
-    )
-    kills_bar.update_traces(
-        marker_color=PUBG_BAR_COLOR,
-        marker_line_width=None,
-        opacity=None,
-    )
-
-    kills_bar.update_layout(
-        xaxis_title="Season",
-        yaxis_title="Kills per game",
-        paper_bgcolor=PUBG_BAR_BG_COLOR,
-        plot_bgcolor=PUBG_BAR_BG_COLOR,
-        font=PUBG_BAR_FONT,
-    )
-    kills_bar.write_image(f"{PUBG_IMAGE_PATH}{user_id}-current_kills.png",
-                          scale=2)
-    return f"{PUBG_IMAGE_PATH_RELATIVE}{user_id}-current_kills.png"
-
-
-def create_damage_bar(dataframe, player_name, game_mode, user_id):
-    """
-    Creates and saves a plotly express DAMAGE bar graph with requested info from SearchPUBGForm.
-
-    :param dataframe: Dataframe created by create_dataframe().
-    :param player_name: Players name received from the SearchPUBGForm (str).
-    :param game_mode: Requested game mode from SearchPUBGForm (str).
-    :param user_id: User id from current_user or session["id"] (str or int).
+    :param player_name: Steam name (str).
+    :param game_mode: Game mode, e.g. "squad-fpp" (str).
 
-    :return: Relative path to the saved bar graph to be sent to jinja (str).
+    :return: Whether SearchPUBGForm accepts them (bool).
     """
-    damage_bar = px.bar(
-        data_frame=dataframe,
-        x="Season",
-        y="Damage_g",
-        title=f"Damage per game vs season | {player_name} {game_mode}",
-    )
-    damage_bar.update_traces(
-        marker_color=PUBG_BAR_COLOR,
-        marker_line_width=None,
-        opacity=None,
-    )
-
-    damage_bar.update_layout(
-        xaxis_title="Season",
-        yaxis_title="Damage per game",
-        paper_bgcolor=PUBG_BAR_BG_COLOR,
-        plot_bgcolor=PUBG_BAR_BG_COLOR,
-        font=PUBG_BAR_FONT,
-    )
-
-    damage_bar.write_image(f"{PUBG_IMAGE_PATH}{user_id}-current_damage.png",
-                           scale=2)
-
-    return f"{PUBG_IMAGE_PATH_RELATIVE}{user_id}-current_damage.png"
+    return game_mode in PUBG_GAME_MODES and 3 <= len(player_name) <= 50 \
+        and re.match(PUBG_NAME_PATTERN, player_name) is not None
 
 
-def create_distance_bar(dataframe, player_name, game_mode, user_id):
+def load_old_pubg_data(df_path, player_name, game_mode, save_mode):
     """
-    Creates and saves a plotly express DISTANCE bar graph with requested info from SearchPUBGForm.
+    Gets the bar graphs for PUBG page when the searched player has had their
+    stats searched for in the past and thus their stats have been saved already.
+    Graphs are only generated if no user has seen these stats yet.
 
-    :param dataframe: Dataframe created by create_dataframe().
+    :param df_path: Path to folder containing the dataframe (str).
     :param player_name: Players name received from the SearchPUBGForm (str).
     :param game_mode: Requested game mode from SearchPUBGForm (str).
-    :param user_id: User id from current_user or session["id"] (str or int).
-
-    :return: Relative path to the saved bar graph to be sent to jinja (str).
-    """
-    distance_bar = px.bar(
-        data_frame=dataframe,
-        x="Season",
-        y="Distance_g",
-        title=f"Distance per game vs season | {player_name} {game_mode}",
-    )
-    distance_bar.update_traces(
-        marker_color=PUBG_BAR_COLOR,
-        marker_line_width=None,
-        opacity=None,
-    )
-
-    distance_bar.update_layout(
-        xaxis_title="Season",
-        yaxis_title="Distance per game",
-        paper_bgcolor=PUBG_BAR_BG_COLOR,
-        plot_bgcolor=PUBG_BAR_BG_COLOR,
-        font=PUBG_BAR_FONT,
-    )
-
-    distance_bar.write_image(f"{PUBG_IMAGE_PATH}{user_id}-current_distance.png",
-                             scale=2)
-
-    return f"{PUBG_IMAGE_PATH_RELATIVE}{user_id}-current_distance.png"
-
-
-def remove_pubg_images(user_id):
-    """
-    Deletes users generated bar graphs when logging out.
+    :param save_mode: Modified game_mode param for better format (str).
 
-    :param user_id: User id from current_user or session["id"] (str or int).
+    :returns: Relative path per graph name (dict).
     """
-    if os.path.isfile(f"{PUBG_IMAGE_PATH}{user_id}-current_kills.png"):
-        os.remove(f"{PUBG_IMAGE_PATH}{user_id}-current_kills.png")
+    old_df = read_csv_cached(f"{df_path}{player_name}_{save_mode}.csv")
+    return get_pubg_charts(old_df, player_name, game_mode)
 
-    if os.path.isfile(f"{PUBG_IMAGE_PATH}{user_id}-current_damage.png"):
-        os.remove(f"{PUBG_IMAGE_PATH}{user_id}-current_damage.png")
 
-    if os.path.isfile(f"{PUBG_IMAGE_PATH}{user_id}-current_distance.png"):
-        os.remove(f"{PUBG_IMAGE_PATH}{user_id}-current_distance.png")
-
-
-def load_old_pubg_data(df_path, player_name, game_mode, save_mode, user_id):
+def load_pubg_chart_specs(df_path, player_name, game_mode, save_mode):
     """
-    Generates and saved bar graphs for PUBG page when the searched player has had their
-    stats searched for in the past and thus their stats have been saved already.
+    Gets the plotly.js specs of the bar graphs of a player whose stats have been saved.
 
     :param df_path: Path to folder containing the dataframe (str).
     :param player_name: Players name received from the SearchPUBGForm (str).
     :param game_mode: Requested game mode from SearchPUBGForm (str).
     :param save_mode: Modified game_mode param for better format (str).
-    :param user_id: User id from current_user or session["id"] (str or int).
 
-    :returns: Three relative paths to the requested graphs (str).
+    :returns: Figure spec per graph name (dict) or None if the stats are not saved.
     """
-    old_df = pd.read_csv(f"{df_path}{player_name}_{save_mode}.csv")
-    kills_img = create_kills_bar(old_df, player_name, game_mode, user_id)
-    damage_img = create_damage_bar(old_df, player_name, game_mode, user_id)
-    distance_img = create_distance_bar(old_df, player_name, game_mode, user_id)
-
-    return kills_img, damage_img, distance_img
+    csv_path = f"{df_path}{player_name}_{save_mode}.csv"
+    if not os.path.exists(csv_path):
+        return None
+    return pubg_chart_specs(read_csv_cached(csv_path), player_name, game_mode)
 
 
-def update_pubg_api_data():
-    """
-    Stores the current time.time() in the APIData database.
-    This is later checked whe new requests are made to display cooldown flash() messages.
+def run_pubg_lookup(job, player_name, game_mode, save_mode):
     """
-    pubg_data = APIData.query.filter_by(api_name="pubg").first()
-    pubg_data.last_used = math.floor(time.time())
-    db.session.commit()
+    Background job for a PUBG search of a player whose stats are not saved yet.
+    Contacts the API, creates the DataFrame and the bar graphs and reports progress
+    per season on the job.
 
+    :param job: Job created by pubg_jobs.submit().
+    :param player_name: Players name received from the SearchPUBGForm (str).
+    :param game_mode: Requested game mode from SearchPUBGForm (str).
+    :param save_mode: Modified game_mode param for better format (str).
 
-def get_pubg_cooldown_message():
-    """
-    Returns a string containing the api cooldown timer and the connected flash() message.
-    """
-    pubg_data = APIData.query.filter_by(api_name="pubg").first()
-
-    return f"API on cooldown. {(pubg_data.last_used + 60) - math.floor(time.time())} seconds left."
+    :return: Relative paths to the three bar graphs (dict) or with PUBG_CHART_MODE "json"
+     the player, game mode and graph specs (dict). None if the job failed.
+    """
+    if pubg_bucket.remaining() == 0:
+        # Other searches used up the quota, the job waits for new tokens
+        job.add_progress("Waiting for API quota")
+
+    # Codes mentioned below are described in the called functions docstring
+    id_code, id_response = get_player_id(player_name, wait=True)
+    if not id_code == 200:
+        job.fail(id_response)
+        return None
+
+    player_id = id_response
+    job.add_progress("Player found")
+    seasons_code, seasons_response = get_seasons(wait=True)
+    if not seasons_code == 200:
+        job.fail(seasons_response)
+        return None
+
+    valid_seasons = seasons_response
+    job.add_progress("Seasons loaded")
+    stats_code, stats_response = fetch_season_stats(
+        player_id, valid_seasons, game_mode, wait=True,
+        progress=lambda season, added: job.add_progress(season_label(season), added))
+    if stats_code not in (200, 404):
+        job.fail(stats_response)
+        return None
+
+    if len(stats_response) < 2:
+        # Check if player was active in at least 2 seasons, else draw no graph
+        job.fail("Player has insufficient stats to generate graph")
+        return None
+
+    # Success
+    new_df = create_dataframe(season_stats_to_lists(stats_response), player_name, save_mode)
+    if PUBG_CHART_MODE == "json":
+        # The browser draws the graphs
+        return {"player_name": player_name, "game_mode": game_mode,
+                "charts": pubg_chart_specs(new_df, player_name, game_mode)}
+    return get_pubg_charts(new_df, player_name, game_mode)
 
 
 # ------------------------------------------------------------ #
@@ -418,117 +344,250 @@ def get_cpi_categories(form_data):
     return categories
 
 
-def get_cpi_series(category_item, start_date, end_date):
+def get_cpi_frame(categories, start_date, end_date, measure="cpi", base_year=None,
+                  basket=False):
+    """
+    Gets the requested values of all categories in one query on the CPI cube.
+
+    :param categories: List of category items (list str).
+    :param start_date: SearchCPIForm start_date input (int).
+    :param end_date: SearchCPIForm stop_date input (int).
+    :param measure: "cpi" or "yoy" for year-over-year inflation (str).
+    :param base_year: Rebase the CPI to base_year=100 instead of 2006=100 (int).
+    :param basket: Add a "basket" column with the CPI of all categories
+     weighted by their coef (bool).
+
+    :return: DataFrame with one column per category item (DataFrame).
+    """
+    frame = cpi_store.query(categories, start_date, end_date, measure, base_year)
+    if basket:
+        if measure == "yoy":
+            # Inflation of the basket needs the year before the range
+            index = cpi_store.basket(categories, start_date - 1, end_date)
+            frame["basket"] = ((index / index.shift(12) - 1) * 100).loc[frame.index]
+        else:
+            frame["basket"] = cpi_store.basket(categories, start_date, end_date, base_year)
+    return frame
+
+
+def get_cpi_labels(measure="cpi", base_year=None):
     """
-    Takes SearchCPIForm input and returns the corresponding Pandas Series from
-     the df_cpi_netherlands DataFrame.
+    Returns the title and y-axis label of a CPI graph (str, str).
+    """
+    if measure == "yoy":
+        return "Inflation year-over-year (%)", "Inflation %"
+    return f"Consumer Price Index ({base_year or 2006}=100)", "CPI"
 
-    :param category_item: Category item from input from SearchCPIForm input.
-    :param start_date: Start date received from SearchCPIForm input.
-    :param end_date: End date received from SearchCPIForm input.
 
-    :return: Pandas Series (Series).
+def parse_cpi_chart_args(args):
     """
-    df_all = pd.read_csv(f"{CPI_DATA_FOLDER}df_cpi_netherlands.csv",
-                         parse_dates=["period_dt"],
-                         index_col="period_dt")
+    Reads a CPI graph search from url args: one or more category, start_year,
+    stop_year and optionally measure, base_year & basket. Categories must be
+    in CPI_CATEGORY_ITEMS, repeated ones are used once.
 
-    df = df_all[(df_all.cat == category_item) &
-                (df_all.index.year >= start_date) &
-                (df_all.index.year <= end_date)]
+    :param args: request.args (MultiDict).
 
-    return df.cpi
+    :return: Keyword arguments for get_cpi_frame() (dict) or None if not valid.
+    """
+    query = {
+        # Repeated categories would become duplicate columns
+        "categories": list(dict.fromkeys(args.getlist("category"))),
+        "start_date": args.get("start_year", type=int),
+        "end_date": args.get("stop_year", type=int),
+        "measure": args.get("measure", "cpi"),
+        "base_year": args.get("base_year", type=int),
+        "basket": args.get("basket", "") in ("1", "true"),
+    }
+    if not query["categories"] or query["start_date"] is None or query["end_date"] is None \
+            or query["measure"] not in cpi_store.measures \
+            or not CPI_CATEGORY_ITEMS.issuperset(query["categories"]):
+        return None
+    return query
 
 
-def save_cpi_graph(categories, start_date, end_date, user_id):
+def plot_cpi_graph(categories, start_date, end_date, target, measure="cpi", base_year=None,
+                   basket=False):
     """
-    Takes list of Pandas Series taken from get_cpi_series(),
-    start & end years from SearchCPIForm input and saves them in 1 line graph
-    to return its relative path to be rendered with jinja.
+    Draws the requested values of the categories in 1 line graph and saves it as PNG.
+    Rendering is thread-safe, see render_cpi_graph().
 
-    :param categories: List of Pandas Series (list).
+    :param categories: List of category items (list str).
     :param start_date: SearchCPIForm start_date input (int).
     :param end_date: SearchCPIForm stop_date input (int).
-    :param user_id: User id from current_user or session["id"] (str or int).
+    :param target: File path or file object to save the PNG to.
+    :param measure: See get_cpi_frame() (str).
+    :param base_year: See get_cpi_frame() (int).
+    :param basket: See get_cpi_frame() (bool).
+    """
+    frame = get_cpi_frame(categories, start_date, end_date, measure, base_year, basket)
+    series_list = [(x, frame[x].dropna()) for x in frame.columns]
+    title, ylabel = get_cpi_labels(measure, base_year)
+    png = render_cpi_graph(series_list, title, ylabel)
 
-    :return: Relative path to the saved line graph (str).
+    if isinstance(target, str):
+        with open(target, "wb") as file:
+            file.write(png)
+    else:
+        target.write(png)
+
+
+def cpi_graph_key(categories, start_date, end_date):
+    """
+    Returns the key of a CPI search in cpi_chart_store, it changes with the CPI data (str).
     """
-    for x in categories:
-        series = get_cpi_series(x, start_date, end_date)
-        plt.plot(series, label=x)
+    search = f"{','.join(categories)}|{start_date}|{end_date}|{cpi_store.version()}"
+    return hashlib.sha1(search.encode()).hexdigest()
 
-    plt.title("Consumer Price Index (2006=100)", fontsize=19)
-    plt.xlabel("Period", fontsize=17)
-    plt.ylabel("CPI", fontsize=17)
-    plt.grid()
-    plt.legend()
-    plt.xticks(rotation=45, fontsize=13)
-    plt.yticks(fontsize=13)
 
-    plt.savefig(f"{CPI_IMAGE_PATH}{user_id}\\graph1.png",
-                bbox_inches="tight",
-                facecolor=CPI_BG_COLOR,
-                edgecolor=CPI_BG_COLOR,
-                pad_inches=0.3)
-    plt.clf()
-    return f"{CPI_IMAGE_PATH_RELATIVE}{user_id}/graph1.png"
+def get_cpi_graph_image(categories, start_date, end_date):
+    """
+    Gets the line graph of a CPI search from cpi_chart_store. It is only
+    rendered if no user made the same search since it was last evicted.
 
+    :param categories: List of category items (list str).
+    :param start_date: SearchCPIForm start_date input (int).
+    :param end_date: SearchCPIForm stop_date input (int).
 
-def check_user_folder_exists(user_id):
+    :return: Relative path to the line graph to be rendered with jinja (str).
     """
-    Checks if a user solder exists in the CPI_IMAGE_PATH to store the CPI line graph.
-    If it does not exist it is created.
+    key = cpi_graph_key(categories, start_date, end_date)
+    path = cpi_chart_store.get(key)
+    if path is None:
+        buffer = io.BytesIO()
+        plot_cpi_graph(categories, start_date, end_date, buffer)
+        path = cpi_chart_store.put(key, buffer.getvalue())
+        cpi_chart_store.evict()
+    return path
 
-    :param user_id: User id from current_user or session["id"] (str or int).
+
+def get_cpi_chart_spec(categories, start_date, end_date, measure="cpi", base_year=None,
+                       basket=False):
     """
-    if not os.path.exists(f"{CPI_IMAGE_PATH}{user_id}"):
-        # Create user folder is non-existent
-        os.makedirs(f"{CPI_IMAGE_PATH}{user_id}")
+    Builds a compact plotly.js figure spec with the raw series of the categories,
+    to be drawn by the browser. Costs no rendering on the server.
 
+    :param categories: List of category items (list str).
+    :param start_date: SearchCPIForm start_date input (int).
+    :param end_date: SearchCPIForm stop_date input (int).
+    :param measure: See get_cpi_frame() (str).
+    :param base_year: See get_cpi_frame() (int).
+    :param basket: See get_cpi_frame() (bool).
 
-def count_cpi_graphs(user_id):
+    :return: Figure spec with "data" and "layout" (dict).
     """
-    Checks the number of graphs the user has generated.
-    Needed for recursive renaming to keep the maximum to the 4 latest graphs.
+    frame = get_cpi_frame(categories, start_date, end_date, measure, base_year, basket)
+    months = frame.index.strftime("%Y-%m").tolist()
+    # NaN is not valid JSON, plotly.js leaves a gap for null
+    values = frame.round(2).astype(object).where(frame.notna(), None)
+
+    data = [{
+        "type": "scatter",
+        "mode": "lines",
+        "name": x,
+        "x": months,
+        "y": values[x].tolist(),
+    } for x in frame.columns]
+
+    title, ylabel = get_cpi_labels(measure, base_year)
+    layout = {
+        "title": {"text": title},
+        "xaxis": {"title": {"text": "Period"}},
+        "yaxis": {"title": {"text": ylabel}},
+        "paper_bgcolor": CPI_BG_COLOR,
+        "plot_bgcolor": CPI_BG_COLOR,
+    }
+    return {"data": data, "layout": layout}
 
-    :param user_id: User id from current_user or session["id"] (str or int).
 
-    :return: The number of files in the users CPI image folder (int).
+def get_cpi_chart_urls(graphs):
     """
-    file_count = sum(len(files) for _, _, files in os.walk(f"{CPI_IMAGE_PATH}{user_id}"))
+    Creates the chart data urls of the users latest CPI searches, to be used with jinja.
+    Must be called inside a request context.
 
-    return file_count if file_count is not None else 0
+    :param graphs: Latest searches, newest first, from get_cpi_graph_rows() (list CPIGraphData).
+
+    :return: List of urls to cpi_chart_data() (list str).
+    """
+    return [url_for("apis.cpi_chart_data", category=graph.categories.split(","),
+                    start_year=graph.start_year, stop_year=graph.stop_year)
+            for graph in graphs]
 
 
-def get_cpi_graph_paths(user_id, file_count):
+def get_cpi_graph_rows(user_id):
     """
-    Creates relative paths to the users generated graphs if any were found with count_cpi_graphs().
+    Gets the users latest CPI searches, newest first, in one indexed query.
 
     :param user_id: User id from current_user or session["id"] (str or int).
-    :param file_count: Number of files in users CPI image folder from count_cpi_graphs() (int).
 
-    :return: List with relative paths to user generated CPI images to be used with jinja (list str).
+    :return: At most CPI_MAX_GRAPHS searches (list CPIGraphData).
     """
-    base_path = f"{CPI_IMAGE_PATH_RELATIVE}{user_id}/"
-    graph_paths = [f"{base_path}graph{i + 1}.png" for i in range(0, file_count)]
+    return CPIGraphData.query.filter_by(user_id=user_id) \
+        .order_by(CPIGraphData.created.desc()) \
+        .limit(CPI_MAX_GRAPHS).all()
 
-    return graph_paths
 
+def add_cpi_graph(user_id, categories, start_date, end_date):
+    """
+    Stores a CPI search as the users newest graph. Once the user has
+    CPI_MAX_GRAPHS graphs, the row of the oldest one is overwritten.
+    A search that loses a slot to a simultaneous search of the same user tries again.
 
-def rename_graphs(user_id):
+    :param user_id: User id from current_user or session["id"] (str or int).
+    :param categories: List of category items (list str).
+    :param start_date: SearchCPIForm start_date input (int).
+    :param end_date: SearchCPIForm stop_date input (int).
+
+    :return: The stored search (CPIGraphData).
     """
-    Recursively renames user generated graphs to keep the maximum to the 4 latest.
+    for attempt in range(CPI_GRAPH_ATTEMPTS):
+        graphs = get_cpi_graph_rows(user_id)
+        free_slots = sorted(set(range(CPI_MAX_GRAPHS)) - {graph.slot for graph in graphs})
+        if free_slots:
+            graph = CPIGraphData(user_id=user_id, slot=free_slots[0])
+            db.session.add(graph)
+        else:
+            graph = graphs[-1]
+
+        graph.categories = ",".join(categories)
+        graph.start_year = start_date
+        graph.stop_year = end_date
+        graph.created = time.time()
+        # Rendered by get_cpi_graphs() when the page needs it
+        graph.image = None
+        try:
+            db.session.commit()
+            return graph
+        except IntegrityError:
+            # Another search of the user (double submit, second tab) took the
+            # slot first, look at the rows again
+            db.session.rollback()
+            if attempt == CPI_GRAPH_ATTEMPTS - 1:
+                raise
+
+
+def get_cpi_graphs(user_id):
+    """
+    Gets the graphs the user has generated in the past, newest first.
+    Graphs that are not rendered yet or were evicted from cpi_chart_store are
+    rendered again from their stored search.
+    With CPI_CHART_MODE "json" these are chart data urls drawn by the browser.
 
     :param user_id: User id from current_user or session["id"] (str or int).
+
+    :return: Number of graphs (int) & list of relative paths or urls (list str).
     """
-    if os.path.isfile(f"{CPI_IMAGE_PATH}{user_id}/graph3.png"):
-        os.replace(f"{CPI_IMAGE_PATH}{user_id}/graph3.png",
-                   f"{CPI_IMAGE_PATH}{user_id}/graph4.png")
+    graphs = get_cpi_graph_rows(user_id)
+    if CPI_CHART_MODE == "json":
+        graph_paths = get_cpi_chart_urls(graphs)
+        return len(graph_paths), graph_paths
 
-    if os.path.isfile(f"{CPI_IMAGE_PATH}{user_id}/graph2.png"):
-        os.replace(f"{CPI_IMAGE_PATH}{user_id}/graph2.png",
-                   f"{CPI_IMAGE_PATH}{user_id}/graph3.png")
+    changed = False
+    for graph in graphs:
+        if graph.image is None or not cpi_chart_store.contains(graph.image):
+            graph.image = get_cpi_graph_image(graph.categories.split(","),
+                                              graph.start_year, graph.stop_year)
+            changed = True
+    if changed:
+        db.session.commit()
 
-    if os.path.isfile(f"{CPI_IMAGE_PATH}{user_id}/graph1.png"):
-        os.replace(f"{CPI_IMAGE_PATH}{user_id}/graph1.png",
-                   f"{CPI_IMAGE_PATH}{user_id}/graph2.png")
+    return len(graphs), [graph.image for graph in graphs]
@@ -0,0 +1,270 @@
+"""
+Key-value caches with a time to live (TTL) and least recently used (LRU) eviction.
+
+TTLCache keeps entries in process memory.
+SQLiteTTLCache keeps entries in a SQLite file, so all workers share them.
+Both count hits and misses and store JSON serializable values only.
+Caches made by make_cache() are listed in caches, /metrics reports their stats().
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Seconds before a hit moves a SQLite entry to the end of the LRU order again,
+# so most hits only read
+TOUCH_INTERVAL = 60
+# Hits & misses counted before a worker adds them to the shared SQLite counters
+STATS_FLUSH_COUNT = 100
+# Seconds before pending hits & misses are added anyway
+STATS_FLUSH_SECONDS = 60
+# Caches made by make_cache() by namespace
+caches = {}
+
+
+class TTLCache:
+    """
+    In-memory cache of one process.
+
+    :param maxsize: Maximum number of entries before the least recently used is evicted (int).
+    :param ttl: Default seconds an entry stays valid (int).
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"TTLCache(maxsize={self.maxsize}, ttl={self.ttl}, size={len(self._entries)})"
+
+    def get(self, key, default=None):
+        """
+        Returns the value of a valid entry or default.
+
+        :param key: Cache key (str).
+        :param default: Value returned on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores a value, evicting the least recently used entry when full.
+
+        :param key: Cache key (str).
+        :param value: Value to store.
+        :param ttl: Seconds the entry stays valid, defaults to the cache ttl (int).
+        """
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Removes an entry if present.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        """
+        Returns the hit and miss counters and the number of entries (dict).
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class SQLiteTTLCache:
+    """
+    Cache stored in a SQLite file, shared by every process using the same path.
+    Several caches can share one file by using a different namespace.
+
+    :param path: Path to the SQLite file (str).
+    :param namespace: Name separating this cache from others in the file (str).
+    :param maxsize: Maximum number of entries before the least recently used is evicted (int).
+    :param ttl: Default seconds an entry stays valid (int).
+    :param touch_interval: Seconds before a hit updates the last use of an entry again (int).
+    """
+    def __init__(self, path, namespace, maxsize, ttl, touch_interval=TOUCH_INTERVAL):
+        self.path = path
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self._ready = False
+        # Hits & misses of this process not yet added to cache_stats
+        self._hits = 0
+        self._misses = 0
+        self._flushed = time.time()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"SQLiteTTLCache(namespace={self.namespace}, maxsize={self.maxsize}," \
+               f" ttl={self.ttl})"
+
+    def _connect(self):
+        """
+        Opens a connection and creates the tables on first use.
+        """
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._ready:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_entry ("
+                               " namespace TEXT NOT NULL, key TEXT NOT NULL,"
+                               " value TEXT NOT NULL, expires REAL NOT NULL,"
+                               " used REAL NOT NULL, PRIMARY KEY (namespace, key))")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_cache_entry_used"
+                               " ON cache_entry (namespace, used)")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_stats ("
+                               " namespace TEXT PRIMARY KEY,"
+                               " hits INTEGER NOT NULL DEFAULT 0,"
+                               " misses INTEGER NOT NULL DEFAULT 0)")
+            connection.execute("INSERT OR IGNORE INTO cache_stats (namespace) VALUES (?)",
+                               (self.namespace,))
+            self._ready = True
+        return connection
+
+    def get(self, key, default=None):
+        """
+        Returns the value of a valid entry or default.
+        Only writes when the last use of the entry is older than touch_interval
+        or the pending hits & misses are flushed.
+
+        :param key: Cache key (str).
+        :param default: Value returned on a miss.
+        """
+        now = time.time()
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT value, used FROM cache_entry"
+                                     " WHERE namespace = ? AND key = ? AND expires >= ?",
+                                     (self.namespace, key, now)).fetchone()
+            if row is not None and now - row[1] > self.touch_interval:
+                connection.execute("UPDATE cache_entry SET used = ?"
+                                   " WHERE namespace = ? AND key = ?", (now, self.namespace, key))
+            self._count(connection, hit=row is not None, now=now)
+        finally:
+            connection.close()
+        return default if row is None else json.loads(row[0])
+
+    def _count(self, connection, hit, now):
+        """
+        Counts a hit or miss in this process, adds the pending counts to
+        cache_stats every STATS_FLUSH_COUNT lookups or STATS_FLUSH_SECONDS.
+        """
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+            if self._hits + self._misses < STATS_FLUSH_COUNT \
+                    and now - self._flushed < STATS_FLUSH_SECONDS:
+                return
+        self._flush(connection)
+
+    def _flush(self, connection):
+        """
+        Adds the pending hits & misses of this process to cache_stats.
+        """
+        with self._lock:
+            hits, misses = self._hits, self._misses
+            self._hits = self._misses = 0
+            self._flushed = time.time()
+        if hits or misses:
+            connection.execute("UPDATE cache_stats SET hits = hits + ?, misses = misses + ?"
+                               " WHERE namespace = ?", (hits, misses, self.namespace))
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores a value, evicting expired and least recently used entries when full.
+
+        :param key: Cache key (str).
+        :param value: JSON serializable value to store.
+        :param ttl: Seconds the entry stays valid, defaults to the cache ttl (int).
+        """
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("INSERT OR REPLACE INTO cache_entry"
+                               " (namespace, key, value, expires, used) VALUES (?, ?, ?, ?, ?)",
+                               (self.namespace, key, json.dumps(value), expires, now))
+            connection.execute("DELETE FROM cache_entry WHERE namespace = ? AND expires < ?",
+                               (self.namespace, now))
+            connection.execute("DELETE FROM cache_entry WHERE namespace = ? AND key IN ("
+                               " SELECT key FROM cache_entry WHERE namespace = ?"
+                               " ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                               (self.namespace, self.namespace, self.maxsize))
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def delete(self, key):
+        """
+        Removes an entry if present.
+        """
+        connection = self._connect()
+        try:
+            connection.execute("DELETE FROM cache_entry WHERE namespace = ? AND key = ?",
+                               (self.namespace, key))
+        finally:
+            connection.close()
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of all workers and the number of entries (dict).
+        Other workers add their counts every STATS_FLUSH_COUNT lookups or STATS_FLUSH_SECONDS.
+        """
+        connection = self._connect()
+        try:
+            self._flush(connection)
+            hits, misses = connection.execute("SELECT hits, misses FROM cache_stats"
+                                              " WHERE namespace = ?",
+                                              (self.namespace,)).fetchone()
+            size, = connection.execute("SELECT COUNT(*) FROM cache_entry WHERE namespace = ?",
+                                       (self.namespace,)).fetchone()
+        finally:
+            connection.close()
+        return {"hits": hits, "misses": misses, "size": size}
+
+
+def make_cache(backend, namespace, maxsize, ttl, path=None):
+    """
+    Creates a cache for the configured backend.
+
+    :param backend: "memory" or "sqlite" (str).
+    :param namespace: Name of the cache, used by the sqlite backend (str).
+    :param maxsize: Maximum number of entries (int).
+    :param ttl: Default seconds an entry stays valid (int).
+    :param path: Path to the SQLite file, required by the sqlite backend (str).
+
+    :return: TTLCache or SQLiteTTLCache.
+    """
+    if backend == "sqlite":
+        cache = SQLiteTTLCache(path=path, namespace=namespace, maxsize=maxsize, ttl=ttl)
+    elif backend == "memory":
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+    else:
+        raise ValueError(f"Unknown cache backend: {backend}")
+    caches[namespace] = cache
+    return cache
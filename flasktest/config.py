@@ -0,0 +1,90 @@
+"""
+App configurations, picked by create_app() by name or from the FLASK_CONFIG
+environment variable ("development" by default).
+
+Values are read from the environment when this module is imported.
+"""
+import os
+
+
+BASE_PATH = os.getcwd()
+DATABASE_PATH = os.path.join(BASE_PATH, "flasktest", "databases", "website_database.db")
+
+
+class Config:
+    """
+    Settings shared by all environments.
+    """
+    SECRET_KEY = os.environ.get("FLASK_KEY")
+    # DATABASE_URL points the app to another database, e.g. for benchmarks
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", f"sqlite:///{DATABASE_PATH}")
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    TEMPLATES_AUTO_RELOAD = False
+
+    # FlaskMail settings
+    MAIL_SERVER = os.environ.get("GMAIL_SMTP")
+    MAIL_PORT = 587
+    MAIL_USE_TLS = True
+    MAIL_USERNAME = os.environ.get("GMAIL_EMAIL")
+    MAIL_PASSWORD = os.environ.get("GMAIL_PASS")
+
+    # Instrumentation settings, see flasktest/instrumentation.py
+    INSTRUMENTATION = os.environ.get("FLASK_INSTRUMENTATION") == "1"
+    PROFILE_SAMPLE_RATE = float(os.environ.get("FLASK_PROFILE_SAMPLE_RATE", 0))
+    PROFILE_PATH = os.path.join(BASE_PATH, "flasktest", "profiles")
+    # Reports kept in PROFILE_PATH, the oldest are removed above this
+    PROFILE_MAX_FILES = int(os.environ.get("FLASK_PROFILE_MAX_FILES", 100))
+    # Outside debug mode the X-Profile header needs X-Profile-Token with this value
+    PROFILE_TOKEN = os.environ.get("FLASK_PROFILE_TOKEN")
+    # /metrics needs "Authorization: Bearer <token>" when set, else a local client
+    METRICS_TOKEN = os.environ.get("FLASK_METRICS_TOKEN")
+
+    # Blueprints to register, their heavy dependencies are only imported when used
+    BLUEPRINTS = ("users", "main", "apis", "games", "tools")
+    # Load the read-only data of the blueprints in create_app(), so pre-forking
+    # servers (e.g. gunicorn --preload) share it copy-on-write with all workers
+    PRELOAD_DATA = os.environ.get("FLASK_PRELOAD") == "1"
+
+
+class DevelopmentConfig(Config):
+    """
+    Local development with run.py.
+    """
+    DEBUG = True
+    TEMPLATES_AUTO_RELOAD = True
+
+
+class ProductionConfig(Config):
+    """
+    Served by a WSGI server, see wsgi.py.
+    """
+    PRELOAD_DATA = os.environ.get("FLASK_PRELOAD", "1") == "1"
+
+
+class BenchmarkConfig(Config):
+    """
+    Used by the scripts in benchmarks/, forms are posted without CSRF tokens.
+    """
+    WTF_CSRF_ENABLED = False
+
+
+configs = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+    "benchmark": BenchmarkConfig,
+}
+
+
+def get_config(name=None):
+    """
+    Returns the configuration of an environment.
+
+    :param name: Key of configs, defaults to FLASK_CONFIG or "development" (str).
+
+    :return: Config class.
+    """
+    name = name or os.environ.get("FLASK_CONFIG", "development")
+    try:
+        return configs[name]
+    except KeyError:
+        raise ValueError(f"Unknown config: {name}, choose from {', '.join(configs)}") from None
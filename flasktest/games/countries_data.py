@@ -0,0 +1,74 @@
+"""
+Process-wide table of the countries used by the Countries game.
+
+The CSV is read once, on first use, into a tuple of small Country records,
+so looking a country up is a tuple index instead of parsing the file.
+"""
+import csv
+import threading
+
+from flasktest.games.games_settings import DF_EUROPE_PATH
+from flasktest.instrumentation import span
+
+
+class Country:
+    """
+    A country of the Countries game.
+
+    :param name: Name of the country (str).
+    :param size: Area in km2 (int).
+    :param path: Relative path to the image of the country (str).
+    """
+    __slots__ = ("name", "size", "path")
+
+    def __init__(self, name, size, path):
+        self.name = name
+        self.size = size
+        self.path = path
+
+    def __repr__(self):
+        return f"Country(name={self.name}, size={self.size})"
+
+
+class CountriesTable:
+    """
+    Holds the countries of the CSV in file order, indexed like the
+    country_old & country_new numbers stored in CountriesData.
+
+    :param path: Path to the countries csv file (str).
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._countries = None
+
+    def __repr__(self):
+        return f"CountriesTable(path={self.path}, loaded={self._countries is not None})"
+
+    def _load(self):
+        """
+        Reads the csv into a tuple of Country records.
+        """
+        with span("io"), open(self.path, newline="", encoding="utf-8") as file:
+            return tuple(Country(row["Name"], int(float(row["Size"])), row["FilePath"])
+                         for row in csv.DictReader(file))
+
+    def countries(self):
+        """
+        Returns all countries, reading the csv on first use (tuple Country).
+        """
+        if self._countries is None:
+            with self._lock:
+                # Another thread may have loaded while waiting for the lock
+                if self._countries is None:
+                    self._countries = self._load()
+        return self._countries
+
+    def __len__(self):
+        return len(self.countries())
+
+    def __getitem__(self, number):
+        return self.countries()[number]
+
+
+countries_table = CountriesTable(DF_EUROPE_PATH)
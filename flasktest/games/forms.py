@@ -2,7 +2,8 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, SelectField
 from wtforms.validators import DataRequired, Length
 
-from flasktest.games.utils import Wordle, WordleWordCheck
+from flasktest.games.utils import WordleWordCheck
+from flasktest.games.wordle_engine import wordle_engine
 
 
 # ------------------------------------------------------------------ #
@@ -36,7 +37,7 @@ class WordleForm(FlaskForm):
                                            message="5 letters only!"),
                                     WordleWordCheck(
                                         message=None,  # To be abe to output guessed word in message
-                                        allowed_words=Wordle.word_list)])
+                                        allowed_words=wordle_engine)])
     submit = SubmitField(label="Guess!")
 
 
@@ -8,7 +8,10 @@ DF_EUROPE_PATH = "flasktest/static/data/games/countries/df_europe.csv"
 # --------------------------------------------------------------- #
 # ------------------------- WORDLE ------------------------------ #
 DF_WORDLE_WORDS_PATH = "flasktest/static/data/games/wordle/df_wordle_words.csv"
+WORDLE_FEEDBACK_MATRIX = False  # precompute the feedback of every guess x answer pair (33 MB)
 
 
 # ---------------------------------------------------------------- #
 # ------------------------- NUMBERS ------------------------------ #
+NUMBERS_LEADERBOARD_SIZE = 8  # nr of best times shown per leaderboard
+NUMBERS_GLOBAL_BOARD = 0  # leaderboard of all users, other boards are user ids
@@ -1,14 +1,15 @@
 import time
 
 from flask import render_template, request, session, Blueprint
-from flask_login import login_required
+from flask_login import login_required, current_user
 
 from flasktest import db
-from flasktest.models import CountriesData, WordleData, NumbersData
+from flasktest.models import CountriesData, NumbersData
 from flasktest.games.forms import CountryForm, WordleForm, NumbersForm
-from flasktest.games.utils import get_country_name, get_country_size, get_country_path, \
-    evaluate_countries_game, create_numbers_divs, start_new_wordle, get_last_wordle_guess, \
-    play_wordle_game
+from flasktest.games.games_settings import NUMBERS_GLOBAL_BOARD
+from flasktest.games.utils import get_country, evaluate_countries_game, create_numbers_divs, \
+    start_new_wordle, get_current_wordle, get_wordle_board, play_wordle_game, get_last_numbers, \
+    get_numbers_leaderboard, record_numbers_time
 
 games = Blueprint("games", __name__)
 
@@ -24,14 +25,16 @@ def countries():
     countries_data = CountriesData.query.filter_by(user_id=session["id"]).first()
 
     if request.method == "GET":
+        country1 = get_country(countries_data.country_old)
+        country2 = get_country(countries_data.country_new)
         return render_template("/games/countries.html",
                                country_form=country_form,
-                               name1=get_country_name(countries_data.country_old),
-                               size1=get_country_size(countries_data.country_old),
-                               path1=get_country_path(countries_data.country_old),
-                               name2=get_country_name(countries_data.country_new),
-                               size2=get_country_size(countries_data.country_new),
-                               path2=get_country_path(countries_data.country_new),
+                               name1=country1.name,
+                               size1=country1.size,
+                               path1=country1.path,
+                               name2=country2.name,
+                               size2=country2.size,
+                               path2=country2.path,
                                country_streak=countries_data.country_streak,
                                page="countries",
                                country_record=countries_data.country_record)
@@ -40,15 +43,17 @@ def countries():
         # Take user guess and apply game logic
         guess = country_form.select.data
         countries_data = evaluate_countries_game(guess=guess, user_id=session["id"])
+        country1 = get_country(countries_data.country_old)
+        country2 = get_country(countries_data.country_new)
 
         return render_template("/games/countries.html",
                                country_form=country_form,
-                               name1=get_country_name(countries_data.country_old),
-                               size1=get_country_size(countries_data.country_old),
-                               path1=get_country_path(countries_data.country_old),
-                               name2=get_country_name(countries_data.country_new),
-                               size2=get_country_size(countries_data.country_new),
-                               path2=get_country_path(countries_data.country_new),
+                               name1=country1.name,
+                               size1=country1.size,
+                               path1=country1.path,
+                               name2=country2.name,
+                               size2=country2.size,
+                               path2=country2.path,
                                country_streak=countries_data.country_streak,
                                country_record=countries_data.country_record,
                                page="countries",
@@ -74,9 +79,8 @@ def play_wordle():
     # TODO: Show the answer after a lost game
     wordle_form = WordleForm()
 
-    # Get the users last played game
-    descending = WordleData.query.order_by(WordleData.id.desc())
-    wordle_data = descending.filter_by(user_id=session["id"]).first()
+    # Get the users current game
+    wordle_data = get_current_wordle(current_user)
 
     game_win = False
     game_loss = False
@@ -90,22 +94,15 @@ def play_wordle():
         game_state = "busy"
         if not wordle_data:
             # No games played yet, start new game
-            wordle_divs = start_new_wordle(session["id"])
-
-        elif not wordle_data.wordle_guess1:
-            # New game started but didn't guess yet, start new game
-            wordle_divs = start_new_wordle(session["id"])
+            wordle_divs = start_new_wordle(current_user)
 
         elif wordle_data.wordle_game_state in ("win", "loss"):
             # Last game finished, start new game
-            wordle_divs = start_new_wordle(session["id"])
+            wordle_divs = start_new_wordle(current_user)
 
         else:
-            # User is in the middle of a game
-            last_wordle_guess = get_last_wordle_guess(wordle_data=wordle_data)
-            game_state, wordle_divs = play_wordle_game(wordle_guess=last_wordle_guess,
-                                                       user_id=session["id"],
-                                                       req="GET")
+            # User started a game, show the stored board
+            wordle_divs = get_wordle_board(wordle_data)
 
         return render_template("games/play_wordle.html",
                                wordle_form=wordle_form,
@@ -118,7 +115,7 @@ def play_wordle():
 
         # Check if user makes invalid refresh after game end so new game can still start
         if wordle_data.wordle_game_state in ("win", "loss"):
-            wordle_divs = start_new_wordle(session["id"])
+            wordle_divs = start_new_wordle(current_user)
             game_state = "busy"
 
             return render_template("games/play_wordle.html",
@@ -132,8 +129,8 @@ def play_wordle():
             game_win = True
 
         # Call play game function
-        game_state, wordle_divs = play_wordle_game(wordle_guess=wordle_form.guess.data,
-                                                   user_id=session["id"])
+        game_state, wordle_divs = play_wordle_game(wordle_data=wordle_data,
+                                                   wordle_guess=wordle_form.guess.data)
         if game_state == "loss":
             # User lost the game
             game_loss = True
@@ -149,10 +146,9 @@ def play_wordle():
                                game_loss=game_loss,
                                page="play_wordle")
 
-    last_wordle_guess = get_last_wordle_guess(wordle_data=wordle_data)
-    game_state, wordle_divs = play_wordle_game(wordle_guess=last_wordle_guess,
-                                               user_id=session["id"],
-                                               req="GET")
+    # Form not validated, show the stored board
+    game_state = wordle_data.wordle_game_state
+    wordle_divs = get_wordle_board(wordle_data)
 
     # Reset form to clear FormField
     wordle_form.guess.data = None
@@ -183,23 +179,8 @@ def play_numbers():
     numbers_form = NumbersForm()
     numbers_divs = create_numbers_divs()
 
-    # Get users last unfinished game
-    numbers_data = db.session.query(NumbersData) \
-        .order_by(NumbersData.id.desc()) \
-        .filter(NumbersData.user_id == session["id"]) \
-        .first()
-
-    # Get best times global
-    numbers_highscores_all = db.session.query(NumbersData) \
-        .order_by(NumbersData.numbers_time) \
-        .filter(NumbersData.numbers_time > 0).limit(8) \
-        .all()
-
-    # Get best times personal
-    numbers_highscores_self = db.session.query(NumbersData) \
-        .order_by(NumbersData.numbers_time) \
-        .filter(NumbersData.numbers_time > 0, NumbersData.user_id == session["id"]).limit(8) \
-        .all()
+    # Get users last game
+    numbers_data = get_last_numbers(session["id"])
 
     if numbers_data is None:
         # Never played before
@@ -208,7 +189,6 @@ def play_numbers():
             numbers_start=time.time(),
         )
         db.session.add(new_numbers)
-        db.session.commit()
 
     elif numbers_data.numbers_time != -1:
         # Played before and last game is over
@@ -217,25 +197,29 @@ def play_numbers():
             numbers_start=time.time(),
         )
         db.session.add(new_numbers)
-        db.session.commit()
 
     elif numbers_form.validate_on_submit():
         # Game is going on pressed stop
         numbers_data.numbers_stop = time.time()
         numbers_data.numbers_time = round((numbers_data.numbers_stop - numbers_data.numbers_start),
                                           4)
-        db.session.commit()
+        # Leaderboards only change when a game finishes
+        record_numbers_time(numbers_data)
 
     elif numbers_data.numbers_stop == -1:
         # Game is going on and restarted
         db.session.delete(numbers_data)
-        db.session.commit()
         new_numbers = NumbersData(
             user_id=session["id"],
             numbers_start=time.time(),
         )
         db.session.add(new_numbers)
-        db.session.commit()
+
+    db.session.commit()
+
+    # Get best times global & personal
+    numbers_highscores_all = get_numbers_leaderboard(NUMBERS_GLOBAL_BOARD)
+    numbers_highscores_self = get_numbers_leaderboard(session["id"])
 
     return render_template("/games/play-numbers.html",
                            numbers_form=numbers_form,
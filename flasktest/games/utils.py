@@ -1,52 +1,27 @@
-import pandas as pd
 from random import randint, shuffle, choice
 
 from wtforms import ValidationError
 
 from flasktest import db
-from flasktest.models import CountriesData, WordleData
-from flasktest.games.games_settings import DF_EUROPE_PATH, DF_WORDLE_WORDS_PATH
+from flasktest.models import CountriesData, WordleGameData, WordleGuessData, NumbersData, \
+    NumbersLeaderboardData
+from flasktest.games.games_settings import NUMBERS_LEADERBOARD_SIZE, NUMBERS_GLOBAL_BOARD
+from flasktest.games.countries_data import countries_table
+from flasktest.games.wordle_engine import wordle_engine, encode_feedback, decode_feedback, \
+    GREY
 
 
 # ------------------------------------------------------------------ #
 # ------------------------- COUNTRIES ------------------------------ #
-def get_country_name(number):
+def get_country(number):
     """
-    Gets the name of the country corresponding to the given number.
+    Gets the country corresponding to the given number.
 
-    :param number: A number ranging from 1 - len(names).
+    :param number: A number ranging from 1 - len(countries_table) - 1.
 
-    :return: Country name corresponding with the number (str).
+    :return: Country with name, size & image path (Country).
     """
-    df_europe = pd.read_csv(DF_EUROPE_PATH)
-    countries = df_europe.Name.tolist()
-    return countries[number]
-
-
-def get_country_size(number):
-    """
-    Gets the name of the country corresponding to the given number.
-
-    :param number: A number ranging from 1 - len(names).
-
-    :return: Country size corresponding with the number (int).
-    """
-    df_europe = pd.read_csv(DF_EUROPE_PATH)
-    sizes = df_europe.Size.tolist()
-    return int(sizes[number])
-
-
-def get_country_path(number):
-    """
-    Gets the name of the country corresponding to the given number.
-
-    :param number: A number ranging from 1 - len(names).
-
-    :return: Country image path corresponding with the number (str).
-    """
-    df_europe = pd.read_csv(DF_EUROPE_PATH)
-    paths = df_europe.FilePath.tolist()
-    return paths[number]
+    return countries_table[number]
 
 
 def evaluate_countries_game(guess, user_id):
@@ -59,8 +34,8 @@ def evaluate_countries_game(guess, user_id):
     :returns countries_data: Object with users last game (Obj int).
     """
     countries_data = CountriesData.query.filter_by(user_id=user_id).first()
-    size_old = int(get_country_size(countries_data.country_old))
-    size_new = int(get_country_size(countries_data.country_new))
+    size_old = get_country(countries_data.country_old).size
+    size_new = get_country(countries_data.country_new).size
 
     if guess == "Larger" and size_new >= size_old:
         # User guessed correctly
@@ -80,7 +55,7 @@ def evaluate_countries_game(guess, user_id):
 
     countries_data.country_old = countries_data.country_new
     while countries_data.country_new == countries_data.country_old:
-        countries_data.country_new = randint(1, 44)
+        countries_data.country_new = randint(1, len(countries_table) - 1)
 
     db.session.commit()
 
@@ -92,26 +67,16 @@ def evaluate_countries_game(guess, user_id):
 class Wordle:
     """
     Class containing wordle game info and handles game logic.
+    Scoring is done by wordle_engine.
     """
-    df_words = pd.read_csv(DF_WORDLE_WORDS_PATH)
-    word_list = df_words.Word.tolist()
+    # color codes for html, indexed by GREY, YELLOW & GREEN
+    colors = ("var(--grey)", "var(--yellow)", "var(--green)")
 
     def __init__(self, answer):
         self.answer = answer.upper()
-        self.guess1 = ""
-        self.guess2 = ""
-        self.guess3 = ""
-        self.guess4 = ""
-        self.guess5 = ""
         self.round = 0
 
-        # color codes for html
-        self.grey = "var(--grey)"
-        self.yellow = "var(--yellow)"
-        self.green = "var(--green)"
-
-        self.all_info = []
-        self.empty = [".", self.grey]
+        self.empty = [".", self.colors[GREY]]
 
         # Creates a list with all div info for the html
         self.game_start = [self.empty for _ in range(25)]
@@ -126,115 +91,19 @@ class Wordle:
         """
         return self.game_start
 
-    def round1_data(self, guess1, answer):
-        """
-        Loops over users guess and compares it with the answer.
-        Handles color formatting only.
-
-        :param guess1: User guess received from WordleForm (str).
-        :param answer: Game answer received from database (str).
-
-        :returns colors: Nested list containing pais of letters and color-codes (list str).
-        """
-        colors = []
-        for index, letter in enumerate(guess1):
-            if letter == answer[index]:
-                colors.append([letter, self.green])
-            elif letter in answer:
-                colors.append([letter, self.yellow])
-            else:
-                colors.append([letter, self.grey])
-        self.round += 1
-        self.guess1 = guess1
-        return colors
-
-    def round2_data(self, guess2, answer):
-        """
-        Loops over users guess and compares it with the answer.
-        Handles color formatting only.
-
-        :param guess2: User guess received from WordleForm (str).
-        :param answer: Game answer received from database (str).
-
-        :returns colors: Nested list containing pais of letters and color-codes (list str).
-        """
-        colors = []
-        for index, letter in enumerate(guess2):
-            if letter == answer[index]:
-                colors.append([letter, self.green])
-            elif letter in answer:
-                colors.append([letter, self.yellow])
-            else:
-                colors.append([letter, self.grey])
-        self.round += 1
-        self.guess2 = guess2
-        return colors
-
-    def round3_data(self, guess3, answer):
-        """
-        Loops over users guess and compares it with the answer.
-        Handles color formatting only.
-
-        :param guess3: User guess received from WordleForm (str).
-        :param answer: Game answer received from database (str).
-
-        :returns colors: Nested list containing pais of letters and color-codes (list str).
-        """
-        colors = []
-        for index, letter in enumerate(guess3):
-            if letter == answer[index]:
-                colors.append([letter, self.green])
-            elif letter in answer:
-                colors.append([letter, self.yellow])
-            else:
-                colors.append([letter, self.grey])
-        self.round += 1
-        self.guess3 = guess3
-        return colors
-
-    def round4_data(self, guess4, answer):
-        """
-        Loops over users guess and compares it with the answer.
-        Handles color formatting only.
-
-        :param guess4: User guess received from WordleForm (str).
-        :param answer: Game answer received from database (str).
-
-        :returns colors: Nested list containing pais of letters and color-codes (list str).
+    @classmethod
+    def board_row(cls, guess, feedback):
         """
-        colors = []
-        for index, letter in enumerate(guess4):
-            if letter == answer[index]:
-                colors.append([letter, self.green])
-            elif letter in answer:
-                colors.append([letter, self.yellow])
-            else:
-                colors.append([letter, self.grey])
-        self.round += 1
-        self.guess4 = guess4
-        return colors
-
-    def round5_data(self, guess5, answer):
-        """
-        Loops over users guess and compares it with the answer.
+        Formats a scored guess as a row of the grid.
         Handles color formatting only.
 
-        :param guess5: User guess received from WordleForm (str).
-        :param answer: Game answer received from database (str).
+        :param guess: Guess as stored in the database (str).
+        :param feedback: Feedback of the guess from encode_feedback() (str).
 
-        :returns colors: Nested list containing pais of letters and color-codes (list str).
+        :returns colors: Nested list containing pairs of letters and color-codes (list str).
         """
-        colors = []
-        for index, letter in enumerate(guess5):
-            if letter == answer[index]:
-                colors.append([letter, self.green])
-            elif letter in answer:
-                colors.append([letter, self.yellow])
-            else:
-                colors.append([letter, self.grey])
-        self.round += 1
-        self.guess5 = guess5
-        return colors
+        return [[letter, cls.colors[code]]
+                for letter, code in zip(guess, decode_feedback(feedback))]
 
 
 class WordleWordCheck:
@@ -261,7 +130,7 @@ def add_new_wordle(user_id, answer):
     Takes a user_id(int) and an answer(str).
     Returns a new_wordle(class) for the Wordle game.
     """
-    new_wordle = WordleData(
+    new_wordle = WordleGameData(
         user_id=user_id,
         wordle_answer=answer,
         wordle_round=0,
@@ -270,130 +139,78 @@ def add_new_wordle(user_id, answer):
     return new_wordle
 
 
-def start_new_wordle(user_id):
+def start_new_wordle(user):
     """
-    Takes a user_id(int), creates a new Wordle game and saves it in the Users data.
-    Returns a new_wordle(class) for the Wordle game.
+    Takes a User, creates a new Wordle game and makes it the Users current game.
+    Returns the wordle_divs(list) of the empty grid.
     """
-    wordle_answer = Wordle(choice(Wordle.word_list)).answer
-    wordle_divs = Wordle(choice(Wordle.word_list)).game_start
-    wordle_data = add_new_wordle(user_id=user_id, answer=wordle_answer)
+    wordle_answer = Wordle(choice(wordle_engine.words)).answer
+    wordle_data = add_new_wordle(user_id=user.id, answer=wordle_answer)
     db.session.add(wordle_data)
+    # Assigns the id of the game
+    db.session.flush()
+    user.wordle_game_id = wordle_data.id
     db.session.commit()
-    return wordle_divs
+    return Wordle(wordle_answer).game_start
 
 
-def get_last_wordle_guess(wordle_data):
+def get_current_wordle(user):
     """
-    Takes a Users wordle_data(class) and returns the Users last made guess.
+    Takes a User and returns the game the User is playing, or None if the User
+    never played. Found by primary key, no matter how many games were played.
     """
-    if wordle_data.wordle_guess4 is not None:
-        return wordle_data.wordle_guess4
+    if user.wordle_game_id is None:
+        return None
+    return WordleGameData.query.get(user.wordle_game_id)
 
-    if wordle_data.wordle_guess3 is not None:
-        return wordle_data.wordle_guess3
 
-    if wordle_data.wordle_guess2 is not None:
-        return wordle_data.wordle_guess2
+def get_wordle_board(wordle_data):
+    """
+    Builds the grid of a game from the stored guesses and their feedback.
+    Nothing is scored again and nothing is written.
 
-    if wordle_data.wordle_guess1 is not None:
-        return wordle_data.wordle_guess1
+    :param wordle_data: Users game from WordleGameData (WordleGameData).
 
-    if wordle_data.wordle_guess1 is not None:
-        return wordle_data.wordle_guess1
+    :returns wordle_divs: Nested list containing the div info for the html (list).
+    """
+    wordle_divs = Wordle(wordle_data.wordle_answer).game_start
+    for guess in wordle_data.wordle_guesses:
+        start = (guess.wordle_number - 1) * 5
+        wordle_divs[start:start + 5] = Wordle.board_row(guess.wordle_guess, guess.wordle_feedback)
+    return wordle_divs
 
 
-def play_wordle_game(wordle_guess, user_id, req="POST"):
+def play_wordle_game(wordle_data, wordle_guess):
     """
     Handles the logic for playing the Wordle game.
-    Takes a Users wordle_guess(str) and user_id(int).
-    Returns the game state(str) and the wordle_divs(list) to be rendered.
+    Only the new guess is scored, it is stored with its feedback.
+
+    :param wordle_data: Users active game from WordleGameData (WordleGameData).
+    :param wordle_guess: User guess received from WordleForm (str).
+
+    :return: The game state (str) and the wordle_divs (list) to be rendered.
     """
-    descending = WordleData.query.order_by(WordleData.id.desc())
-    wordle_data = descending.filter_by(user_id=user_id).first()
-    wordle_game = Wordle(wordle_data.wordle_answer)
-    wordle_divs = wordle_game.game_start
-
-    # This logic is needed to use this function with both POST and GET requests
-    if req == "GET":
-        wordle_data.wordle_round -= 1
-
-    # There is an active game
-    game_state = "busy"
-
-    # Check for win
-    if wordle_data.wordle_answer == wordle_guess.upper():
-        wordle_data.wordle_game_state = "win"
-        game_state = "win"
-
-    if wordle_data.wordle_round == 4:
-        wordle_game = Wordle(wordle_data.wordle_answer)
-        wordle_divs[:5] = wordle_game.round1_data(wordle_data.wordle_guess1,
-                                                  wordle_data.wordle_answer)
-        wordle_divs[5:10] = wordle_game.round2_data(wordle_data.wordle_guess2,
-                                                    wordle_data.wordle_answer)
-        wordle_divs[10:15] = wordle_game.round3_data(wordle_data.wordle_guess3,
-                                                     wordle_data.wordle_answer)
-        wordle_divs[15:20] = wordle_game.round4_data(wordle_data.wordle_guess4,
-                                                     wordle_data.wordle_answer)
-        wordle_divs[20:25] = wordle_game.round5_data(wordle_guess.upper(),
-                                                     wordle_data.wordle_answer)
-        wordle_data.wordle_round = 5
-        wordle_data.wordle_guess5 = wordle_guess.upper()
-        if game_state == "win":
-            wordle_data.wordle_win_round = 5
-        else:
-            game_state = "loss"
+    guess = wordle_guess.upper()
+
+    if wordle_data.wordle_round < 5:
+        wordle_data.wordle_round += 1
+        wordle_data.wordle_guesses.append(WordleGuessData(
+            wordle_number=wordle_data.wordle_round,
+            wordle_guess=guess,
+            wordle_feedback=encode_feedback(wordle_engine.score(guess,
+                                                                wordle_data.wordle_answer)),
+        ))
+
+        if guess == wordle_data.wordle_answer:
+            wordle_data.wordle_game_state = "win"
+            wordle_data.wordle_win_round = wordle_data.wordle_round
+        elif wordle_data.wordle_round == 5:
             wordle_data.wordle_game_state = "loss"
             wordle_data.wordle_win_round = -1
 
-    elif wordle_data.wordle_round == 3:
-        wordle_divs[:5] = wordle_game.round1_data(wordle_data.wordle_guess1,
-                                                  wordle_data.wordle_answer)
-        wordle_divs[5:10] = wordle_game.round2_data(wordle_data.wordle_guess2,
-                                                    wordle_data.wordle_answer)
-        wordle_divs[10:15] = wordle_game.round3_data(wordle_data.wordle_guess3,
-                                                     wordle_data.wordle_answer)
-        wordle_divs[15:20] = wordle_game.round4_data(wordle_guess.upper(),
-                                                     wordle_data.wordle_answer)
-        wordle_data.wordle_round = 4
-        wordle_data.wordle_guess4 = wordle_guess.upper()
-        if game_state == "win":
-            wordle_data.wordle_win_round = 4
-
-    elif wordle_data.wordle_round == 2:
-        wordle_divs[:5] = wordle_game.round1_data(wordle_data.wordle_guess1,
-                                                  wordle_data.wordle_answer)
-        wordle_divs[5:10] = wordle_game.round2_data(wordle_data.wordle_guess2,
-                                                    wordle_data.wordle_answer)
-        wordle_divs[10:15] = wordle_game.round3_data(wordle_guess.upper(),
-                                                     wordle_data.wordle_answer)
-        wordle_data.wordle_round = 3
-        wordle_data.wordle_guess3 = wordle_guess.upper()
-        if game_state == "win":
-            wordle_data.wordle_win_round = 3
-
-    elif wordle_data.wordle_round == 1:
-        wordle_divs[:5] = wordle_game.round1_data(wordle_data.wordle_guess1,
-                                                  wordle_data.wordle_answer)
-        wordle_divs[5:10] = wordle_game.round2_data(wordle_guess.upper(),
-                                                    wordle_data.wordle_answer)
-        wordle_data.wordle_round = 2
-        wordle_data.wordle_guess2 = wordle_guess.upper()
-        if game_state == "win":
-            wordle_data.wordle_win_round = 2
-
-    if wordle_data.wordle_round == 0:
-        # Response after 1st guess
-        wordle_divs[:5] = wordle_game.round1_data(wordle_guess.upper(),
-                                                  wordle_data.wordle_answer)
-        wordle_data.wordle_round = 1
-        wordle_data.wordle_guess1 = wordle_guess.upper()
-        if game_state == "win":
-            wordle_data.wordle_win_round = 1
+        db.session.commit()
 
-    db.session.commit()
-    return game_state, wordle_divs
+    return wordle_data.wordle_game_state, get_wordle_board(wordle_data)
 
 
 # ---------------------------------------------------------------- #
@@ -414,3 +231,71 @@ def create_numbers_divs():
         div[1] = "boxEmpty"
     shuffle(numbers_divs)
     return numbers_divs
+
+
+def get_last_numbers(user_id):
+    """
+    Takes a user_id(int) and returns the Users last Numbers game, or None if never played.
+    """
+    return NumbersData.query.filter_by(user_id=user_id) \
+        .order_by(NumbersData.id.desc()) \
+        .first()
+
+
+def get_numbers_leaderboard(board):
+    """
+    Gets the best times of a leaderboard, fastest first.
+    Reads at most NUMBERS_LEADERBOARD_SIZE rows, no matter how many games were played.
+
+    :param board: NUMBERS_GLOBAL_BOARD or a user id (int).
+
+    :return: Leaderboard entries with a numbers_time (list NumbersLeaderboardData).
+    """
+    return NumbersLeaderboardData.query.filter_by(board=board) \
+        .order_by(NumbersLeaderboardData.numbers_time) \
+        .limit(NUMBERS_LEADERBOARD_SIZE) \
+        .all()
+
+
+def add_to_leaderboard(board, numbers_data):
+    """
+    Adds a finished game to a leaderboard if it is one of the best times,
+    and removes the times that dropped off. Committed by the caller.
+
+    :param board: NUMBERS_GLOBAL_BOARD or a user id (int).
+    :param numbers_data: Finished game (NumbersData).
+
+    :return: True if the game made the leaderboard (bool).
+    """
+    entries = get_numbers_leaderboard(board)
+    if len(entries) == NUMBERS_LEADERBOARD_SIZE \
+            and numbers_data.numbers_time >= entries[-1].numbers_time:
+        return False
+
+    db.session.add(NumbersLeaderboardData(board=board,
+                                          game_id=numbers_data.id,
+                                          user_id=numbers_data.user_id,
+                                          numbers_time=numbers_data.numbers_time))
+    db.session.flush()
+
+    # Also removes extra rows left by games that finished at the same time
+    best = db.session.query(NumbersLeaderboardData.id) \
+        .filter_by(board=board) \
+        .order_by(NumbersLeaderboardData.numbers_time) \
+        .limit(NUMBERS_LEADERBOARD_SIZE)
+    NumbersLeaderboardData.query \
+        .filter(NumbersLeaderboardData.board == board,
+                NumbersLeaderboardData.id.notin_(best.scalar_subquery())) \
+        .delete(synchronize_session=False)
+    return True
+
+
+def record_numbers_time(numbers_data):
+    """
+    Adds a finished game to the global leaderboard and the leaderboard of its User.
+    Committed by the caller.
+
+    :param numbers_data: Finished game (NumbersData).
+    """
+    add_to_leaderboard(NUMBERS_GLOBAL_BOARD, numbers_data)
+    add_to_leaderboard(numbers_data.user_id, numbers_data)
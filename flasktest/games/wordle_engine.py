@@ -0,0 +1,232 @@
+"""
+Dictionary and feedback scoring of the Wordle game.
+
+The allowed words are a frozenset, so checking a guess is a hash lookup.
+Feedback is computed by score_words(), which scores any number of guesses
+against any number of answers at once with NumPy and handles duplicate
+letters like the original game: greens are matched first and a letter is
+only yellow as often as it is left over in the answer.
+
+Feedback of one guess is packed into a single number from 0 to 242
+(5 digits of base 3), so the feedback of every guess x answer pair fits in
+a uint8 matrix. With WORDLE_FEEDBACK_MATRIX scoring a guess becomes one
+table lookup. The matrix is built once and stored in the sidecar folder of
+the word list, later processes memory-map it.
+
+The word list is read on first use, not when this module is imported.
+"""
+import csv
+import os
+import threading
+
+import numpy as np
+
+from flasktest.apis.csv_cache import sidecar_path
+from flasktest.games.games_settings import DF_WORDLE_WORDS_PATH, WORDLE_FEEDBACK_MATRIX
+
+
+GREY, YELLOW, GREEN = 0, 1, 2
+WORD_LENGTH = 5
+# Digit weights of the packed feedback, first letter is the most significant
+PACK_WEIGHTS = 3 ** np.arange(WORD_LENGTH - 1, -1, -1, dtype=np.uint8)
+
+
+def encode_words(words):
+    """
+    Encodes words as rows of letter codes.
+
+    :param words: Words of WORD_LENGTH letters, any case (iterable str).
+
+    :return: Array of shape (len(words), WORD_LENGTH) (ndarray uint8).
+    """
+    text = "".join(words).upper().encode("ascii")
+    return np.frombuffer(text, dtype=np.uint8).reshape(-1, WORD_LENGTH)
+
+
+def score_words(guesses, answers):
+    """
+    Scores guesses against answers. Both take encoded words from encode_words()
+    and are broadcast against each other, e.g. guesses[:, None] and answers[None]
+    score every guess against every answer.
+
+    :param guesses: Encoded guesses, shape (..., WORD_LENGTH) (ndarray uint8).
+    :param answers: Encoded answers, shape (..., WORD_LENGTH) (ndarray uint8).
+
+    :return: GREY, YELLOW or GREEN per letter, shape (..., WORD_LENGTH) (ndarray uint8).
+    """
+    guesses, answers = np.broadcast_arrays(guesses, answers)
+    green = guesses == answers
+
+    # same[..., i, j]: guess letter i equals answer letter j
+    same = guesses[..., :, None] == answers[..., None, :]
+    # Answer letters not matched green are left for yellows
+    available = (same & ~green[..., None, :]).sum(axis=-1)
+    # Earlier guess letters that are not green claim those letters first
+    repeats = guesses[..., :, None] == guesses[..., None, :]
+    earlier = np.tril(np.ones((WORD_LENGTH, WORD_LENGTH), dtype=bool), k=-1)
+    claimed = (repeats & earlier & ~green[..., None, :]).sum(axis=-1)
+
+    yellow = ~green & (claimed < available)
+    return np.where(green, GREEN, np.where(yellow, YELLOW, GREY)).astype(np.uint8)
+
+
+def pack_feedback(feedback):
+    """
+    Packs feedback from score_words() into one number per word (ndarray uint8).
+    """
+    return (feedback * PACK_WEIGHTS).sum(axis=-1, dtype=np.uint8)
+
+
+def encode_feedback(feedback):
+    """
+    Encodes the feedback of one guess as a string of digits, e.g. "02100" (str).
+    """
+    return "".join(map(str, feedback))
+
+
+def decode_feedback(feedback):
+    """
+    Decodes a string from encode_feedback() to GREY, YELLOW or GREEN per letter (list int).
+    """
+    return [int(code) for code in feedback]
+
+
+# Every packed feedback number unpacked again, shape (3 ** WORD_LENGTH, WORD_LENGTH)
+UNPACK = (np.arange(3 ** WORD_LENGTH)[:, None] // PACK_WEIGHTS % 3).astype(np.uint8)
+
+
+class WordleEngine:
+    """
+    Holds the allowed words and scores guesses.
+
+    :param path: Path to the word list csv with a Word column (str).
+    :param feedback_matrix: Score with lookups in the guess x answer feedback
+     matrix (len(words) ** 2 bytes), loaded on first use (bool).
+    """
+    def __init__(self, path, feedback_matrix=False):
+        self.path = path
+        self.use_matrix = feedback_matrix
+        self._lock = threading.Lock()
+        self._words = None
+        self._word_set = None
+        self._index = None
+        self._encoded = None
+        self._matrix = None
+
+    def __repr__(self):
+        return f"WordleEngine(path={self.path}, loaded={self._words is not None}," \
+               f" feedback_matrix={self.use_matrix})"
+
+    def __contains__(self, word):
+        return word.lower() in self.word_set
+
+    def load(self):
+        """
+        Reads the word list, if it has not been read yet.
+        """
+        if self._words is not None:
+            return
+
+        with self._lock:
+            # Another thread may have loaded it while waiting for the lock
+            if self._words is not None:
+                return
+            with open(self.path, newline="", encoding="utf-8") as file:
+                words = tuple(row["Word"].lower() for row in csv.DictReader(file))
+            self._word_set = frozenset(words)
+            self._index = {word: index for index, word in enumerate(words)}
+            self._encoded = encode_words(words)
+            # Set last, it marks the engine as loaded
+            self._words = words
+
+    @property
+    def words(self):
+        """
+        Allowed words in file order (tuple str).
+        """
+        self.load()
+        return self._words
+
+    @property
+    def word_set(self):
+        """
+        Allowed words (frozenset str).
+        """
+        self.load()
+        return self._word_set
+
+    def _matrix_path(self):
+        """
+        Returns the path of the stored feedback matrix, it changes with the word list (str).
+        """
+        stat = os.stat(self.path)
+        return os.path.join(sidecar_path(self.path),
+                            f"feedback-{stat.st_mtime_ns}-{stat.st_size}.npy")
+
+    def build_feedback_matrix(self, chunk_size=256):
+        """
+        Scores every guess against every answer.
+
+        :param chunk_size: Number of guesses scored at once, limits memory use (int).
+
+        :return: Packed feedback, shape (len(words), len(words)) (ndarray uint8).
+        """
+        self.load()
+        matrix = np.empty((len(self.words), len(self.words)), dtype=np.uint8)
+        for start in range(0, len(self.words), chunk_size):
+            guesses = self._encoded[start:start + chunk_size, None]
+            matrix[start:start + chunk_size] = \
+                pack_feedback(score_words(guesses, self._encoded[None]))
+        return matrix
+
+    def _load_matrix(self):
+        """
+        Memory-maps the stored feedback matrix, building and storing it first if needed.
+        """
+        path = self._matrix_path()
+        try:
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+
+        matrix = self.build_feedback_matrix()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as file:
+            np.save(file, matrix, allow_pickle=False)
+        os.replace(f"{path}.tmp", path)
+        matrix.flags.writeable = False
+        return matrix
+
+    def feedback_matrix(self):
+        """
+        Returns the packed feedback of every guess x answer pair, loading it on
+        first use (ndarray uint8).
+        """
+        if self._matrix is None:
+            with self._lock:
+                # Another thread may have loaded it while waiting for the lock
+                if self._matrix is None:
+                    self._matrix = self._load_matrix()
+        return self._matrix
+
+    def score(self, guess, answer):
+        """
+        Scores one guess against one answer.
+
+        :param guess: Guessed word, any case (str).
+        :param answer: Answer of the game, any case (str).
+
+        :return: GREY, YELLOW or GREEN per letter (tuple int).
+        """
+        self.load()
+        if self.use_matrix:
+            guess_index = self._index.get(guess.lower())
+            answer_index = self._index.get(answer.lower())
+            if guess_index is not None and answer_index is not None:
+                packed = self.feedback_matrix()[guess_index, answer_index]
+                return tuple(UNPACK[packed].tolist())
+
+        return tuple(score_words(encode_words([guess]), encode_words([answer]))[0].tolist())
+
+
+wordle_engine = WordleEngine(DF_WORDLE_WORDS_PATH, WORDLE_FEEDBACK_MATRIX)
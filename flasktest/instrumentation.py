@@ -0,0 +1,443 @@
+"""
+Opt-in request instrumentation, enabled with FLASK_INSTRUMENTATION=1.
+
+Hot paths wrap their work in span(kind), e.g. with span("render"):.
+Every SQLAlchemy query is a "db" span and every template render a
+"template" span. The spans of a request are summed per kind and sent
+back in a Server-Timing header, so the browser dev tools show where the
+time of a request went. All spans and requests, also those of background
+jobs, are counted for the /metrics endpoint in Prometheus text format.
+Metrics are kept per process, /metrics also reports the hits, misses and
+size of the caches in flasktest.cache, for the sqlite backend of all workers.
+
+A request with the header "X-Profile: cprofile" (or "pyinstrument" when it
+is installed) runs under a profiler and saves its profile in PROFILE_PATH,
+the file name is returned in the X-Profile-File header. Outside debug mode
+the header only counts with an X-Profile-Token header equal to PROFILE_TOKEN.
+PROFILE_SAMPLE_RATE profiles that fraction of all requests as well. Only the
+newest PROFILE_MAX_FILES reports are kept.
+
+/metrics answers local clients, or only clients sending METRICS_TOKEN as
+bearer token when it is set (e.g. behind a reverse proxy on the same host).
+
+While disabled span() returns a shared no-op context manager and no hooks
+are registered, so the instrumented code runs as before.
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from flask import Response, abort, current_app, g, has_request_context, request, \
+    before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from flasktest.cache import caches
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+
+# Upper bounds in seconds of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Functions listed in a cProfile report
+PROFILE_LINES = 40
+# Addresses allowed to read /metrics without METRICS_TOKEN
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+_enabled = False
+
+
+class Metrics:
+    """
+    Process-wide counters of requests and spans.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 2))
+        self.spans = defaultdict(lambda: [0, 0.0])
+
+    def __repr__(self):
+        return f"Metrics(requests={sum(self.requests.values())}, spans={len(self.spans)})"
+
+    def add_span(self, kind, seconds):
+        """
+        Counts one span.
+
+        :param kind: Kind of work, e.g. "db" (str).
+        :param seconds: Duration of the span (float).
+        """
+        with self._lock:
+            counts = self.spans[kind]
+            counts[0] += 1
+            counts[1] += seconds
+
+    def add_request(self, endpoint, method, status, seconds):
+        """
+        Counts one request.
+
+        :param endpoint: Flask endpoint, e.g. "games.wordle" (str).
+        :param method: HTTP method (str).
+        :param status: Response status code (int).
+        :param seconds: Duration of the request (float).
+        """
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            # Buckets, then count & sum
+            histogram = self.durations[endpoint]
+            for number, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram[number] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    def to_prometheus(self):
+        """
+        Returns all metrics in the Prometheus text exposition format (str).
+        """
+        with self._lock:
+            requests = sorted(self.requests.items())
+            durations = sorted((endpoint, list(histogram))
+                               for endpoint, histogram in self.durations.items())
+            spans = sorted((kind, list(counts)) for kind, counts in self.spans.items())
+
+        lines = ["# HELP flasktest_requests_total Requests handled.",
+                 "# TYPE flasktest_requests_total counter"]
+        for (endpoint, method, status), count in requests:
+            lines.append(f'flasktest_requests_total{{endpoint="{endpoint}",method="{method}",'
+                         f'status="{status}"}} {count}')
+
+        lines += ["# HELP flasktest_request_duration_seconds Time spent handling requests.",
+                  "# TYPE flasktest_request_duration_seconds histogram"]
+        for endpoint, histogram in durations:
+            for bound, count in zip(DURATION_BUCKETS, histogram):
+                lines.append(f'flasktest_request_duration_seconds_bucket{{endpoint="{endpoint}",'
+                             f'le="{bound}"}} {count}')
+            lines.append(f'flasktest_request_duration_seconds_bucket{{endpoint="{endpoint}",'
+                         f'le="+Inf"}} {histogram[-2]}')
+            lines.append(f'flasktest_request_duration_seconds_count{{endpoint="{endpoint}"}}'
+                         f' {histogram[-2]}')
+            lines.append(f'flasktest_request_duration_seconds_sum{{endpoint="{endpoint}"}}'
+                         f' {histogram[-1]:.6f}')
+
+        lines += ["# HELP flasktest_span_calls_total Spans recorded, by kind of work.",
+                  "# TYPE flasktest_span_calls_total counter"]
+        lines += [f'flasktest_span_calls_total{{kind="{kind}"}} {count}'
+                  for kind, (count, _) in spans]
+        lines += ["# HELP flasktest_span_seconds_total Time spent in spans, by kind of work.",
+                  "# TYPE flasktest_span_seconds_total counter"]
+        lines += [f'flasktest_span_seconds_total{{kind="{kind}"}} {seconds:.6f}'
+                  for kind, (_, seconds) in spans]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def cache_metrics():
+    """
+    Returns the stats() of the caches in the Prometheus text exposition format (str).
+    """
+    stats = sorted((namespace, cache.stats()) for namespace, cache in list(caches.items()))
+    lines = []
+    for name, kind, key, text in (
+            ("flasktest_cache_hits_total", "counter", "hits", "Cache lookups that found a value."),
+            ("flasktest_cache_misses_total", "counter", "misses", "Cache lookups without a value."),
+            ("flasktest_cache_entries", "gauge", "size", "Entries stored in a cache.")):
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{cache="{namespace}"}} {values[key]}' for namespace, values in stats]
+    return "\n".join(lines) + "\n"
+
+
+def record_span(kind, seconds):
+    """
+    Adds a span to the metrics and, on a request thread, to the spans of the request.
+
+    :param kind: Kind of work, e.g. "db" (str).
+    :param seconds: Duration of the span (float).
+    """
+    metrics.add_span(kind, seconds)
+    if has_request_context():
+        spans = g.get("spans")
+        if spans is not None:
+            counts = spans[kind]
+            counts[0] += 1
+            counts[1] += seconds
+
+
+class Span:
+    """
+    Context manager timing one span.
+
+    :param kind: Kind of work, e.g. "render" (str).
+    """
+    __slots__ = ("kind", "start")
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_span(self.kind, time.perf_counter() - self.start)
+        return False
+
+
+class _NoSpan:
+    """
+    Shared context manager of span() while instrumentation is disabled.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(kind):
+    """
+    Times the work inside a with block as a span of the given kind.
+    Kinds used: db, io, render, template, http, hash, cpi.
+
+    :param kind: Kind of work (str).
+
+    :return: Context manager (Span).
+    """
+    if not _enabled:
+        return _NO_SPAN
+    return Span(kind)
+
+
+# ------------------------------------------------------------- #
+# ------------------------- Hooks ----------------------------- #
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Queries on one connection run one after another
+    conn.info["query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("query_start", None)
+    if start is not None:
+        record_span("db", time.perf_counter() - start)
+
+
+def _before_render_template(sender, template, context, **extra):
+    g.template_start = time.perf_counter()
+
+
+def _template_rendered(sender, template, context, **extra):
+    start = g.pop("template_start", None)
+    if start is not None:
+        record_span("template", time.perf_counter() - start)
+
+
+def server_timing(spans, total):
+    """
+    Formats the spans of a request as a Server-Timing header value.
+
+    :param spans: Count & seconds per kind (dict).
+    :param total: Duration of the request in seconds (float).
+
+    :return: Header value, e.g. 'db;dur=1.2;desc="3x", total;dur=9.8' (str).
+    """
+    entries = [f'{kind};dur={seconds * 1000:.2f};desc="{count}x"'
+               for kind, (count, seconds) in sorted(spans.items())]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+# ------------------------------------------------------------- #
+# ------------------------ Profiling -------------------------- #
+def matches_token(given, token):
+    """
+    Compares a token from a request header with a configured one in constant time.
+
+    :param given: Value sent by the client, may be None (str).
+    :param token: Configured value, None disables it (str).
+
+    :return: Whether both are set and equal (bool).
+    """
+    return bool(given and token) and hmac.compare_digest(given.encode(), token.encode())
+
+
+def wanted_profiler(app):
+    """
+    Returns the profiler the current request asks for, "cprofile", "pyinstrument"
+    or None. The X-Profile header counts in debug mode or with a valid
+    X-Profile-Token, other requests are sampled at PROFILE_SAMPLE_RATE.
+    """
+    wanted = request.headers.get("X-Profile", "").lower()
+    if wanted and not app.debug \
+            and not matches_token(request.headers.get("X-Profile-Token"),
+                                  app.config["PROFILE_TOKEN"]):
+        wanted = ""
+    if not wanted and random.random() < app.config["PROFILE_SAMPLE_RATE"]:
+        wanted = "cprofile"
+    if wanted in ("1", "true", "cprofile"):
+        return "cprofile"
+    if wanted == "pyinstrument":
+        # Falls back to cProfile when pyinstrument is not installed
+        return "pyinstrument" if pyinstrument is not None else "cprofile"
+    return None
+
+
+def start_profiler(kind):
+    """
+    Starts a profiler on the request thread.
+
+    :param kind: "cprofile" or "pyinstrument" (str).
+
+    :return: Running profiler or None if another profiler is already running.
+    """
+    if kind == "pyinstrument":
+        profiler = pyinstrument.Profiler(async_mode="disabled")
+        profiler.start()
+        return profiler
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active, e.g. a debugger
+        return None
+    return profiler
+
+
+def save_profile(profiler, folder, max_files):
+    """
+    Stops a profiler and saves its report, then removes the oldest reports
+    above max_files.
+    cProfile reports are saved as .txt, the top functions by cumulative time.
+    pyinstrument reports are saved as .html.
+
+    :param profiler: Profiler from start_profiler().
+    :param folder: Folder to save the report in (str).
+    :param max_files: Number of reports kept in folder (int).
+
+    :return: File name of the report (str).
+    """
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'none'}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(folder, exist_ok=True)
+
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        buffer = io.StringIO()
+        buffer.write(f"{request.method} {request.full_path}\n")
+        pstats.Stats(profiler, stream=buffer).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        report, file_name = buffer.getvalue(), f"{name}.txt"
+    else:
+        profiler.stop()
+        report, file_name = profiler.output_html(), f"{name}.html"
+
+    with open(os.path.join(folder, file_name), "w", encoding="utf-8") as file:
+        file.write(report)
+    remove_old_profiles(folder, max_files)
+    return file_name
+
+
+def remove_old_profiles(folder, max_files):
+    """
+    Removes the oldest reports in folder above max_files, names start with their time.
+
+    :param folder: Folder of the reports (str).
+    :param max_files: Number of reports kept (int).
+    """
+    reports = sorted(name for name in os.listdir(folder) if name.endswith((".txt", ".html")))
+    for name in reports[:max(len(reports) - max_files, 0)]:
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            # Removed by another worker
+            pass
+
+
+# ------------------------------------------------------------- #
+# -------------------------- App ------------------------------ #
+def metrics_view():
+    """
+    Serves the metrics of this process in Prometheus text format, to local
+    clients or, when METRICS_TOKEN is set, to clients sending it.
+    """
+    token = current_app.config["METRICS_TOKEN"]
+    if token:
+        given = request.headers.get("Authorization", "")
+        if not matches_token(given.removeprefix("Bearer "), token):
+            abort(403)
+    elif request.remote_addr not in LOCAL_ADDRESSES:
+        abort(403)
+
+    return Response(metrics.to_prometheus() + cache_metrics(),
+                    mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    """
+    Enables instrumentation and registers its hooks and the /metrics endpoint on the app.
+
+    :param app: The Flask app.
+    """
+    global _enabled
+    _enabled = True
+
+    # Listeners are global, an earlier app may have added them already
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+
+    @app.before_request
+    def start_request():
+        g.spans = defaultdict(lambda: [0, 0.0])
+        g.profiler = None
+        kind = wanted_profiler(app)
+        if kind is not None:
+            g.profiler = start_profiler(kind)
+        # Started last, so starting the profiler is not counted
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def finish_request(response):
+        start = g.get("request_start")
+        if start is None:
+            # An earlier before_request returned a response
+            return response
+
+        total = time.perf_counter() - start
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            response.headers["X-Profile-File"] = save_profile(
+                profiler, app.config["PROFILE_PATH"], app.config["PROFILE_MAX_FILES"])
+        response.headers["Server-Timing"] = server_timing(g.spans, total)
+        metrics.add_request(request.endpoint or "none", request.method,
+                            response.status_code, total)
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exception):
+        # Only still running when the request failed before after_request
+        profiler = g.pop("profiler", None)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        elif profiler is not None:
+            profiler.stop()
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
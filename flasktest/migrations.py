@@ -0,0 +1,207 @@
+"""
+Lightweight database migrations, run on every start.
+
+db.create_all() only creates missing tables. upgrade_database() also adds
+the columns and indexes that were added to existing models since the
+database was created, moves data out of tables and columns that were
+replaced and fills new tables derived from existing data. Every step checks
+what is missing first, so running it again does nothing. One-time steps are
+recorded in MigrationData.
+"""
+from collections import defaultdict
+
+from sqlalchemy import func, insert, inspect, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from flasktest import db
+from flasktest.models import User, WordleGameData, WordleGuessData, NumbersData, \
+    NumbersLeaderboardData, ImageEditData, MigrationData
+from flasktest.games.games_settings import NUMBERS_LEADERBOARD_SIZE, NUMBERS_GLOBAL_BOARD
+from flasktest.games.wordle_engine import wordle_engine, encode_feedback
+
+
+# Name of the leaderboard backfill in MigrationData
+BACKFILL_NUMBERS_LEADERBOARD = "backfill_numbers_leaderboard"
+
+
+def add_missing_columns(engine, metadata):
+    """
+    Adds model columns that are missing from existing tables.
+    Only nullable columns can be added, their value is NULL for existing rows.
+
+    :param engine: SQLAlchemy engine of the database.
+    :param metadata: SQLAlchemy metadata of the models.
+
+    :return: Added columns as "table.column" (list str).
+    """
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name},"
+                                       f" migrate this table by hand")
+
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE "{table.name}"'
+                                        f' ADD COLUMN "{column.name}" {column_type}'))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def add_missing_indexes(engine, metadata):
+    """
+    Creates model indexes that are missing from existing tables.
+
+    :param engine: SQLAlchemy engine of the database.
+    :param metadata: SQLAlchemy metadata of the models.
+
+    :return: Names of the created indexes (list str).
+    """
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=connection)
+                    added.append(index.name)
+    return added
+
+
+def migrate_wordle_data(engine):
+    """
+    Moves the games of the old wordle_data table, one row with five guess
+    columns per game, to WordleGameData and WordleGuessData and points every
+    User to their last game. The old table is dropped in the same transaction.
+
+    :param engine: SQLAlchemy engine of the database.
+
+    :return: Number of moved games (int).
+    """
+    if not inspect(engine).has_table("wordle_data"):
+        return 0
+
+    with engine.begin() as connection:
+        rows = connection.execute(text("SELECT * FROM wordle_data ORDER BY id")).mappings().all()
+        games, guesses = [], []
+        for row in rows:
+            if row["user_id"] is None or row["wordle_answer"] is None:
+                # Not playable
+                continue
+            games.append({
+                "id": row["id"],
+                "user_id": row["user_id"],
+                "wordle_answer": row["wordle_answer"],
+                "wordle_round": row["wordle_round"] or 0,
+                "wordle_win_round": row["wordle_win_round"],
+                "wordle_game_state": row["wordle_game_state"] or "busy",
+            })
+            for number in range(1, 6):
+                guess = row[f"wordle_guess{number}"]
+                if guess is None:
+                    break
+                # Games from before feedback was stored have no feedback columns
+                feedback = row.get(f"wordle_feedback{number}") \
+                    or encode_feedback(wordle_engine.score(guess, row["wordle_answer"]))
+                guesses.append({"game_id": row["id"], "wordle_number": number,
+                                "wordle_guess": guess, "wordle_feedback": feedback})
+
+        if games:
+            connection.execute(insert(WordleGameData.__table__), games)
+        if guesses:
+            connection.execute(insert(WordleGuessData.__table__), guesses)
+
+        # The last game of a User is the one being played
+        last_game = select(func.max(WordleGameData.id)) \
+            .where(WordleGameData.user_id == User.id) \
+            .scalar_subquery()
+        connection.execute(update(User)
+                           .where(User.wordle_game_id.is_(None))
+                           .values(wordle_game_id=last_game))
+        connection.execute(text("DROP TABLE wordle_data"))
+    return len(games)
+
+
+def migrate_image_adjustments(engine):
+    """
+    Moves the settings of the old image_adjust_data.adjustments column, the
+    last adjustment of an upload, to a first ImageEditData edit and empties
+    the column.
+
+    :param engine: SQLAlchemy engine of the database.
+
+    :return: Number of moved adjustments (int).
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table("image_adjust_data") or "adjustments" not in \
+            {column["name"] for column in inspector.get_columns("image_adjust_data")}:
+        return 0
+
+    with engine.begin() as connection:
+        rows = connection.execute(text("SELECT id, adjustments FROM image_adjust_data"
+                                       " WHERE adjustments IS NOT NULL")).mappings().all()
+        edited = set(connection.execute(select(ImageEditData.image_id).distinct()).scalars())
+        edits = [{"image_id": row["id"], "edit_number": 1, "edit_settings": row["adjustments"]}
+                 for row in rows if row["id"] not in edited]
+        if edits:
+            connection.execute(insert(ImageEditData.__table__), edits)
+        connection.execute(text("UPDATE image_adjust_data SET adjustments = NULL"))
+    return len(edits)
+
+
+def backfill_numbers_leaderboard():
+    """
+    Fills the Numbers leaderboards from the games finished before they were kept.
+    Runs once, databases that already have leaderboard entries are only marked done.
+
+    :return: Number of added leaderboard entries (int).
+    """
+    if MigrationData.query.filter_by(name=BACKFILL_NUMBERS_LEADERBOARD).first() is not None:
+        return 0
+
+    # The marker is committed with the entries, a worker starting at the same
+    # time fails on its unique name and leaves the backfill to the other one
+    db.session.add(MigrationData(name=BACKFILL_NUMBERS_LEADERBOARD))
+    entries = []
+    try:
+        if NumbersLeaderboardData.query.first() is None:
+            finished = NumbersData.query.filter(NumbersData.numbers_time > 0) \
+                .order_by(NumbersData.numbers_time).all()
+            boards = defaultdict(list)
+            for game in finished:
+                for board in (NUMBERS_GLOBAL_BOARD, game.user_id):
+                    if len(boards[board]) < NUMBERS_LEADERBOARD_SIZE:
+                        boards[board].append(NumbersLeaderboardData(
+                            board=board, game_id=game.id, user_id=game.user_id,
+                            numbers_time=game.numbers_time))
+            entries = [entry for board in boards.values() for entry in board]
+            db.session.add_all(entries)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return 0
+    return len(entries)
+
+
+def upgrade_database():
+    """
+    Brings an existing database up to date with the models.
+    Must be called inside an app context, after db.create_all().
+    """
+    add_missing_columns(db.engine, db.metadata)
+    add_missing_indexes(db.engine, db.metadata)
+    migrate_wordle_data(db.engine)
+    migrate_image_adjustments(db.engine)
+    backfill_numbers_leaderboard()
@@ -20,10 +20,13 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(75), unique=False, nullable=False)
     password = db.Column(db.String(75), unique=False, nullable=False)
     reset_key = db.Column(db.String(75), unique=False, nullable=True)
+    # Game the User is playing, not a foreign key as WordleGameData refers to User
+    wordle_game_id = db.Column(db.Integer, unique=False, nullable=True)
     # relationships
     countries_games = db.relationship("CountriesData", backref="countries_user")
-    wordle_games = db.relationship("WordleData", backref="wordle_user")
+    wordle_games = db.relationship("WordleGameData", backref="wordle_user")
     numbers_games = db.relationship("NumbersData", backref="numbers_user")
+    cpi_graphs = db.relationship("CPIGraphData", backref="cpi_graph_user")
     image_adjust_data = db.relationship("ImageAdjustData", backref="image_adjust_user")
 
     def __repr__(self):
@@ -51,25 +54,47 @@ class CountriesData(db.Model):
 
 # --------------------------------------------------------------- #
 # ------------------------- WORDLE ------------------------------ #
-class WordleData(db.Model):
+class WordleGameData(db.Model):
     """
-    Stores Users info on Wordle game.
+    Stores a Users Wordle game, its guesses are stored in WordleGuessData.
+    The game a User is playing is pointed to by User.wordle_game_id.
     """
+    __table_args__ = (
+        db.Index("ix_wordle_game_data_user_id_id", "user_id", db.text("id DESC")),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))  # relationship
-    wordle_answer = db.Column(db.String(100), unique=False, nullable=True)
-    wordle_round = db.Column(db.Integer, unique=False, nullable=True)
-    wordle_guess1 = db.Column(db.String(100), unique=False, nullable=True)
-    wordle_guess2 = db.Column(db.String(100), unique=False, nullable=True)
-    wordle_guess3 = db.Column(db.String(100), unique=False, nullable=True)
-    wordle_guess4 = db.Column(db.String(100), unique=False, nullable=True)
-    wordle_guess5 = db.Column(db.String(100), unique=False, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)  # relationship
+    wordle_answer = db.Column(db.String(5), unique=False, nullable=False)
+    wordle_round = db.Column(db.Integer, unique=False, nullable=False)
     wordle_win_round = db.Column(db.Integer, unique=False, nullable=True)
-    wordle_game_state = db.Column(db.String(10), unique=False, nullable=True)
+    wordle_game_state = db.Column(db.String(10), unique=False, nullable=False)
+    # relationships
+    wordle_guesses = db.relationship("WordleGuessData", backref="wordle_game",
+                                     order_by="WordleGuessData.wordle_number")
+
+    def __repr__(self):
+        return f"WordleGameData(id={self.id}, user_id={self.user_id}," \
+               f" game_state={self.wordle_game_state}, answer={self.wordle_answer})"
+
+
+class WordleGuessData(db.Model):
+    """
+    Stores a guess of a Wordle game and its feedback.
+    """
+    __table_args__ = (
+        db.UniqueConstraint("game_id", "wordle_number"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey("wordle_game_data.id"),
+                        nullable=False)  # relationship
+    wordle_number = db.Column(db.Integer, unique=False, nullable=False)  # 1 - 5
+    wordle_guess = db.Column(db.String(5), unique=False, nullable=False)
+    # feedback from encode_feedback(), e.g. "02100"
+    wordle_feedback = db.Column(db.String(5), unique=False, nullable=False)
 
     def __repr__(self):
-        return f"WordleData(id={self.id}, user_id={self.user_id}," \
-               f"game_state={self.wordle_game_state}, answer={self.wordle_answer})"
+        return f"WordleGuessData(id={self.id}, game_id={self.game_id}," \
+               f" number={self.wordle_number}, guess={self.wordle_guess})"
 
 
 # ---------------------------------------------------------------- #
@@ -78,6 +103,9 @@ class NumbersData(db.Model):
     """
     Stores Users info on Numbers game.
     """
+    __table_args__ = (
+        db.Index("ix_numbers_data_user_id_id", "user_id", db.text("id DESC")),
+    )
     id = db.Column(db.Integer(), primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))  # relationship
     numbers_start = db.Column(db.Float(), nullable=False)
@@ -89,35 +117,115 @@ class NumbersData(db.Model):
                f" numbers_time={self.numbers_time})"
 
 
+class NumbersLeaderboardData(db.Model):
+    """
+    Stores the best Numbers times, NUMBERS_LEADERBOARD_SIZE rows per board.
+    Board NUMBERS_GLOBAL_BOARD holds the best times of all Users, every other
+    board holds the best times of the User with that id.
+    """
+    __table_args__ = (
+        db.Index("ix_numbers_leaderboard_data_board_time", "board", "numbers_time"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    board = db.Column(db.Integer, unique=False, nullable=False)
+    game_id = db.Column(db.Integer, db.ForeignKey("numbers_data.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    numbers_time = db.Column(db.Float(), unique=False, nullable=False)
+
+    def __repr__(self):
+        return f"NumbersLeaderboardData(id={self.id}, board={self.board}," \
+               f" user_id={self.user_id}, numbers_time={self.numbers_time})"
+
+
 # ------------------------------------------------------------ #
 # ------------------------- API ------------------------------ #
-class APIData(db.Model):
+class RateLimitData(db.Model):
+    """
+    Stores a token bucket per rate limited API key, shared by all workers.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(50), unique=True, nullable=False)
+    tokens = db.Column(db.Float, unique=False, nullable=False)
+    updated = db.Column(db.Float, unique=False, nullable=False)
+
+    def __repr__(self):
+        return f"RateLimitData(id={self.id}, key={self.key}," \
+               f" tokens={self.tokens}, updated={self.updated})"
+
+
+class CPIGraphData(db.Model):
     """
-    Stores pubg api availability.
+    Stores the latest CPI searches per user, at most CPI_MAX_GRAPHS rows each.
+    The rows are reused as a ring buffer: a new search overwrites the oldest row.
     """
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "slot"),
+        db.Index("ix_cpi_graph_data_user_id_created", "user_id", "created"),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    api_name = db.Column(db.String(30), unique=True, nullable=False)
-    last_used = db.Column(db.Integer, unique=False, nullable=True)
-    timer = db.Column(db.Integer, unique=False, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)  # relationship
+    slot = db.Column(db.Integer, unique=False, nullable=False)
+    categories = db.Column(db.String, unique=False, nullable=False)  # comma separated
+    start_year = db.Column(db.Integer, unique=False, nullable=False)
+    stop_year = db.Column(db.Integer, unique=False, nullable=False)
+    created = db.Column(db.Float, unique=False, nullable=False)
+    image = db.Column(db.String(200), unique=False, nullable=True)  # rendered graph, if any
 
     def __repr__(self):
-        return f"APIData(id={self.id}, api_name={self.api_name}," \
-               f" last_used={self.last_used}, timer={self.timer})"
+        return f"CPIGraphData(id={self.id}, user_id={self.user_id}, slot={self.slot}," \
+               f" categories={self.categories}, start_year={self.start_year}," \
+               f" stop_year={self.stop_year}, image={self.image})"
 
 
 # --------------------------------------------------------------------- #
 # ------------------------- IMAGE ADJUST ------------------------------ #
 class ImageAdjustData(db.Model):
     """
-    Stores Users info on image adjust.
+    Stores Users info on image adjust, the edits of the upload are stored in ImageEditData.
     """
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))  # relationship
     filetype = db.Column(db.String, unique=False, nullable=True)
     old_image = db.Column(db.String, unique=False, nullable=True)
     new_image = db.Column(db.String, unique=False, nullable=True)
+    # relationships
+    image_edits = db.relationship("ImageEditData", backref="image_adjust",
+                                  order_by="ImageEditData.edit_number",
+                                  cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"ImageAdjustData(id={self.id}, user_id={self.user_id}," \
                f" filetype={self.filetype}, old_image={self.old_image}," \
                f"new_image={self.new_image})"
+
+
+class ImageEditData(db.Model):
+    """
+    Stores an edit of an upload, the edits are applied to old_image in order.
+    """
+    __table_args__ = (
+        db.UniqueConstraint("image_id", "edit_number"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey("image_adjust_data.id"),
+                         nullable=False)  # relationship
+    edit_number = db.Column(db.Integer, unique=False, nullable=False)  # 1 - n
+    # settings of tools.utils.adjust_img() as json, e.g. '{"lighting": 40, "rotation": 1}'
+    edit_settings = db.Column(db.String, unique=False, nullable=False)
+
+    def __repr__(self):
+        return f"ImageEditData(id={self.id}, image_id={self.image_id}," \
+               f" number={self.edit_number}, settings={self.edit_settings})"
+
+
+# ----------------------------------------------------------------- #
+# ------------------------- MIGRATIONS ---------------------------- #
+class MigrationData(db.Model):
+    """
+    Stores the one-time migrations of migrations.py that already ran.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f"MigrationData(id={self.id}, name={self.name})"
@@ -45,3 +45,11 @@ class ImageAdjustForm(FlaskForm):
                                                      message="Min value: 0, max value: 100")])
 
     submit = SubmitField(label="Go!")
+
+
+class ImageEditForm(FlaskForm):
+    """
+    Removes the last or all edits of the ImageAdjust tool
+    """
+    undo = SubmitField(label="Undo")
+    reset = SubmitField(label="Reset")
@@ -0,0 +1,185 @@
+"""
+uint8 adjustment engine of the image-adjust tool.
+
+Lighting and the RGB settings change every value of a channel the same
+way, so per channel they are combined into one 256 entry lookup table
+(LUT). The tables are computed in float64 like the settings always were,
+only the 256 results are rounded down to uint8. The image itself stays
+uint8: the tables are applied in place, a block of rows at a time, so the
+only temporaries are the index arrays of one block.
+
+Mirrors and rotations are composed into one transform and applied with a
+single PIL transpose, so any sequence of them costs one pass over the pixels.
+
+A stack of edits fuses into one set of tables and one transform.
+"""
+import numpy as np
+
+
+# Rows of the image looked up at once, bounds the temporary index arrays
+LUT_BLOCK_ROWS = 64
+VALUES = np.arange(256, dtype=np.float64)
+IDENTITY_LUT = np.arange(256, dtype=np.uint8)
+
+
+def adjust_values(values, setting):
+    """
+    Applies one setting of the tool to channel values.
+
+    :param values: Channel values 0-255 (ndarray float64).
+    :param setting: Below 1 scales the values down by that factor, above 1
+     moves them setting % closer to 255, None or 1 keeps them (float).
+
+    :return: Adjusted values (ndarray float64).
+    """
+    if setting is None or setting == 1:
+        return values
+    if setting < 1:
+        return values * setting
+    return (((255 - values) / 100) * setting) + values
+
+
+def to_lut(values):
+    """
+    Rounds adjusted values down to a lookup table (ndarray uint8).
+    """
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def channel_luts(lighting=None, rgb=None):
+    """
+    Combines the lighting and RGB settings into one lookup table per channel.
+    Lighting is applied first, then the setting of the channel.
+
+    :param lighting: Lighting setting, see adjust_values() (float).
+    :param rgb: Red, green & blue settings, see adjust_values() (list float).
+
+    :return: Red, green & blue lookup tables of 256 entries (tuple ndarray uint8).
+    """
+    lit = adjust_values(VALUES, lighting)
+    if rgb is None:
+        rgb = (None, None, None)
+    return tuple(to_lut(adjust_values(lit, setting)) for setting in rgb)
+
+
+def apply_luts(img_array, luts, block_rows=LUT_BLOCK_ROWS):
+    """
+    Replaces every channel value of an image by its entry in the lookup table
+    of the channel, in place.
+
+    :param img_array: Writable image, shape (height, width, 3) (ndarray uint8).
+    :param luts: One lookup table per channel from channel_luts() (tuple ndarray uint8).
+    :param block_rows: Rows looked up at once (int).
+
+    :return: img_array (ndarray uint8).
+    """
+    channels = [(number, lut) for number, lut in enumerate(luts)
+                if not np.array_equal(lut, IDENTITY_LUT)]
+    for start in range(0, img_array.shape[0], block_rows):
+        block = img_array[start:start + block_rows]
+        for number, lut in channels:
+            np.take(lut, block[..., number], out=block[..., number])
+    return img_array
+
+
+# ------------------------------------------------------------------ #
+# ------------------------- GEOMETRY ------------------------------- #
+# Every mix of mirrors and quarter turns is one of the 8 symmetries of a
+# rectangle: a transform (turns, mirrored) mirrors left-right when mirrored
+# and then turns the image turns times 90 degrees counterclockwise.
+IDENTITY_TRANSFORM = (0, False)
+# PIL Image.Transpose method per transform
+TRANSPOSE_METHODS = {
+    (1, False): "ROTATE_90",
+    (2, False): "ROTATE_180",
+    (3, False): "ROTATE_270",
+    (0, True): "FLIP_LEFT_RIGHT",
+    (1, True): "TRANSPOSE",
+    (2, True): "FLIP_TOP_BOTTOM",
+    (3, True): "TRANSVERSE",
+}
+
+
+def rotation_transform(turns):
+    """
+    Returns the transform of turns quarter turns counterclockwise (tuple).
+    """
+    return turns % 4, False
+
+
+def mirror_transform(axis):
+    """
+    Returns the transform of np.flip(img_array, axis=axis) (tuple).
+
+    :param axis: 0 flips top-bottom, 1 flips left-right (int).
+    """
+    # Top-bottom is left-right and half a turn
+    return (2, True) if axis == 0 else (0, True)
+
+
+def compose_transforms(*transforms):
+    """
+    Composes transforms into one.
+
+    :param transforms: Transforms in the order they are applied (tuple).
+
+    :return: Transform with the same result (tuple).
+    """
+    turns, mirrored = IDENTITY_TRANSFORM
+    for next_turns, next_mirrored in transforms:
+        # A mirror after turns reverses their direction
+        turns = (next_turns + (-turns if next_mirrored else turns)) % 4
+        mirrored = mirrored != next_mirrored
+    return turns, mirrored
+
+
+def transform_image(image, transform):
+    """
+    Applies a transform to a PIL image in one pass.
+
+    :param image: Image (PIL Image).
+    :param transform: Transform from compose_transforms() (tuple).
+
+    :return: Transformed image, the same image for the identity (PIL Image).
+    """
+    from PIL import Image
+
+    if transform == IDENTITY_TRANSFORM:
+        return image
+    return image.transpose(getattr(Image.Transpose, TRANSPOSE_METHODS[transform]))
+
+
+# ------------------------------------------------------------------ #
+# ------------------------- EDIT STACK ----------------------------- #
+# An edit is an operation (luts, transform). Lookups change values and
+# transforms move pixels, so they commute: any stack of edits fuses into a
+# single operation, lookup tables first, that renders in one pass.
+IDENTITY_OPERATION = ((IDENTITY_LUT,) * 3, IDENTITY_TRANSFORM)
+
+
+def compose_luts(first, second):
+    """
+    Composes the lookup tables of two edits per channel, the result equals
+    applying first and then second to a uint8 image.
+
+    :param first: Lookup table per channel (tuple ndarray uint8).
+    :param second: Lookup table per channel (tuple ndarray uint8).
+
+    :return: Lookup table per channel (tuple ndarray uint8).
+    """
+    return tuple(np.take(second_lut, first_lut) for first_lut, second_lut in zip(first, second))
+
+
+def fuse_operations(operations):
+    """
+    Fuses edits into one operation.
+
+    :param operations: (luts, transform) per edit in the order they are applied (iterable).
+
+    :return: Operation with the same result (tuple).
+    """
+    luts, transform = IDENTITY_OPERATION
+    for next_luts, next_transform in operations:
+        luts = compose_luts(luts, next_luts)
+        transform = compose_transforms(transform, next_transform)
+    return luts, transform
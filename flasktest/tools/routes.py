@@ -1,14 +1,16 @@
+import io
+import json
 import math
-import numpy as np
-from PIL import Image
 
-from flask import render_template, request, session, flash, redirect, url_for, Blueprint
+from flask import render_template, request, session, flash, redirect, url_for, Blueprint, \
+    send_file
 from flask_login import login_required
 
 from flasktest import db
-from flasktest.models import ImageAdjustData
-from flasktest.tools.forms import ImageAdjustForm
-from flasktest.tools.utils import convert_img, allowed_extension
+from flasktest.models import ImageAdjustData, ImageEditData
+from flasktest.tools.forms import ImageAdjustForm, ImageEditForm
+from flasktest.tools.utils import convert_img, save_new_image, save_preview, clear_cache, \
+    clear_edits, allowed_extension, lighting_setting
 from flasktest.tools.tools_settings import IMAGE_ADJUST_IMAGE_PATH, \
     IMAGE_ADJUST_IMAGE_PATH_RELATIVE
 
@@ -45,8 +47,14 @@ def image_adjust():
         # File accepted
         file_extension = file.filename.split(".")[1]
         filename = f"{session['id']}-upload"
-        file.save(f"{IMAGE_ADJUST_IMAGE_PATH}{filename}.{file_extension}")
         image_path = f"{IMAGE_ADJUST_IMAGE_PATH_RELATIVE}{filename}.{file_extension}"
+        # Decoded copies of the previous upload are no longer valid
+        clear_cache(image_path)
+        file.save(f"{IMAGE_ADJUST_IMAGE_PATH}{filename}.{file_extension}")
+
+        # Decode once, adjustments run on the downscaled preview and the
+        # download on the decoded copy
+        save_preview(file_extension, image_path)
 
         image_info = ImageAdjustData.query.filter_by(user_id=session["id"]).first()
         if not image_info:
@@ -56,7 +64,10 @@ def image_adjust():
             db.session.add(new_image_info)
             db.session.commit()
         else:
+            image_info.filetype = file_extension
             image_info.old_image = image_path
+            image_info.new_image = None
+            image_info.image_edits = []
             db.session.commit()
 
         return redirect(url_for("tools.image_adjust_tool"))
@@ -70,20 +81,17 @@ def image_adjust():
 @tools.route("/tools/image-adjust-tool", methods=["GET", "POST"])
 @login_required
 def image_adjust_tool():
-    # TODO: Add download button for user to download adjusted image
-    # TODO: Let user upload new image from adjust page or appy changes to recently adjusted image(s)
+    # TODO: Let user upload new image from adjust page
     image_adjust_form = ImageAdjustForm()
+    image_edit_form = ImageEditForm()
     lighting = None
     mirror = None
     rotation = 0
     rgb = None
 
     if image_adjust_form.validate_on_submit():
-        if image_adjust_form.lighting.data == "Darker":
-            lighting = image_adjust_form.lighting_value.data / 101
-
-        if image_adjust_form.lighting.data == "Lighter":
-            lighting = image_adjust_form.lighting_value.data
+        lighting = lighting_setting(image_adjust_form.lighting.data,
+                                    image_adjust_form.lighting_value.data)
 
         if image_adjust_form.mirror.data == "Horizontally":
             mirror = 0
@@ -109,35 +117,83 @@ def image_adjust_tool():
             rgb = [1, 1, rbg_value / 100]
 
         image_data = ImageAdjustData.query.filter_by(user_id=session["id"]).first()
-
-        adjusted_image = convert_img(filetype=image_data.filetype,
-                                     filename=image_data.old_image,
-                                     lighting=lighting,
-                                     mirror=mirror,
-                                     rotation=rotation,
-                                     rgb=rgb)
-        adjusted_image = np.array(adjusted_image, "uint8")
-        adjusted_filename = f"{session['id']}-new"
-        new_file_name = f"{IMAGE_ADJUST_IMAGE_PATH_RELATIVE}{adjusted_filename}.png"
-        img = Image.fromarray(adjusted_image, "RGB")
-        img.save(f"{IMAGE_ADJUST_IMAGE_PATH}{adjusted_filename}.png")
-        image_data.new_image = new_file_name
+        if not image_data:
+            flash("Upload an image first.")
+            return redirect(url_for("tools.image_adjust"))
+
+        # Add an edit on top of the previous ones, the defaults add none
+        if lighting is not None or mirror is not None or rotation or rgb is not None:
+            settings = {"lighting": lighting, "mirror": mirror, "rotation": rotation, "rgb": rgb}
+            image_data.image_edits.append(
+                ImageEditData(edit_number=len(image_data.image_edits) + 1,
+                              edit_settings=json.dumps(settings)))
+        # Only the new edit is applied, to the cached preview of the previous ones
+        image_data.new_image = save_new_image(image_data)
         db.session.commit()
 
         return render_template("tools/image_adjust-tool.html",
                                old_image=image_data.old_image,
-                               new_image=new_file_name,
+                               new_image=image_data.new_image,
+                               edits=len(image_data.image_edits),
                                image_adjust_form=image_adjust_form,
+                               image_edit_form=image_edit_form,
                                page="image_adjust_tool")
 
     image_data = ImageAdjustData.query.filter_by(user_id=session["id"]).first()
 
     if not image_data:
         # Tries to access page without uploading an image first
-        old_image = f"{IMAGE_ADJUST_IMAGE_PATH_RELATIVE}old_image.png"
-    else:
-        old_image = image_data.old_image
+        return render_template("tools/image_adjust-tool.html",
+                               old_image=f"{IMAGE_ADJUST_IMAGE_PATH_RELATIVE}old_image.png",
+                               image_adjust_form=image_adjust_form,
+                               page="image_adjust_tool")
+
     return render_template("tools/image_adjust-tool.html",
-                           old_image=old_image,
+                           old_image=image_data.old_image,
+                           new_image=image_data.new_image if image_data.image_edits else None,
+                           edits=len(image_data.image_edits),
                            image_adjust_form=image_adjust_form,
+                           image_edit_form=image_edit_form,
                            page="image_adjust_tool")
+
+
+# --------------------------------------------------------------------- #
+# ------------------------- IMAGE EDITS ------------------------------- #
+@tools.route("/tools/image-adjust-edits", methods=["POST"])
+@login_required
+def image_adjust_edits():
+    image_edit_form = ImageEditForm()
+    image_data = ImageAdjustData.query.filter_by(user_id=session["id"]).first()
+
+    if image_data and image_data.image_edits and image_edit_form.validate_on_submit():
+        if image_edit_form.reset.data:
+            image_data.image_edits = []
+        else:
+            image_data.image_edits.pop()
+        # Cached previews may include removed edits
+        clear_edits(image_data.old_image)
+        image_data.new_image = save_new_image(image_data)
+        db.session.commit()
+
+    return redirect(url_for("tools.image_adjust_tool"))
+
+
+# --------------------------------------------------------------------- #
+# ------------------------ IMAGE DOWNLOAD ----------------------------- #
+@tools.route("/tools/image-adjust-download")
+@login_required
+def image_adjust_download():
+    image_data = ImageAdjustData.query.filter_by(user_id=session["id"]).first()
+    if not image_data or not image_data.image_edits:
+        flash("Adjust an image first.")
+        return redirect(url_for("tools.image_adjust_tool"))
+
+    # Apply the edits of the preview to the upload in full resolution, in one pass
+    img = convert_img(filetype=image_data.filetype,
+                      filename=image_data.old_image,
+                      edits=[json.loads(edit.edit_settings) for edit in image_data.image_edits])
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    buffer.seek(0)
+    return send_file(buffer, mimetype="image/png", as_attachment=True,
+                     download_name="adjusted_image.png")
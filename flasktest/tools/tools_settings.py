@@ -8,3 +8,6 @@ IMAGE_ADJUST_IMAGE_PATH_RELATIVE = "../static/images/tools/image_adjust/"
 ALLOWED_EXTENSIONS = {
     "png", "svg"
 }
+# Longest side in pixels of the preview that interactive adjustments run on,
+# the full resolution image is only adjusted for the download
+IMAGE_ADJUST_PREVIEW_SIZE = 800
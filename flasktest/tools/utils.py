@@ -1,10 +1,23 @@
 import numpy as np
 
-import cairosvg
+import glob
 import io
-from PIL import Image
+import json
+import os
+import uuid
 
-from flasktest.tools.tools_settings import ALLOWED_EXTENSIONS, IMAGE_ADJUST_IMAGE_PATH
+from flasktest.tools.image_engine import apply_luts, channel_luts, compose_transforms, \
+    fuse_operations, mirror_transform, rotation_transform, transform_image
+from flasktest.tools.tools_settings import ALLOWED_EXTENSIONS, IMAGE_ADJUST_IMAGE_PATH, \
+    IMAGE_ADJUST_IMAGE_PATH_RELATIVE, IMAGE_ADJUST_PREVIEW_SIZE
+
+
+def import_image_dependencies():
+    """
+    Imports cairosvg and PIL, which are otherwise imported by the first image adjustment.
+    """
+    import cairosvg  # noqa: F401
+    import PIL.Image  # noqa: F401
 
 
 # --------------------------------------------------------------------- #
@@ -15,87 +28,284 @@ def allowed_extension(filename):
 
 
 def svg_to_array(filename):
-    """Load an SVG file and return image in Numpy array"""
-    # Make memory buffer
-    mem = io.BytesIO()
+    """
+    Rasterizes an SVG file with cairosvg.
+
+    :param filename: Path to the file (str).
+
+    :return: Image, shape (height, width, 3) (ndarray uint8).
+    """
+    import cairosvg
+    from PIL import Image
+
     # Convert SVG to PNG in memory
+    mem = io.BytesIO()
     cairosvg.svg2png(url=filename, write_to=mem)
-    # Convert PNG to Numpy array
-    return np.array(Image.open(mem))
+    with Image.open(mem) as image:
+        return np.array(image.convert("RGB"))
+
+
+def load_img(filetype, filename):
+    """
+    Loads an SVG or PNG file as a writable RGB image.
 
+    :param filetype: "svg" or "png" (str).
+    :param filename: Path to the file (str).
 
-def convert_img(filetype, filename, lighting, mirror, rotation, rgb):
+    :return: Image, shape (height, width, 3) (ndarray uint8).
     """
-    Load an SVG or PNG file, adjust with params and return image in Numpy array.
-    filetype(str) "svg" or "png"
-    filename(str)
-    lighting(int) (0.01 - 0.99) or 1 or (2 - 99)
+    from PIL import Image
+
+    if filetype == "svg":
+        return svg_to_array(filename)
+
+    with Image.open(filename) as image:
+        return np.array(image.convert("RGB"))
+
+
+def upload_path(filename):
+    """
+    Returns the path on disk of an upload from its path relative to the page (str).
+    """
+    return f"{IMAGE_ADJUST_IMAGE_PATH}{filename.split('/')[-1]}"
+
+
+def cache_path(filename, kind):
+    """
+    Returns the path of a decoded copy of an upload (str).
+
+    :param filename: Path of the upload as stored in ImageAdjustData (str).
+    :param kind: "decoded" for the full resolution, "preview" for the preview,
+     "edits{n}" for the preview after n edits (str).
+    """
+    stem = filename.split("/")[-1].rsplit(".", 1)[0]
+    return f"{IMAGE_ADJUST_IMAGE_PATH}{stem}-{kind}.npy"
+
+
+def save_array(path, img_array):
+    """
+    Saves an image as a .npy file, other requests never see a partial file.
+    """
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "wb") as file:
+        np.save(file, img_array, allow_pickle=False)
+    os.replace(temp_path, path)
+
+
+def clear_cache(filename):
+    """
+    Removes the decoded copies of an upload, before a new upload replaces it.
+
+    :param filename: Path of the upload as stored in ImageAdjustData (str).
+    """
+    for kind in ("decoded", "preview"):
+        try:
+            os.remove(cache_path(filename, kind))
+        except FileNotFoundError:
+            pass
+    clear_edits(filename)
+
+
+def load_decoded(filetype, filename):
+    """
+    Loads an upload in full resolution from its decoded copy, decoding (and
+    rasterizing SVGs) only on first use. The copy is memory-mapped copy-on-write:
+    the result is writable, changes stay in memory and never reach the file.
+
+    :param filetype: "svg" or "png" (str).
+    :param filename: Path of the upload as stored in ImageAdjustData (str).
+
+    :return: Image, shape (height, width, 3) (ndarray uint8).
+    """
+    path = cache_path(filename, "decoded")
+    try:
+        return np.load(path, mmap_mode="c")
+    except (OSError, ValueError):
+        pass
+
+    img_array = load_img(filetype, upload_path(filename))
+    save_array(path, img_array)
+    return img_array
+
+
+def save_preview(filetype, filename, size=IMAGE_ADJUST_PREVIEW_SIZE):
+    """
+    Saves an upload downscaled to at most size pixels wide and high as a
+    .npy file, which loads without decoding.
+
+    :param filetype: "svg" or "png" (str).
+    :param filename: Path of the upload as stored in ImageAdjustData (str).
+    :param size: Longest side of the preview in pixels (int).
+
+    :return: The preview, shape (height, width, 3) (ndarray uint8).
+    """
+    from PIL import Image
+
+    image = Image.fromarray(load_decoded(filetype, filename), "RGB")
+    image.thumbnail((size, size))
+    img_array = np.asarray(image).copy()
+    save_array(cache_path(filename, "preview"), img_array)
+    return img_array
+
+
+def load_preview(filetype, filename):
+    """
+    Loads the preview of an upload as a writable RGB image, saves it first
+    for uploads from before previews existed.
+
+    :param filetype: "svg" or "png" (str).
+    :param filename: Path of the upload as stored in ImageAdjustData (str).
+
+    :return: Image, shape (height, width, 3) (ndarray uint8).
+    """
+    try:
+        return np.load(cache_path(filename, "preview"))
+    except (OSError, ValueError):
+        return save_preview(filetype, filename)
+
+
+def lighting_setting(lighting, value):
+    """
+    Turns the lighting choice of ImageAdjustForm into the lighting of an edit.
+    Darker scales the values down by value %, lighter moves them value %
+    closer to 255.
+
+    :param lighting: "Darker", "Lighter" or None (str).
+    :param value: Percentage 0-100 (int).
+
+    :return: Lighting setting, see adjust_values(), None for no change (float).
+    """
+    if not value:
+        return None
+    if lighting == "Darker":
+        return 1 - value / 100
+    if lighting == "Lighter":
+        return value
+    return None
+
+
+def edit_operation(lighting=None, mirror=None, rotation=0, rgb=None):
+    """
+    Turns the settings of an edit into an image_engine operation: one lookup
+    table per channel for lighting and RGB, one transform for mirror and rotation.
+    lighting(float) (0 - 0.99) or 1 or (2 - 100), see lighting_setting()
     mirror(int) 0 for horizontal or 1 for vertical
     rotation(int) 1 2 3
     rgb(list; int or None) (0.01 - 0.99) or 1 or (2 - 99) or None
     """
+    # Mirror over horizontal or vertical, then rotate left
+    transforms = [rotation_transform(rotation)]
+    if mirror is not None:
+        transforms.insert(0, mirror_transform(mirror))
+    return channel_luts(lighting, rgb), compose_transforms(*transforms)
+
+
+def apply_operation(img_array, operation):
+    """
+    Renders an operation of edit_operation() or fuse_operations() in one pass.
+
+    :param img_array: Writable image, adjusted in place (ndarray uint8).
+    :param operation: Lookup tables and transform (tuple).
+
+    :return: Adjusted image (PIL Image).
+    """
+    from PIL import Image
+
     # TODO: Add 4th array to allow for transparency.
     # TODO: Changes must not apply to transparent or white parts
-    filename = f"{IMAGE_ADJUST_IMAGE_PATH}{filename.split('/')[-1]}"
-    # Make memory buffer
-    mem = io.BytesIO()
+    luts, transform = operation
+    # Lighting and RGB colors, uint8 lookups without float copies of the image
+    apply_luts(img_array, luts)
+    return transform_image(Image.fromarray(img_array, "RGB"), transform)
 
-    if filetype == "svg":
-        # Convert SVG to PNG in memory
-        cairosvg.svg2png(url=filename, write_to=mem)
-        # Convert PNG to Numpy array
-        img_array = np.array(Image.open(mem))
 
-    if filetype == "png":
-        img_array = np.asarray(Image.open(filename).convert('RGB'))
+def adjust_img(img_array, **settings):
+    """
+    Adjusts an image with the settings of one edit, see edit_operation().
 
-    if lighting is not None:
-        if lighting < 1:
-            # Make darker
-            # Do not darken if white (all values under 3)
-            img_array = img_array * lighting if 3 < img_array.all() else img_array
+    :return: Adjusted image (PIL Image).
+    """
+    return apply_operation(img_array, edit_operation(**settings))
 
-        if lighting > 1:
-            # Make lighter
-            img_array = (((255 - img_array) / 100) * lighting) + img_array
 
-    if mirror is not None:
-        if mirror == 0 or 1:
-            # mirror over horizontal or vertical
-            img_array = np.flip(img_array, axis=mirror)
-
-    # Adjust rotation
-    if rotation != 0:
-        for i in range(rotation):
-            img_array = np.rot90(img_array)
-
-    # Adjust RGB colors individually
-    if rgb is not None or 0:
-        red_array = img_array[:, :, 0]
-        green_array = img_array[:, :, 1]
-        blue_array = img_array[:, :, 2]
-
-        # Red
-        if rgb[0] < 1:
-            # Subtract red
-            red_array = red_array * rgb[0]
-        if rgb[0] > 1:
-            # Add red
-            red_array = (((255 - red_array) / 100) * rgb[0]) + red_array
-
-        # Green
-        if rgb[1] < 1:
-            green_array = green_array * rgb[1]
-        if rgb[1] > 1:
-            green_array = (((255 - green_array) / 100) * rgb[1]) + green_array
-
-        # Blue
-        if rgb[2] < 1:
-            blue_array = blue_array * rgb[2]
-        if rgb[2] > 1:
-            blue_array = (((255 - blue_array) / 100) * rgb[2]) + blue_array
-
-        # Re-stack
-        img_array = np.stack([red_array, green_array, blue_array], axis=2)
+def clear_edits(filename):
+    """
+    Removes the cached results of convert_preview(), after edits were removed.
 
-    return img_array
+    :param filename: Path of the upload as stored in ImageAdjustData (str).
+    """
+    for path in glob.glob(cache_path(filename, "edits*")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def convert_preview(filetype, filename, edits):
+    """
+    Renders a stack of edits on the preview of an upload. The result is cached
+    per number of edits, so adding an edit only applies that edit to the
+    cached result of the previous ones. Call clear_edits() when edits are removed.
+
+    :param filetype: "svg" or "png" (str).
+    :param filename: Path of the upload as stored in ImageAdjustData (str).
+    :param edits: Settings of edit_operation() per edit, in order (list dict).
+
+    :return: Adjusted preview (PIL Image).
+    """
+    from PIL import Image
+
+    if not edits:
+        return Image.fromarray(load_preview(filetype, filename), "RGB")
+
+    path = cache_path(filename, f"edits{len(edits)}")
+    try:
+        return Image.fromarray(np.load(path), "RGB")
+    except (OSError, ValueError):
+        pass
+
+    try:
+        img_array = np.load(cache_path(filename, f"edits{len(edits) - 1}"))
+        operation = edit_operation(**edits[-1])
+    except (OSError, ValueError):
+        img_array = load_preview(filetype, filename)
+        operation = fuse_operations(edit_operation(**edit) for edit in edits)
+
+    image = apply_operation(img_array, operation)
+    clear_edits(filename)
+    save_array(path, np.asarray(image))
+    return image
+
+
+def convert_img(filetype, filename, edits):
+    """
+    Renders a stack of edits on an upload in full resolution, from its
+    decoded copy, for the download. The edits are fused into one operation.
+
+    :param filetype: "svg" or "png" (str).
+    :param filename: Path of the upload as stored in ImageAdjustData (str).
+    :param edits: Settings of edit_operation() per edit, in order (list dict).
+
+    :return: Adjusted image (PIL Image).
+    """
+    operation = fuse_operations(edit_operation(**edit) for edit in edits)
+    return apply_operation(load_decoded(filetype, filename), operation)
+
+
+def save_new_image(image_data):
+    """
+    Renders the edits of an upload on its preview and saves the PNG shown on the page.
+
+    :param image_data: Upload of a User (ImageAdjustData).
+
+    :return: Path of the PNG relative to the page, None without edits (str).
+    """
+    if not image_data.image_edits:
+        return None
+
+    edits = [json.loads(edit.edit_settings) for edit in image_data.image_edits]
+    img = convert_preview(image_data.filetype, image_data.old_image, edits)
+    adjusted_filename = f"{image_data.user_id}-new"
+    # Replaced by the next edit, fast compression over small files
+    img.save(f"{IMAGE_ADJUST_IMAGE_PATH}{adjusted_filename}.png", compress_level=1)
+    return f"{IMAGE_ADJUST_IMAGE_PATH_RELATIVE}{adjusted_filename}.png"
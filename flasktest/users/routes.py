@@ -1,17 +1,14 @@
 from flask import Blueprint
 
-import math
-import time
-
 from flask import render_template, redirect, url_for, request, flash, session
 from flask_login import login_user, login_required, logout_user
 
-from flasktest import db, bcrypt, GMAIL_EMAIL, HOTMAIL_EMAIL
-from flasktest.models import User, APIData
+from flasktest import bcrypt, GMAIL_EMAIL, HOTMAIL_EMAIL
+from flasktest.models import User
+from flasktest.instrumentation import span
 from flasktest.users.forms import RegisterForm, LoginForm, EmailForm, ResetForm
 from flasktest.users.utils import send_reset_password_mail, add_new_user, do_passwords_match, \
     change_password
-from flasktest.apis.utils import remove_pubg_images
 
 
 users = Blueprint("users", __name__)
@@ -24,13 +21,10 @@ def index():
 
 @users.route("/fresh")
 def base():
-    """Create two dummy accounts and API defaults after db reset"""
+    """Create two dummy accounts after db reset"""
     hashed_password = bcrypt.generate_password_hash("test1234")
     add_new_user(email=HOTMAIL_EMAIL, username="test1", hashed_password=hashed_password)
     add_new_user(email=GMAIL_EMAIL, username="test2", hashed_password=hashed_password)
-    pubg_api = APIData(api_name="pubg", last_used=math.floor(time.time()), timer=60)
-    db.session.add(pubg_api)
-    db.session.commit()
     return redirect(url_for("users.login"))
 
 
@@ -65,7 +59,8 @@ def login():
 @users.route("/logout")
 @login_required
 def logout():
-    remove_pubg_images(session["id"])
+    # Graphs are shared and evicted by the chart store, only forget the reference
+    session.pop("pubg_charts", None)
     logout_user()
     return redirect(url_for("users.login"))
 
@@ -79,7 +74,8 @@ def register():
                                register_form=register_form)
 
     if register_form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(register_form.password.data)
+        with span("hash"):
+            hashed_password = bcrypt.generate_password_hash(register_form.password.data)
         add_new_user(
             email=register_form.email.data,
             username=register_form.username.data,
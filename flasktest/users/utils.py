@@ -4,6 +4,7 @@ from flask_mail import Message
 
 from flasktest import mail, bcrypt, db, GMAIL_EMAIL
 from flasktest.models import User, CountriesData
+from flasktest.instrumentation import span
 
 
 def add_new_user(email, username, hashed_password, reset_key=000000):
@@ -45,8 +46,9 @@ def do_passwords_match(user_password, form_password):
     Compares users password (str) with LoginForm password (str).
     Returns True or False.
     """
-    if bcrypt.check_password_hash(user_password, form_password):
-        return True
+    with span("hash"):
+        if bcrypt.check_password_hash(user_password, form_password):
+            return True
     return False
 
 
@@ -0,0 +1,13 @@
+"""
+Gives the environment variables that flasktest reads on import a dummy
+value, values that are already set are kept.
+"""
+import os
+
+
+ENVIRONMENT = {"FLASK_KEY": "test", "PUBG_API_KEY": "test", "GMAIL_EMAIL": "test@example.com",
+               "GMAIL_PASS": "test", "GMAIL_SMTP": "localhost",
+               "HOTMAIL_EMAIL": "test2@example.com"}
+
+for key, value in ENVIRONMENT.items():
+    os.environ.setdefault(key, value)
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from flasktest.tools.image_engine import IDENTITY_LUT, channel_luts
+from flasktest.tools.utils import lighting_setting
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0, IDENTITY_LUT),
+    (50, (np.arange(256) * 0.5).astype(np.uint8)),
+    (100, np.zeros(256, dtype=np.uint8)),
+])
+def test_darker(value, expected):
+    lighting = lighting_setting("Darker", value)
+    for lut in channel_luts(lighting):
+        np.testing.assert_array_equal(lut, expected)
+
+
+def test_zero_percent_adds_no_edit():
+    assert lighting_setting("Darker", 0) is None
+    assert lighting_setting("Lighter", 0) is None
+    assert lighting_setting("None", 50) is None
@@ -0,0 +1,13 @@
+"""
+Entry point for WSGI servers, uses the production config unless FLASK_CONFIG is set.
+
+With a pre-forking server, preload the app so the data loaded by
+create_app() is shared by all workers, e.g.:
+    gunicorn --preload --workers 4 wsgi:app
+"""
+import os
+
+from flasktest import create_app
+
+
+app = create_app(os.environ.get("FLASK_CONFIG", "production"))